@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Motivos de rechazo (etiqueta de la métrica y campo de la respuesta)
+SHED_QUEUE_FULL = 'queue_full'
+SHED_CLIENT_LIMIT = 'client_limit'
+SHED_OVERLOAD = 'overload'
+SHED_TIMEOUT = 'timeout'
+SHED_REASONS = (SHED_QUEUE_FULL, SHED_CLIENT_LIMIT, SHED_OVERLOAD, SHED_TIMEOUT)
+
+
+class AdmissionRejected(Exception):
+    """Solicitud rechazada antes de procesarse; `status` es 429 (el cliente
+    superó su parte de la cola) o 503 (el servidor está saturado)"""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    """Lugar en la cola de un cliente"""
+
+    __slots__ = ('event', 'granted', 'enqueued_at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued_at = time.perf_counter()
+
+
+class AdmissionController:
+    """Límite de solicitudes en curso con cola acotada y reparto justo
+
+    Hasta `max_in_flight` solicitudes se procesan a la vez; las demás
+    esperan en una cola por cliente y, al liberarse un lugar, se atiende a
+    los clientes por turnos (round-robin), así que quien sube cien fotos
+    no deja esperando a quien sube una. Se rechaza de inmediato cuando la
+    cola está llena (503), cuando el cliente ya tiene `max_queue_per_client`
+    solicitudes esperando (429) o cuando la espera estimada supera
+    `max_queue_wait` (503); lo que igual espera más que eso se descarta
+    (503). Cada rechazo sugiere un Retry-After según lo que tardaría en
+    vaciarse la cola.
+
+    Como la espera ocurre antes de leer el cuerpo, las solicitudes en cola
+    no ocupan memoria con la imagen subida.
+    """
+
+    def __init__(self, max_in_flight=16, max_queue=64, max_queue_per_client=16,
+                 max_queue_wait=2.0):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.max_queue_per_client = max(1, int(max_queue_per_client))
+        self.max_queue_wait = max_queue_wait
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        # Cola de cada cliente y turno de los clientes con solicitudes esperando
+        self._clients = {}
+        self._rotation = deque()
+        # Tiempo medio de servicio (media móvil) para estimar la espera
+        self._service_seconds = None
+
+        self._admitted = 0
+        self._shed = dict.fromkeys(SHED_REASONS, 0)
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._max_queue_depth = 0
+
+    def _estimated_wait(self, position):
+        """Segundos hasta que se libere el lugar número `position` de la cola"""
+        if self._service_seconds is None:
+            return 0.0
+        return self._service_seconds * math.ceil(position / self.max_in_flight)
+
+    def _reject(self, reason, status, position=None):
+        self._shed[reason] += 1
+        position = self._queued + 1 if position is None else position
+        retry_after = max(1, math.ceil(self._estimated_wait(position)))
+        return AdmissionRejected(reason, status, retry_after)
+
+    def acquire(self, client_id):
+        """Ocupar un lugar o esperar turno; lanza AdmissionRejected si no hay"""
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._queued:
+                self._in_flight += 1
+                self._admitted += 1
+                return
+            if self._queued >= self.max_queue:
+                raise self._reject(SHED_QUEUE_FULL, 503)
+            client_queue = self._clients.get(client_id)
+            if client_queue is not None and len(client_queue) >= self.max_queue_per_client:
+                raise self._reject(SHED_CLIENT_LIMIT, 429, len(client_queue) + 1)
+            if self._estimated_wait(self._queued + 1) > self.max_queue_wait:
+                raise self._reject(SHED_OVERLOAD, 503)
+
+            ticket = _Ticket()
+            if client_queue is None:
+                client_queue = self._clients[client_id] = deque()
+                self._rotation.append(client_id)
+            client_queue.append(ticket)
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+
+        ticket.event.wait(self.max_queue_wait)
+        with self._lock:
+            waited = time.perf_counter() - ticket.enqueued_at
+            if not ticket.granted:
+                # Se agotó la espera: salir de la cola sin haber ocupado lugar
+                client_queue = self._clients[client_id]
+                client_queue.remove(ticket)
+                self._queued -= 1
+                if not client_queue:
+                    del self._clients[client_id]
+                    self._rotation.remove(client_id)
+                raise self._reject(SHED_TIMEOUT, 503)
+            self._admitted += 1
+            self._total_wait += waited
+            self._max_wait_seen = max(self._max_wait_seen, waited)
+
+    def release(self, service_seconds=None):
+        """Liberar el lugar; si hay cola, pasa directo al siguiente cliente"""
+        with self._lock:
+            if service_seconds is not None:
+                self._service_seconds = service_seconds if self._service_seconds is None \
+                    else 0.9 * self._service_seconds + 0.1 * service_seconds
+            if not self._rotation:
+                self._in_flight -= 1
+                return
+            client_id = self._rotation.popleft()
+            client_queue = self._clients[client_id]
+            ticket = client_queue.popleft()
+            if client_queue:
+                self._rotation.append(client_id)
+            else:
+                del self._clients[client_id]
+            self._queued -= 1
+            ticket.granted = True
+            ticket.event.set()
+
+    @contextmanager
+    def admit(self, client_id):
+        """Bloque protegido: espera turno al entrar y libera al salir"""
+        self.acquire(client_id)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def queue_depth(self):
+        with self._lock:
+            return self._queued
+
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def shed_counts(self):
+        with self._lock:
+            return dict(self._shed)
+
+    def get_stats(self):
+        with self._lock:
+            admitted = self._admitted
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'max_queue_per_client': self.max_queue_per_client,
+                'max_queue_wait_ms': self.max_queue_wait * 1000.0,
+                'in_flight': self._in_flight,
+                'queue_depth': self._queued,
+                'queued_clients': len(self._clients),
+                'max_queue_depth': self._max_queue_depth,
+                'admitted': admitted,
+                'shed': dict(self._shed),
+                'mean_service_ms': (self._service_seconds or 0.0) * 1000.0,
+                'mean_wait_ms': self._total_wait / admitted * 1000.0 if admitted else 0.0,
+                'max_wait_ms_seen': self._max_wait_seen * 1000.0
+            }
@@ -1,67 +1,486 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, g
+import functools
+import io
+import json
 from flask_cors import CORS
+import hmac
 import os
+import threading
+import time
 from werkzeug.utils import secure_filename
 from model_loader import ModelLoader, AgroAssistant
-from prediction import PredictionLogger, ImageValidator
+from model_registry import ModelRegistry, ModelManager, DEFAULT_REGISTRY_DIR
+from prediction import PredictionLogger, AsyncPredictionWriter, ImageValidator
+from batching import BatchScheduler
+from cache import PredictionCache
+from batch_predict import BatchPredictor, iter_uploaded_images, iter_archive_images
+from inference_server import RemoteModelLoader
+from metrics import MetricsRegistry, StageTimer
+from tiling import load_tiles, predict_tiles, AGGREGATIONS
+from embedding_index import EmbeddingIndex, EmbeddingIndexSet, make_case_meta
+from stats import PredictionStats
+from history import PredictionHistory
+from admission import AdmissionController, AdmissionRejected
+from static_assets import StaticAssets
 
-# Configuración de la aplicación
-app = Flask(__name__, static_folder='../frontend',
-            template_folder='../frontend')
+# Referencia para medir el arranque en frío
+PROCESS_STARTED_AT = time.perf_counter()
+
+# Carpeta del frontend (relativa a este archivo, no al directorio de trabajo)
+FRONTEND_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Frontend')
+
+# Configuración de la aplicación; los estáticos los sirve serve_static_files
+app = Flask(__name__, static_folder=None, template_folder=FRONTEND_FOLDER)
 CORS(app)  # Habilitar CORS para todas las rutas
 
 # Configuración
-UPLOAD_FOLDER = '../uploads'
-MODEL_PATH = 'models/mejor_modelo_cultivos.h5'
+# Registro de versiones del modelo; sin versión activa se usa MODEL_PATH
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR)
+# Token para activar versiones y hacer rollback por HTTP (vacío = deshabilitado;
+# la CLI de model_registry.py sigue disponible para administrar localmente)
+MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN', '')
+MODEL_PATH = os.environ.get('MODEL_PATH', 'models/mejor_modelo_cultivos.h5')
+# Backend de inferencia: keras, saved_model o tflite (vacío = deducir de MODEL_PATH)
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', '')
+# Cascada: modelo rápido opcional (vacío = solo el modelo completo) y umbral
+# de confianza bajo el cual se escala al modelo completo
+FAST_MODEL_PATH = os.environ.get('FAST_MODEL_PATH', '')
+FAST_MODEL_BACKEND = os.environ.get('FAST_MODEL_BACKEND', '')
+CASCADE_THRESHOLD = float(os.environ.get('CASCADE_THRESHOLD', AgroAssistant.HIGH_CONFIDENCE))
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
-FRONTEND_FOLDER = '../frontend'
+# Frontend compilado (nombres con hash + .gz/.br) y caché de respuestas de
+# la API que casi no cambian (/api/classes)
+STATIC_BUILD_DIR = os.environ.get('STATIC_BUILD_DIR', 'static_build')
+API_CACHE_MAX_AGE = int(os.environ.get('API_CACHE_MAX_AGE', 60))
+
+# Micro-batching: tamaño máximo de lote y espera máxima antes de inferir
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 8))
+
+# Control de admisión (por proceso): solicitudes de inferencia procesándose
+# a la vez, cola total, cola por cliente y espera máxima en la cola
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', BATCH_MAX_SIZE))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 64))
+ADMISSION_MAX_QUEUE_PER_CLIENT = int(os.environ.get('ADMISSION_MAX_QUEUE_PER_CLIENT', 8))
+ADMISSION_MAX_QUEUE_WAIT_MS = float(os.environ.get('ADMISSION_MAX_QUEUE_WAIT_MS', 2000))
+# Envíos por lotes simultáneos (cada uno ocupa su lugar mientras dura el flujo)
+ADMISSION_MAX_BATCH_STREAMS = int(os.environ.get('ADMISSION_MAX_BATCH_STREAMS', 2))
+# Cabecera que identifica al cliente detrás de un proxy (vacío = IP de la conexión)
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER', '')
+
+# Predicción por lotes: tamaño de lote fijo y límite total del envío
+PREDICT_BATCH_SIZE = int(os.environ.get('PREDICT_BATCH_SIZE', 32))
+MAX_UPLOAD_SIZE = 16 * 1024 * 1024  # 16MB por imagen en /api/predict
+MAX_BATCH_UPLOAD_SIZE = int(os.environ.get('MAX_BATCH_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+
+# Modo por teselas (/api/predict?mode=tiled): solape entre teselas, máximo
+# de teselas por imagen y tamaño de lote con el que se puntúan
+TILE_OVERLAP = float(os.environ.get('TILE_OVERLAP', 0.25))
+TILE_MAX_TILES = int(os.environ.get('TILE_MAX_TILES', 64))
+TILE_BATCH_SIZE = int(os.environ.get('TILE_BATCH_SIZE', 16))
+
+# Casos parecidos: índices de embeddings en disco (uno por versión del
+# modelo), tamaño a partir del cual se entrena el índice IVF y listas
+# revisadas por consulta
+EMBEDDINGS_ENABLED = os.environ.get('EMBEDDINGS_ENABLED', '1') == '1'
+EMBEDDINGS_DIR = os.environ.get('EMBEDDINGS_DIR', 'embeddings_index')
+SIMILAR_IVF_THRESHOLD = int(os.environ.get('SIMILAR_IVF_THRESHOLD', 20000))
+SIMILAR_NPROBE = int(os.environ.get('SIMILAR_NPROBE', 16))
+SIMILAR_MAX_K = 50
+
+# Caché de predicciones por contenido (vacío = sin capa en disco)
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 24 * 3600))
+CACHE_DIR = os.environ.get('CACHE_DIR', '')
+# Presupuesto de la capa en disco (se desaloja por último acceso al superarlo)
+CACHE_DISK_MAX_BYTES = int(os.environ.get('CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Log de predicciones en segundo plano: tamaño de cola, política con la cola
+# llena (block, drop o spill) y fsync por grupo de escrituras
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_QUEUE_POLICY = os.environ.get('LOG_QUEUE_POLICY', 'block')
+LOG_FSYNC = os.environ.get('LOG_FSYNC', '1') == '1'
+
+# Estadísticas: segundos entre snapshots de los agregados en disco
+STATS_SNAPSHOT_INTERVAL = int(os.environ.get('STATS_SNAPSHOT_INTERVAL', 300))
+
+# Historial paginado (/api/history): filas máximas por página
+HISTORY_MAX_LIMIT = int(os.environ.get('HISTORY_MAX_LIMIT', 500))
+
+# Modo producción: socket del proceso de inferencia compartido (vacío = modelo local)
+INFERENCE_SOCKET = os.environ.get('INFERENCE_SOCKET', '')
+INFERENCE_AUTHKEY = os.environ.get('INFERENCE_AUTHKEY', '')
+
+# Cabecera Server-Timing con los tiempos por etapa de cada solicitud
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+# Carpeta compartida por los workers para combinar sus métricas en /metrics
+# (vacío = métricas solo de este proceso, p. ej. en desarrollo)
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+
+# Calentamiento: lotes ficticios con los tamaños que usará el servidor
+WARMUP_BATCH_SIZES = (1, BATCH_MAX_SIZE, PREDICT_BATCH_SIZE, TILE_BATCH_SIZE)
+# Segundos sugeridos al balanceador mientras el modelo no está listo
+STARTUP_RETRY_AFTER = 5
 
 # Crear directorios necesarios
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs('models', exist_ok=True)
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# El límite global permite envíos por lotes; el resto de rutas se limita en before_request
+app.config['MAX_CONTENT_LENGTH'] = MAX_BATCH_UPLOAD_SIZE
 
 # Inicializar componentes
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR)
 try:
-    model_loader = ModelLoader(MODEL_PATH)
+    static_assets = StaticAssets(FRONTEND_FOLDER, STATIC_BUILD_DIR)
+except Exception as e:
+    # Sin compilación se sirven los archivos tal cual
+    print(f"⚠️ No se pudieron compilar los recursos estáticos: {e}")
+    static_assets = None
+admission_controllers = {
+    'predict': AdmissionController(
+        max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+        max_queue=ADMISSION_MAX_QUEUE,
+        max_queue_per_client=ADMISSION_MAX_QUEUE_PER_CLIENT,
+        max_queue_wait=ADMISSION_MAX_QUEUE_WAIT_MS / 1000.0
+    ),
+    'batch': AdmissionController(
+        max_in_flight=ADMISSION_MAX_BATCH_STREAMS,
+        max_queue=ADMISSION_MAX_BATCH_STREAMS,
+        max_queue_per_client=1,
+        max_queue_wait=ADMISSION_MAX_QUEUE_WAIT_MS / 1000.0
+    )
+}
+try:
+    if INFERENCE_SOCKET:
+        # El proceso de inferencia carga el modelo y agrupa entre workers
+        model_loader = RemoteModelLoader(INFERENCE_SOCKET, INFERENCE_AUTHKEY.encode('utf-8') or None)
+        batch_scheduler = model_loader
+    else:
+        # El modelo se carga en segundo plano (ver start_model_warmup) y
+        # puede reemplazarse en caliente por otra versión del registro
+        model_loader = ModelManager(
+            model_registry,
+            loader_options={'embeddings': EMBEDDINGS_ENABLED},
+            warmup_batch_sizes=WARMUP_BATCH_SIZES,
+            initial_loader=ModelLoader(
+                MODEL_PATH, backend=MODEL_BACKEND or None, autoload=False,
+                fast_model_path=FAST_MODEL_PATH or None,
+                fast_backend=FAST_MODEL_BACKEND or None,
+                cascade_threshold=CASCADE_THRESHOLD,
+                embeddings=EMBEDDINGS_ENABLED
+            )
+        )
+        batch_scheduler = BatchScheduler(
+            model_loader.predict_batch,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS
+        )
     agro_assistant = AgroAssistant()
-    prediction_logger = PredictionLogger()
+    prediction_logger = AsyncPredictionWriter(
+        PredictionLogger(fsync=LOG_FSYNC),
+        max_queue=LOG_QUEUE_SIZE,
+        policy=LOG_QUEUE_POLICY
+    )
+    prediction_stats = PredictionStats(
+        prediction_logger.logger, snapshot_interval=STATS_SNAPSHOT_INTERVAL
+    )
+    prediction_history = PredictionHistory(prediction_logger.logger, agro_assistant=agro_assistant)
+    embedding_indexes = EmbeddingIndexSet(
+        EMBEDDINGS_DIR, ivf_threshold=SIMILAR_IVF_THRESHOLD, nprobe=SIMILAR_NPROBE
+    ) if EMBEDDINGS_ENABLED else None
     image_validator = ImageValidator()
+    prediction_cache = PredictionCache(
+        max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, disk_dir=CACHE_DIR or None,
+        disk_max_bytes=CACHE_DISK_MAX_BYTES
+    )
+    batch_predictor = BatchPredictor(
+        model_loader, agro_assistant, image_validator,
+        prediction_cache=prediction_cache,
+        prediction_logger=prediction_logger,
+        batch_size=PREDICT_BATCH_SIZE,
+        embedding_indexes=embedding_indexes
+    )
     print("🚀 Sistema de cultivos inicializado exitosamente")
 except Exception as e:
     print(f"❌ Error inicializando sistema: {e}")
     model_loader = None
+    batch_scheduler = None
+    prediction_cache = None
+    prediction_logger = None
+    prediction_stats = None
+    prediction_history = None
+    embedding_indexes = None
+    batch_predictor = None
+
+_first_prediction_logged = False
+
+def _load_model_in_background():
+    """Cargar y calentar el modelo sin bloquear el arranque del servidor"""
+    try:
+        model_loader.load_and_warmup(WARMUP_BATCH_SIZES)
+        print(f"⏱️ Modelo listo en {time.perf_counter() - PROCESS_STARTED_AT:.2f} s desde el arranque")
+    except Exception as e:
+        print(f"❌ Error cargando el modelo en segundo plano: {e}")
+
+def start_model_warmup():
+    """Lanzar la carga del modelo en un hilo de fondo"""
+    if isinstance(model_loader, ModelManager):
+        threading.Thread(target=_load_model_in_background, name='model-warmup', daemon=True).start()
+
+def _record_first_prediction():
+    """Registrar el tiempo desde el arranque hasta la primera predicción exitosa"""
+    global _first_prediction_logged
+    if not _first_prediction_logged:
+        _first_prediction_logged = True
+        print(f"⏱️ Primera predicción exitosa a los {time.perf_counter() - PROCESS_STARTED_AT:.2f} s del arranque")
+
+def model_unavailable_response():
+    """Respuesta 503 mientras el modelo arranca, o 500 si falló"""
+    if model_loader is None or model_loader.status == ModelLoader.STATUS_ERROR:
+        return jsonify({'error': 'Modelo no disponible'}), 500
+    response = jsonify({'error': 'Modelo iniciando, intente de nuevo', 'state': model_loader.status})
+    response.headers['Retry-After'] = str(STARTUP_RETRY_AFTER)
+    return response, 503
+
+def client_id():
+    """Identidad del cliente para el reparto justo de la cola"""
+    if ADMISSION_CLIENT_HEADER:
+        value = request.headers.get(ADMISSION_CLIENT_HEADER, '')
+        if value:
+            # X-Forwarded-For: el primer elemento es el cliente original
+            return value.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def admission_rejected_response(e):
+    """429 si el cliente excede su parte de la cola, 503 si el servidor está saturado"""
+    if e.status == 429:
+        message = 'Demasiadas solicitudes en espera de este cliente, intente más tarde'
+    else:
+        message = 'Servidor saturado, intente de nuevo'
+    response = jsonify({'error': message, 'reason': e.reason, 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+def admission_controlled(name):
+    """Pasar la vista por el control de admisión `name` antes de leer el
+    cuerpo; en respuestas en flujo el lugar se libera al terminar el envío"""
+    controller = admission_controllers[name]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                with g.stage_timer.stage('admission'):
+                    controller.acquire(client_id())
+            except AdmissionRejected as e:
+                record_error(f'shed_{e.reason}')
+                return admission_rejected_response(e)
+            started = time.perf_counter()
+
+            def release():
+                controller.release(time.perf_counter() - started)
+
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(release)
+            else:
+                release()
+            return response
+        return wrapper
+    return decorator
+
+start_model_warmup()
+
+# Métricas (formato Prometheus en /metrics), combinadas entre workers
+metrics = MetricsRegistry(METRICS_DIR or None)
+# Lo que viene del proceso de inferencia compartido lo ven igual todos los
+# workers: se toma una vez en lugar de sumarse
+SHARED_METRICS_MODE = 'max' if INFERENCE_SOCKET else None
+REQUESTS_TOTAL = metrics.counter(
+    'agro_requests_total', 'Solicitudes atendidas', ('endpoint', 'status'))
+REQUEST_ERRORS = metrics.counter(
+    'agro_request_errors_total', 'Errores por tipo', ('endpoint', 'type'))
+REQUESTS_IN_FLIGHT = metrics.gauge(
+    'agro_requests_in_flight', 'Solicitudes en curso', ('endpoint',))
+REQUEST_LATENCY = metrics.histogram(
+    'agro_request_duration_seconds', 'Latencia total por endpoint', ('endpoint',))
+STAGE_LATENCY = metrics.histogram(
+    'agro_stage_duration_seconds', 'Latencia por etapa de /api/predict', ('stage',))
+metrics.callback(
+    'agro_batch_queue_depth', 'Imágenes esperando en la cola de micro-batching',
+    lambda: batch_scheduler.get_stats()['queue_depth'] if batch_scheduler else None,
+    multiprocess_mode=SHARED_METRICS_MODE)
+metrics.callback(
+    'agro_cache_lookups_total', 'Consultas a la caché de predicciones por resultado',
+    lambda: [(('hit',), prediction_cache.hits + prediction_cache.disk_hits),
+             (('miss',), prediction_cache.misses)] if prediction_cache else None,
+    ('result',), metric_type='counter')
+
+metrics.callback(
+    'agro_log_queue_depth', 'Predicciones esperando a escribirse en el log',
+    lambda: prediction_logger.queue_depth() if prediction_logger else None)
+metrics.callback(
+    'agro_log_entries_total', 'Entradas del log por resultado',
+    lambda: [((outcome,), prediction_logger.get_stats()[outcome])
+             for outcome in ('written', 'dropped', 'spilled', 'errors')] if prediction_logger else None,
+    ('outcome',), metric_type='counter')
+
+def _cascade_series():
+    stats = model_loader.get_cascade_stats() if model_loader else None
+    if not stats or not stats['enabled']:
+        return None
+    return [((ModelLoader.STAGE_FAST,), stats['images'] - stats['escalated']),
+            ((ModelLoader.STAGE_FULL,), stats['escalated'])]
+
+metrics.callback(
+    'agro_cascade_predictions_total', 'Predicciones de la cascada por etapa que respondió',
+    _cascade_series, ('stage',), metric_type='counter', multiprocess_mode=SHARED_METRICS_MODE)
+metrics.callback(
+    'agro_cascade_latency_saved_ms', 'Latencia media ahorrada por imagen con la cascada',
+    lambda: (model_loader.get_cascade_stats() or {}).get('mean_latency_saved_ms') if model_loader else None,
+    multiprocess_mode=SHARED_METRICS_MODE or 'max')
+
+metrics.callback(
+    'agro_admission_queue_depth', 'Solicitudes esperando turno en el control de admisión',
+    lambda: [((name,), controller.queue_depth()) for name, controller in admission_controllers.items()],
+    ('controller',))
+metrics.callback(
+    'agro_admission_in_flight', 'Solicitudes admitidas en proceso',
+    lambda: [((name,), controller.in_flight()) for name, controller in admission_controllers.items()],
+    ('controller',))
+metrics.callback(
+    'agro_admission_shed_total', 'Solicitudes rechazadas por el control de admisión por motivo',
+    lambda: [((name, reason), count) for name, controller in admission_controllers.items()
+             for reason, count in controller.shed_counts().items()],
+    ('controller', 'reason'), metric_type='counter')
+
+def record_error(error_type):
+    """Contar un error de la solicitud actual por tipo"""
+    REQUEST_ERRORS.labels(request.endpoint, error_type).inc()
+
+@app.before_request
+def start_request_metrics():
+    """Iniciar la medición de la solicitud"""
+    g.request_started = time.perf_counter()
+    g.stage_timer = StageTimer(STAGE_LATENCY)
+    g.in_flight = REQUESTS_IN_FLIGHT.labels(request.endpoint)
+    g.in_flight.inc()
+
+@app.after_request
+def finish_request_metrics(response):
+    """Registrar latencia y estado; opcionalmente agregar Server-Timing"""
+    if 'request_started' in g:
+        elapsed = time.perf_counter() - g.request_started
+        REQUEST_LATENCY.labels(request.endpoint).observe(elapsed)
+        REQUESTS_TOTAL.labels(request.endpoint, response.status_code).inc()
+        g.stage_timer.observe()
+        if SERVER_TIMING and g.stage_timer.timings:
+            response.headers['Server-Timing'] = g.stage_timer.server_timing_header()
+    return response
+
+@app.teardown_request
+def end_request_metrics(exception=None):
+    """Liberar el gauge de solicitudes en curso (también en respuestas en flujo)"""
+    in_flight = g.pop('in_flight', None)
+    if in_flight is not None:
+        in_flight.dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), mimetype=None, content_type=MetricsRegistry.CONTENT_TYPE)
+
+@app.before_request
+def limit_upload_size():
+    """Mantener el límite de 16MB fuera de la ruta de lotes"""
+    if request.endpoint != 'predict_batch' and \
+            request.content_length and request.content_length > MAX_UPLOAD_SIZE:
+        return too_large(None)
 
 @app.route('/')
 def home():
     """Servir la página principal del frontend"""
-    return send_from_directory(FRONTEND_FOLDER, 'index.html')
+    return serve_static_files('index.html')
 
 @app.route('/<path:path>')
 def serve_static_files(path):
-    """Servir archivos estáticos (CSS, JS, imágenes)"""
+    """Servir archivos estáticos (CSS, JS, imágenes) precomprimidos"""
+    if static_assets is not None:
+        if app.debug:
+            # En desarrollo se recompila si cambió algún archivo del frontend
+            static_assets.reload()
+        response = static_assets.response(path, request)
+        if response is not None:
+            return response
     return send_from_directory(FRONTEND_FOLDER, path)
 
+def cacheable(response, max_age=API_CACHE_MAX_AGE):
+    """ETag por contenido y Cache-Control; 304 si el cliente ya tiene la versión"""
+    response.add_etag()
+    if max_age > 0:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Endpoint de verificación de salud"""
-    model_status = 'loaded' if model_loader and model_loader.model else 'error'
+    if model_loader is None or model_loader.status == ModelLoader.STATUS_ERROR:
+        model_status = 'error'
+    else:
+        model_status = 'loaded' if model_loader.is_ready else 'loading'
     return jsonify({
         'status': 'healthy',
+        'state': model_loader.status if model_loader else ModelLoader.STATUS_ERROR,
         'model_status': model_status,
-        'message': 'Sistema operativo'
+        'model_backend': model_loader.backend if model_loader else None,
+        'message': 'Sistema operativo',
+        'batching': batch_scheduler.get_stats() if batch_scheduler else None,
+        'model_version': model_loader.model_version if model_loader else None,
+        'cascade': model_loader.get_cascade_stats() if model_loader else None,
+        'cache': prediction_cache.get_stats() if prediction_cache else None,
+        'admission': {name: controller.get_stats() for name, controller in admission_controllers.items()},
+        'similar': embedding_indexes.get_stats(model_loader.model_version) if embedding_indexes else None,
+        'logging': prediction_logger.get_stats() if prediction_logger else None,
+        'history': prediction_history.get_stats() if prediction_history else None
     })
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Sonda de disponibilidad para el balanceador: 200 solo con el modelo listo"""
+    if model_loader is not None and model_loader.is_ready:
+        return jsonify({'ready': True, 'state': model_loader.status})
+    return model_unavailable_response()
+
 @app.route('/api/predict', methods=['POST'])
+@admission_controlled('predict')
 def predict():
-    """Endpoint principal para predicciones"""
-    if model_loader is None:
-        return jsonify({'error': 'Modelo no disponible'}), 500
+    """Endpoint principal para predicciones
+
+    Con `?mode=tiled` la imagen se analiza por teselas solapadas en lugar de
+    reducirse completa a 224x224 (`aggregate=mean|max` elige cómo se combinan).
+    """
+    if model_loader is None or not model_loader.is_ready:
+        return model_unavailable_response()
+    
+    stage = g.stage_timer.stage
+    tiled = request.args.get('mode') == 'tiled'
+    aggregate = request.args.get('aggregate', 'mean')
+    if tiled and aggregate not in AGGREGATIONS:
+        record_error('invalid_parameter')
+        return jsonify({'error': f"Agregación desconocida: {aggregate}"}), 400
     
     # Verificar que se envió un archivo
-    if 'image' not in request.files:
+    with stage('receive'):
+        has_image = 'image' in request.files
+    if not has_image:
+        record_error('missing_image')
         return jsonify({'error': 'No se proporcionó imagen'}), 400
     
     file = request.files['image']
@@ -69,82 +488,338 @@ def predict():
     # Validar archivo
     is_valid, validation_message = image_validator.validate_image(file)
     if not is_valid:
+        record_error('invalid_image')
         return jsonify({'error': validation_message}), 400
     
     try:
-        # Guardar archivo temporalmente
+        # Leer la imagen en memoria, sin archivos temporales
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        with stage('receive'):
+            image_bytes = file.read()
+        
+        # Reenvíos de la misma foto: responder desde la caché sin decodificar
+        with stage('cache'):
+            model_version = model_loader.model_version
+            cache_key = prediction_cache_key(image_bytes, model_version, tiled, aggregate)
+            cached = prediction_cache.get(cache_key)
+        embedding = None
+        if cached is not None:
+            prediction_result = cached['prediction']
+            recommendation = cached['recommendation']
+            case_id = cached.get('case_id')
+        elif tiled:
+            # Teselas propias en lotes fijos, fuera del micro-batching
+            with stage('decode'):
+                tiles, grid = load_tiles(image_bytes, overlap=TILE_OVERLAP, max_tiles=TILE_MAX_TILES)
+            with stage('inference'):
+                prediction_result = predict_tiles(
+                    model_loader, tiles, grid, batch_size=TILE_BATCH_SIZE, aggregate=aggregate
+                )
+        else:
+            # Realizar predicción (agrupada con otras solicitudes concurrentes)
+            with stage('decode'):
+                processed_image = model_loader.preprocess_image(image_bytes)
+            with stage('inference'):
+                prediction_result = batch_scheduler.submit(processed_image[0])
         
-        # Realizar predicción
-        prediction_result = model_loader.predict(filepath)
+            # El embedding va al índice, no a la respuesta
+            embedding = prediction_result.pop('embedding', None)
         
-        # Obtener recomendación
-        recommendation = agro_assistant.get_recommendation(
-            prediction_result['class'], 
-            prediction_result['confidence']
-        )
+        if cached is None:
+            # Obtener recomendación
+            with stage('recommendation'):
+                recommendation = agro_assistant.get_recommendation(
+                    prediction_result['class'], 
+                    prediction_result['confidence']
+                )
+            # Un cambio de versión entre la consulta y la inferencia cambia la clave
+            if prediction_result['model_version'] != model_version:
+                model_version = prediction_result['model_version']
+                cache_key = prediction_cache_key(image_bytes, model_version, tiled, aggregate)
+            case_id = None
+            if embedding is not None and embedding_indexes is not None:
+                with stage('indexing'):
+                    case_id = embedding_indexes.for_version(model_version).add(
+                        embedding, make_case_meta(filename, prediction_result, model_version)
+                    )
+            prediction_cache.put(cache_key, {
+                'prediction': prediction_result,
+                'recommendation': recommendation,
+                'case_id': case_id
+            })
         
         # Registrar predicción
-        prediction_logger.log_prediction(filename, prediction_result, recommendation)
+        with stage('logging'):
+            prediction_logger.log_prediction(filename, prediction_result, cache_key,
+                                             model_loader.class_names)
+        
+        _record_first_prediction()
         
         # Preparar respuesta
         response = {
             'success': True,
             'prediction': prediction_result,
             'recommendation': recommendation,
-            'filename': filename
+            'filename': filename,
+            'case_id': case_id,
+            'cached': cached is not None
         }
         
         return jsonify(response)
         
     except Exception as e:
+        record_error(type(e).__name__)
         print(f"❌ Error procesando imagen: {e}")
         return jsonify({'error': f'Error procesando imagen: {str(e)}'}), 500
+
+def prediction_cache_key(image_bytes, model_version, tiled=False, aggregate=None):
+    """Clave de caché: contenido de la imagen, versión del modelo y modo"""
+    if tiled:
+        model_version = f"{model_version}:tiled:{aggregate}:{TILE_OVERLAP}:{TILE_MAX_TILES}"
+    return PredictionCache.make_key(image_bytes, model_version)
+
+@app.route('/api/predict/batch', methods=['POST'])
+@admission_controlled('batch')
+def predict_batch():
+    """Predicción de muchas imágenes (multipart 'images' o zip 'archive') en NDJSON"""
+    if batch_predictor is None or not model_loader.is_ready:
+        return model_unavailable_response()
     
-    finally:
-        # Limpiar archivo temporal
+    if 'archive' in request.files:
+        archive = request.files['archive']
+        if not archive.filename or not archive.filename.lower().endswith('.zip'):
+            return jsonify({'error': 'El archivo debe ser .zip'}), 400
+        uploads = detach_uploaded_streams([archive])
+        sources = iter_archive_images(uploads[0][1])
+    elif 'images' in request.files:
+        uploads = detach_uploaded_streams(request.files.getlist('images'))
+        sources = iter_uploaded_images(uploads)
+    else:
+        return jsonify({'error': 'No se proporcionaron imágenes'}), 400
+    
+    def generate():
         try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            for result in batch_predictor.stream(sources):
+                yield json.dumps(result, ensure_ascii=False) + '\n'
         except Exception as e:
-            print(f"⚠️ Error limpiando archivo temporal: {e}")
+            print(f"❌ Error en predicción por lotes: {e}")
+            yield json.dumps({'success': False, 'error': f'Error procesando lote: {str(e)}'}) + '\n'
+        finally:
+            for _, stream in uploads:
+                stream.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def detach_uploaded_streams(files):
+    """Tomar los streams subidos para que Flask no los cierre al terminar la vista"""
+    uploads = []
+    for file in files:
+        uploads.append((file.filename, file.stream))
+        file.stream = io.BytesIO()
+    return uploads
+
+@app.route('/api/similar', methods=['GET', 'POST'])
+@admission_controlled('predict')
+def similar_cases():
+    """Casos anteriores más parecidos a una imagen (POST 'image') o a un caso
+    ya registrado (GET ?case_id=N); filtros opcionales k, class y mode
+
+    Cada versión del modelo tiene su propio índice: los case_id se buscan
+    en el de la versión activa salvo que se indique `model_version`.
+    """
+    if embedding_indexes is None:
+        return jsonify({'error': 'Búsqueda de casos parecidos deshabilitada'}), 404
+    if model_loader is None or not model_loader.is_ready:
+        return model_unavailable_response()
+
+    try:
+        k = min(max(int(request.args.get('k', 5)), 1), SIMILAR_MAX_K)
+        mode = request.args.get('mode', 'auto')
+        if mode not in EmbeddingIndex.MODES:
+            raise ValueError(f"Modo desconocido: {mode}")
+        case_id = request.args.get('case_id', type=int) if request.method == 'GET' else None
+        # Fijar el modelo: la consulta y el índice deben ser de la misma versión
+        loader = model_loader.snapshot() if isinstance(model_loader, ModelManager) else model_loader
+        model_version = request.args.get('model_version') or loader.model_version
+        EmbeddingIndexSet.validate_version(model_version)
+    except ValueError as e:
+        record_error('invalid_parameter')
+        return jsonify({'error': str(e)}), 400
+    if model_version != loader.model_version and not embedding_indexes.exists(model_version):
+        return jsonify({'error': f'No hay casos registrados con la versión {model_version}'}), 404
+    embedding_index = embedding_indexes.for_version(model_version)
+
+    stage = g.stage_timer.stage
+    try:
+        if request.method == 'GET':
+            if case_id is None:
+                return jsonify({'error': 'Falta case_id'}), 400
+            embedding = embedding_index.get_vector(case_id)
+            if embedding is None:
+                return jsonify({'error': 'Caso no encontrado'}), 404
+        else:
+            file = request.files.get('image')
+            is_valid, validation_message = image_validator.validate_image(file)
+            if not is_valid:
+                record_error('invalid_image')
+                return jsonify({'error': validation_message}), 400
+            if model_version != loader.model_version:
+                return jsonify({'error': 'Solo se pueden consultar imágenes con la versión activa'}), 400
+            with stage('decode'):
+                processed_image = loader.preprocess_image(file.read())
+            with stage('inference'):
+                embedding = loader.embed_batch(processed_image)[0]
+
+        with stage('search'):
+            results, used_mode = embedding_index.search(
+                embedding, k=k, class_name=request.args.get('class'),
+                mode=mode, exclude_id=case_id
+            )
+        return jsonify({
+            'success': True,
+            'mode': used_mode,
+            'model_version': model_version,
+            'query_case_id': case_id,
+            'results': results
+        })
+    except Exception as e:
+        record_error(type(e).__name__)
+        print(f"❌ Error buscando casos parecidos: {e}")
+        return jsonify({'error': f'Error buscando casos parecidos: {str(e)}'}), 500
 
 @app.route('/api/classes', methods=['GET'])
 def get_classes():
     """Obtener lista de clases disponibles"""
     if model_loader:
-        return jsonify({
+        return cacheable(jsonify({
             'classes': model_loader.class_names,
-            'count': len(model_loader.class_names)
-        })
+            'count': len(model_loader.class_names),
+            'model_version': model_loader.model_version
+        }))
     else:
         return jsonify({'error': 'Modelo no disponible'}), 500
 
+def admin_authorized():
+    """Verificar el token de administración de modelos; sin token configurado
+    nadie está autorizado (la API escucha en 0.0.0.0 con CORS abierto)"""
+    if not MODEL_ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), MODEL_ADMIN_TOKEN)
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """Versiones registradas y estado del cambio de versión en curso"""
+    if model_loader is None:
+        return jsonify({'error': 'Modelo no disponible'}), 500
+    try:
+        response = {'versions': model_registry.list_versions()}
+        response.update(model_loader.get_swap_status())
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/models/activate', methods=['POST'])
+def activate_model():
+    """Preparar otra versión en segundo plano y cambiar a ella al estar lista
+
+    Responde 202 de inmediato; el avance se consulta en GET /api/models.
+    Mientras tanto la versión actual sigue atendiendo sin interrupción.
+    """
+    if not admin_authorized():
+        return jsonify({'error': 'No autorizado'}), 403
+    if model_loader is None:
+        return jsonify({'error': 'Modelo no disponible'}), 500
+    version = (request.get_json(silent=True) or {}).get('version') or request.form.get('version')
+    if not version:
+        return jsonify({'error': 'Falta la versión'}), 400
+    try:
+        started = model_loader.activate(version)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    response = {'success': True, 'version': version}
+    response.update(model_loader.get_swap_status())
+    return jsonify(response), 202 if started else 200
+
+@app.route('/api/models/rollback', methods=['POST'])
+def rollback_model():
+    """Volver a la versión anterior (inmediato si sigue cargada en memoria)"""
+    if not admin_authorized():
+        return jsonify({'error': 'No autorizado'}), 403
+    if model_loader is None:
+        return jsonify({'error': 'Modelo no disponible'}), 500
+    try:
+        version = model_loader.rollback()
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    response = {'success': True, 'version': version}
+    response.update(model_loader.get_swap_status())
+    return jsonify(response), 200 if response['active'] == version else 202
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
-    """Obtener estadísticas del sistema"""
+    """Obtener estadísticas del sistema
+
+    Parámetros opcionales: from / to (fecha u hora ISO, inclusivos) y
+    class (repetible) para filtrar por clase.
+    """
     try:
-        if os.path.exists('predictions_log.json'):
-            with open('predictions_log.json', 'r') as f:
-                logs = json.load(f)
-            total_predictions = len(logs)
-        else:
-            total_predictions = 0
-        
-        return jsonify({
-            'total_predictions': total_predictions,
-            'model_loaded': model_loader is not None,
+        stats = prediction_stats.query(
+            start=request.args.get('from'),
+            end=request.args.get('to'),
+            class_names=request.args.getlist('class')
+        ) if prediction_stats else {'total_predictions': 0}
+
+        stats.update({
+            'model_loaded': bool(model_loader and model_loader.is_ready),
             'classes_available': len(model_loader.class_names) if model_loader else 0
         })
+        # Cambia con cada predicción: solo revalidación (304 si no hubo nuevas)
+        return cacheable(jsonify(stats), max_age=0)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/uploads/<filename>')
-def uploaded_file(filename):
-    """Servir archivos subidos (para desarrollo)"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """Historial de predicciones, de la más nueva a la más vieja
+
+    Parámetros opcionales: limit, cursor (el next_cursor de la página
+    anterior), class (repetible), min_confidence / max_confidence,
+    from / to (fecha u hora ISO, inclusivos), model_version y
+    probabilities=1 para incluir el vector de probabilidades por clase y
+    las clases más probables (top_k).
+    """
+    if prediction_history is None:
+        return jsonify({'error': 'Historial no disponible'}), 500
+
+    def optional(name, parse):
+        value = request.args.get(name)
+        return parse(value) if value not in (None, '') else None
+
+    try:
+        limit = min(max(optional('limit', int) or 50, 1), HISTORY_MAX_LIMIT)
+        with g.stage_timer.stage('query'):
+            result = prediction_history.query(
+                limit=limit,
+                cursor=optional('cursor', int),
+                class_names=request.args.getlist('class'),
+                min_confidence=optional('min_confidence', float),
+                max_confidence=optional('max_confidence', float),
+                start=request.args.get('from'),
+                end=request.args.get('to'),
+                model_version=request.args.get('model_version'),
+                include_probabilities=request.args.get('probabilities') == '1'
+            )
+    except ValueError as e:
+        record_error('invalid_parameter')
+        return jsonify({'error': f'Parámetro inválido: {e}'}), 400
+    except Exception as e:
+        record_error(type(e).__name__)
+        return jsonify({'error': str(e)}), 500
+    return jsonify(result)
 
 # Manejo de errores
 @app.errorhandler(413)
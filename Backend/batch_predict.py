@@ -0,0 +1,206 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cache import PredictionCache
+from embedding_index import make_case_meta
+
+
+def iter_uploaded_images(uploads):
+    """Fuentes (nombre, lector de bytes) a partir de pares (nombre, stream) multipart
+
+    Un lector de bytes recibe, como `stream.read`, el máximo de bytes a leer.
+    """
+    for filename, stream in uploads:
+        yield filename, stream.read
+
+
+def iter_archive_images(archive_file):
+    """Fuentes (nombre, lector de bytes) a partir de un .zip, miembro a miembro
+
+    El zip no se cierra aquí: los últimos miembros se leen en los hilos de
+    decodificación después de agotar este generador. Quien abrió
+    `archive_file` se encarga de cerrarlo.
+    """
+    archive = zipfile.ZipFile(archive_file)
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        yield info.filename, _ArchiveMemberReader(archive, info)
+
+
+class _ArchiveMemberReader:
+    """Lee un miembro del zip solo cuando se decodifica
+
+    `size` es el tamaño descomprimido que declara el zip: permite rechazar
+    un miembro sin abrirlo. Como la cabecera puede mentir, la lectura se
+    corta igual en el máximo pedido.
+    """
+
+    def __init__(self, archive, info):
+        self.archive = archive
+        self.info = info
+        self.size = info.file_size
+
+    def __call__(self, size=-1):
+        with self.archive.open(self.info) as member:
+            return member.read(size)
+
+
+class BatchPredictor:
+    """Predicción por lotes de muchas imágenes con resultados en flujo
+
+    Las imágenes se leen y decodifican en paralelo de a `batch_size`; mientras
+    el modelo procesa un lote, el siguiente ya se está decodificando. Solo se
+    mantienen en memoria dos lotes, sin importar el tamaño del envío.
+    """
+
+    def __init__(self, model_loader, agro_assistant, image_validator,
+                 prediction_cache=None, prediction_logger=None,
+                 batch_size=32, decode_workers=None, embedding_indexes=None):
+        self.model_loader = model_loader
+        self.agro_assistant = agro_assistant
+        self.image_validator = image_validator
+        self.prediction_cache = prediction_cache
+        self.prediction_logger = prediction_logger
+        self.embedding_indexes = embedding_indexes
+        self.batch_size = max(1, int(batch_size))
+        self.decode_pool = ThreadPoolExecutor(
+            max_workers=decode_workers or min(8, os.cpu_count() or 1),
+            thread_name_prefix='batch-decode'
+        )
+
+    def _load(self, index, name, read_bytes):
+        """Leer, validar y decodificar una imagen; nunca lanza excepciones"""
+        item = {'index': index, 'filename': os.path.basename(name)}
+        is_valid, message = self.image_validator.validate_filename(name)
+        if not is_valid:
+            item['error'] = message
+            return item
+        try:
+            # Nunca más de un byte por encima del límite: un zip que se infla
+            # a gigabytes o una parte enorme no llegan a ocupar memoria
+            limit = self.image_validator.max_file_size
+            declared_size = getattr(read_bytes, 'size', None)
+            if declared_size is not None and declared_size > limit:
+                item['error'] = "Archivo demasiado grande"
+                return item
+            image_bytes = read_bytes(limit + 1)
+            if len(image_bytes) > limit:
+                item['error'] = "Archivo demasiado grande"
+                return item
+
+            if self.prediction_cache is not None:
+                item['cache_version'] = self.model_loader.model_version
+                item['cache_key'] = PredictionCache.make_key(
+                    image_bytes, item['cache_version']
+                )
+                cached = self.prediction_cache.get(item['cache_key'])
+                if cached is not None:
+                    item['result'] = cached
+                    item['cached'] = True
+                    return item
+
+            item['image'] = self.model_loader.preprocess_image(image_bytes)[0]
+        except Exception as e:
+            item['error'] = f'Error procesando imagen: {str(e)}'
+        return item
+
+    def _submit_chunk(self, sources, start_index):
+        """Encolar la decodificación del siguiente bloque de imágenes"""
+        futures = []
+        for offset in range(self.batch_size):
+            try:
+                name, read_bytes = next(sources)
+            except StopIteration:
+                break
+            futures.append(self.decode_pool.submit(
+                self._load, start_index + offset, name, read_bytes
+            ))
+        return futures
+
+    def stream(self, sources):
+        """Generar un resultado por imagen, en orden, a medida que estén listos"""
+        sources = iter(sources)
+        index = 0
+        pending = self._submit_chunk(sources, index)
+        while pending:
+            index += len(pending)
+            items = [future.result() for future in pending]
+            # Decodificar el siguiente bloque mientras se infiere el actual
+            pending = self._submit_chunk(sources, index)
+            yield from self._predict_chunk(items)
+
+    def _predict_chunk(self, items):
+        to_infer = [item for item in items if 'image' in item]
+        if to_infer:
+            try:
+                results = self.model_loader.predict_batch(
+                    np.stack([item.pop('image') for item in to_infer])
+                )
+                case_ids = self._index_embeddings(to_infer, results)
+                for item, prediction_result, case_id in zip(to_infer, results, case_ids):
+                    recommendation = self.agro_assistant.get_recommendation(
+                        prediction_result['class'],
+                        prediction_result['confidence']
+                    )
+                    item['result'] = {
+                        'prediction': prediction_result,
+                        'recommendation': recommendation,
+                        'case_id': case_id
+                    }
+                    # Si la versión cambió entre la consulta y la inferencia, la
+                    # clave calculada ya no corresponde a este resultado
+                    if self.prediction_cache is not None and \
+                            prediction_result.get('model_version') == item['cache_version']:
+                        self.prediction_cache.put(item['cache_key'], item['result'])
+            except Exception as e:
+                for item in to_infer:
+                    item['error'] = f'Error en predicción: {str(e)}'
+
+        for item in items:
+            yield self._to_result(item)
+
+    def _index_embeddings(self, items, results):
+        """Retirar los embeddings de los resultados y agregarlos al índice"""
+        embeddings = [result.pop('embedding', None) for result in results]
+        case_ids = [None] * len(results)
+        positions = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+        if self.embedding_indexes is None or not positions:
+            return case_ids
+        # Todo el lote salió de una misma llamada, es decir, de una misma versión
+        model_version = results[positions[0]]['model_version']
+        ids = self.embedding_indexes.for_version(model_version).add_many([
+            (embeddings[i], make_case_meta(items[i]['filename'], results[i], model_version))
+            for i in positions
+        ])
+        for i, case_id in zip(positions, ids):
+            case_ids[i] = case_id
+        return case_ids
+
+    def _to_result(self, item):
+        if 'error' in item:
+            return {
+                'index': item['index'],
+                'filename': item['filename'],
+                'success': False,
+                'error': item['error']
+            }
+
+        result = item['result']
+        if self.prediction_logger is not None:
+            self.prediction_logger.log_prediction(
+                item['filename'], result['prediction'], item.get('cache_key'),
+                self.model_loader.class_names
+            )
+        return {
+            'index': item['index'],
+            'filename': item['filename'],
+            'success': True,
+            'prediction': result['prediction'],
+            'recommendation': result['recommendation'],
+            'case_id': result.get('case_id'),
+            'cached': item.get('cached', False)
+        }
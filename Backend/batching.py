@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _PendingRequest:
+    """Solicitud individual esperando su turno dentro de un lote"""
+
+    __slots__ = ('image', 'enqueued_at', 'event', 'result', 'error')
+
+    def __init__(self, image):
+        self.image = image
+        self.enqueued_at = time.perf_counter()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchScheduler:
+    """Agrupa predicciones concurrentes en lotes dinámicos (micro-batching)
+
+    Los hilos de Flask llaman a `submit()` con una imagen ya preprocesada;
+    un hilo de fondo reúne solicitudes hasta `max_batch_size` o hasta que
+    la más antigua lleva `max_wait_ms` esperando, ejecuta `infer_fn` una
+    sola vez sobre el lote y devuelve a cada llamador su propio resultado.
+    """
+
+    def __init__(self, infer_fn, max_batch_size=16, max_wait_ms=8, timeout=30.0):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.timeout = timeout
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._stopped = False
+
+        # Métricas para ajustar el tamaño de lote y la espera
+        self._stats_lock = threading.Lock()
+        self._batch_size_counts = {}
+        self._total_batches = 0
+        self._total_requests = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._max_queue_depth = 0
+        self._total_timeouts = 0
+
+    def _ensure_worker(self):
+        """Arrancar el hilo de fondo si todavía no existe"""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run, name='batch-scheduler', daemon=True
+            )
+            self._worker.start()
+
+    def submit(self, image):
+        """Encolar una imagen (H, W, C) y bloquear hasta obtener su resultado"""
+        request = _PendingRequest(image)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError('El planificador de lotes está detenido')
+            self._ensure_worker()
+            self._queue.append(request)
+            depth = len(self._queue)
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+            self._condition.notify()
+
+        if not request.event.wait(self.timeout):
+            with self._condition:
+                # Si sigue en cola, sacarla: nadie espera ya ese resultado. Si
+                # ya está en un lote en curso, solo queda descartar la respuesta
+                try:
+                    self._queue.remove(request)
+                except ValueError:
+                    pass
+            with self._stats_lock:
+                self._total_timeouts += 1
+            raise TimeoutError('Tiempo de espera agotado en la cola de inferencia')
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect_batch(self):
+        """Esperar hasta llenar el lote o agotar la espera máxima"""
+        with self._condition:
+            while True:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if not self._queue:
+                    return []
+
+                deadline = self._queue[0].enqueued_at + self.max_wait
+                while self._queue and len(self._queue) < self.max_batch_size and not self._stopped:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                # Las solicitudes vencidas salen de la cola: puede haber quedado vacía
+                if self._queue:
+                    size = min(len(self._queue), self.max_batch_size)
+                    return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        """Bucle principal del hilo de inferencia"""
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            try:
+                images = np.stack([request.image for request in batch])
+                results = self.infer_fn(images)
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finally:
+                self._record_batch(batch, started)
+                for request in batch:
+                    request.event.set()
+
+    def _record_batch(self, batch, started):
+        """Actualizar estadísticas de lotes y tiempos de espera"""
+        waits = [started - request.enqueued_at for request in batch]
+        with self._stats_lock:
+            size = len(batch)
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._total_batches += 1
+            self._total_requests += size
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+
+    def queue_depth(self):
+        """Número de solicitudes esperando en la cola"""
+        with self._condition:
+            return len(self._queue)
+
+    def get_stats(self):
+        """Estadísticas de la cola para ajustar la configuración"""
+        with self._stats_lock:
+            total_requests = self._total_requests
+            total_batches = self._total_batches
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': self.queue_depth(),
+                'max_queue_depth': self._max_queue_depth,
+                'total_requests': total_requests,
+                'total_timeouts': self._total_timeouts,
+                'total_batches': total_batches,
+                'mean_batch_size': total_requests / total_batches if total_batches else 0.0,
+                'batch_size_distribution': {
+                    str(size): count
+                    for size, count in sorted(self._batch_size_counts.items())
+                },
+                'mean_wait_ms': (self._total_wait / total_requests * 1000.0) if total_requests else 0.0,
+                'max_wait_ms_seen': self._max_wait_seen * 1000.0
+            }
+
+    def stop(self):
+        """Detener el hilo de fondo tras vaciar la cola"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout=self.timeout)
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Caché de resultados direccionada por contenido
+
+    La clave es un hash de los bytes de la imagen más la versión del modelo,
+    así que reenviar la misma foto evita decodificar e inferir de nuevo. La
+    capa en memoria es LRU con TTL y un presupuesto en bytes; opcionalmente
+    se respalda en `disk_dir` para sobrevivir a reinicios.
+
+    La capa en disco también tiene presupuesto (`disk_max_bytes`): un hilo
+    de fondo borra los archivos vencidos cada `disk_sweep_interval` segundos
+    y, si se supera el presupuesto, los de acceso más antiguo hasta bajar al
+    90%. El vencimiento se toma del mtime (momento de escritura) y el último
+    acceso del atime, que se actualiza explícitamente en cada acierto.
+    """
+
+    # Fracción del presupuesto en disco a la que se baja al desalojar
+    DISK_EVICTION_TARGET = 0.9
+    # Temporales de escrituras interrumpidas que se consideran abandonados
+    STALE_TMP_SECONDS = 3600
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=24 * 3600, disk_dir=None,
+                 disk_max_bytes=1024 * 1024 * 1024, disk_sweep_interval=600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_sweep_interval = disk_sweep_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.disk_expired = 0
+
+        # Bytes en disco: estimación entre barridos (otros procesos también escriben)
+        self._disk_bytes = 0
+        self._sweep_requested = threading.Event()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # El primer barrido mide lo que quedó de ejecuciones anteriores
+            self._sweep_requested.set()
+            threading.Thread(target=self._run_disk_sweeper, name='cache-disk-sweeper',
+                             daemon=True).start()
+
+    @staticmethod
+    def make_key(image_bytes, model_version):
+        """Hash de los bytes de la imagen más la versión del modelo"""
+        digest = hashlib.sha256(str(model_version).encode('utf-8'))
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Obtener un resultado en caché o None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        # Promover a memoria conservando el vencimiento original
+        self._memory_put(key, value[1], value[0])
+        return value[1]
+
+    def put(self, key, value):
+        """Guardar un resultado serializable a JSON"""
+        expires_at = time.time() + self.ttl
+        self._memory_put(key, value, expires_at)
+        self._disk_put(key, value, expires_at)
+
+    def _memory_put(self, key, value, expires_at):
+        size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._current_bytes += size
+            while self._current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._current_bytes -= size
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.json')
+
+    def _disk_get(self, key, now):
+        """Leer de la capa en disco; devuelve (expires_at, value) o None"""
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get('expires_at', 0) <= now:
+            if self._disk_remove(path):
+                with self._lock:
+                    self.disk_expired += 1
+            return None
+        try:
+            # Último acceso para el desalojo; el mtime (escritura) no cambia
+            os.utime(path, (now, os.stat(path).st_mtime))
+        except OSError:
+            pass
+        return record['expires_at'], record['value']
+
+    def _disk_remove(self, path):
+        """Borrar un archivo de la capa en disco; False si otro ya lo borró"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return False
+        with self._lock:
+            self._disk_bytes -= size
+        return True
+
+    def _disk_put(self, key, value, expires_at):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Escritura atómica: archivo temporal y luego renombrar
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f, ensure_ascii=False)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Error escribiendo caché en disco: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += size
+            over_budget = self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._sweep_requested.set()
+
+    def _run_disk_sweeper(self):
+        while True:
+            self._sweep_requested.wait(self.disk_sweep_interval)
+            self._sweep_requested.clear()
+            try:
+                self.sweep_disk()
+            except Exception as e:
+                print(f"⚠️ Error limpiando la caché en disco: {e}")
+
+    def sweep_disk(self):
+        """Borrar lo vencido y, sobre el presupuesto, lo de acceso más antiguo"""
+        now = time.time()
+        files = []
+        total = 0
+        expired = 0
+        for shard in os.scandir(self.disk_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith('.tmp'):
+                    if stat.st_mtime + self.STALE_TMP_SECONDS <= now:
+                        self._disk_remove(entry.path)
+                    continue
+                if stat.st_mtime + self.ttl <= now:
+                    expired += self._disk_remove(entry.path)
+                    continue
+                files.append((stat.st_atime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        evicted = 0
+        if self.disk_max_bytes and total > self.disk_max_bytes:
+            target = self.disk_max_bytes * self.DISK_EVICTION_TARGET
+            files.sort()
+            for _, size, path in files:
+                if total <= target:
+                    break
+                evicted += self._disk_remove(path)
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_expired += expired
+            self.disk_evictions += evicted
+
+    def get_stats(self):
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'disk_enabled': bool(self.disk_dir),
+                'disk_bytes': self._disk_bytes,
+                'disk_max_bytes': self.disk_max_bytes,
+                'disk_evictions': self.disk_evictions,
+                'disk_expired': self.disk_expired,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
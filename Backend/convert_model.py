@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Exportar el modelo Keras a SavedModel / TFLite y comparar backends
+
+Ejemplos:
+    python convert_model.py export --formats saved_model tflite_float16 tflite_int8 \\
+        --calibration-dir /datos/plantvillage/val
+    python convert_model.py parity --samples /datos/plantvillage/val \\
+        --candidates models/mejor_modelo_cultivos_float16.tflite models/mejor_modelo_cultivos_int8.tflite
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from model_loader import ModelLoader, decode_image
+
+DEFAULT_MODEL = 'models/mejor_modelo_cultivos.h5'
+EXPORT_FORMATS = ['saved_model', 'tflite_float32', 'tflite_float16', 'tflite_int8']
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}
+
+
+def list_images(directory, limit):
+    """Primeras `limit` imágenes de una carpeta (recursivo, orden estable)"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(root, name))
+                if len(paths) >= limit:
+                    return paths
+    return paths
+
+
+def iter_decoded(paths):
+    """Decodificar imágenes omitiendo las que no se pueden leer"""
+    for path in paths:
+        try:
+            yield decode_image(path)
+        except Exception as e:
+            print(f"⚠️ Imagen omitida ({path}): {e}")
+
+
+def representative_dataset(paths):
+    """Generador de calibración para la cuantización int8"""
+    def generator():
+        for image in iter_decoded(paths):
+            yield [image[np.newaxis, ...]]
+    return generator
+
+
+def export_model(model_path, formats, output_dir, calibration_paths):
+    """Exportar el modelo a los formatos indicados; devuelve las rutas creadas"""
+    model = tf.keras.models.load_model(model_path)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    os.makedirs(output_dir, exist_ok=True)
+    exported = {}
+
+    if 'saved_model' in formats:
+        path = os.path.join(output_dir, f'{stem}_saved_model')
+        if hasattr(model, 'export'):
+            model.export(path)
+        else:
+            tf.saved_model.save(model, path)
+        exported['saved_model'] = path
+
+    for fmt in formats:
+        if not fmt.startswith('tflite_'):
+            continue
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if fmt == 'tflite_float16':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif fmt == 'tflite_int8':
+            if not calibration_paths:
+                raise ValueError('La cuantización int8 requiere --calibration-dir con imágenes')
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = representative_dataset(calibration_paths)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        path = os.path.join(output_dir, f"{stem}_{fmt.split('_', 1)[1]}.tflite")
+        with open(path, 'wb') as f:
+            f.write(converter.convert())
+        exported[fmt] = path
+
+    for fmt, path in exported.items():
+        print(f"✅ {fmt}: {path}")
+    return exported
+
+
+def measure_backend(loader, images, batch_size):
+    """Probabilidades y latencias (por imagen en lote y con lote de 1)"""
+    # Calentamiento para no medir el trazado inicial
+    loader.model.predict(images[:1])
+    loader.model.predict(images[:batch_size])
+
+    outputs = []
+    started = time.perf_counter()
+    for start in range(0, len(images), batch_size):
+        outputs.append(loader.model.predict(images[start:start + batch_size]))
+    batched_seconds = time.perf_counter() - started
+
+    single_latencies = []
+    for image in images[:min(len(images), 50)]:
+        started = time.perf_counter()
+        loader.model.predict(image[np.newaxis, ...])
+        single_latencies.append(time.perf_counter() - started)
+
+    return np.concatenate(outputs), {
+        'ms_per_image_batched': batched_seconds / len(images) * 1000.0,
+        'ms_single_p50': float(np.percentile(single_latencies, 50) * 1000.0),
+        'ms_single_p95': float(np.percentile(single_latencies, 95) * 1000.0)
+    }
+
+
+def parity_check(reference_path, candidate_paths, sample_paths, batch_size):
+    """Comparar cada backend contra el modelo de referencia"""
+    images = np.stack(list(iter_decoded(sample_paths)))
+    print(f"🔍 Comparando backends sobre {len(images)} imágenes")
+
+    reference = ModelLoader(reference_path)
+    reference_outputs, reference_timing = measure_backend(reference, images, batch_size)
+    reference_top1 = reference_outputs.argmax(axis=1)
+
+    report = [dict(path=reference_path, backend=reference.backend,
+                   top1_agreement=1.0, max_abs_diff=0.0, **reference_timing)]
+    for path in candidate_paths:
+        candidate = ModelLoader(path)
+        outputs, timing = measure_backend(candidate, images, batch_size)
+        report.append(dict(
+            path=path,
+            backend=candidate.backend,
+            top1_agreement=float(np.mean(outputs.argmax(axis=1) == reference_top1)),
+            max_abs_diff=float(np.max(np.abs(outputs - reference_outputs))),
+            **timing
+        ))
+
+    print(f"{'backend':<12} {'top-1':>7} {'max|Δp|':>9} {'ms/img lote':>12} {'ms p50 (1)':>11}  ruta")
+    for row in report:
+        print(f"{row['backend']:<12} {row['top1_agreement']:>7.3f} {row['max_abs_diff']:>9.4f} "
+              f"{row['ms_per_image_batched']:>12.2f} {row['ms_single_p50']:>11.2f}  {row['path']}")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Exportar y comparar backends de inferencia')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Exportar el modelo Keras')
+    export_parser.add_argument('--model', default=DEFAULT_MODEL)
+    export_parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS,
+                               default=['saved_model', 'tflite_float16'])
+    export_parser.add_argument('--output-dir', default='models')
+    export_parser.add_argument('--calibration-dir', help='Imágenes para calibrar int8')
+    export_parser.add_argument('--calibration-samples', type=int, default=200)
+
+    parity_parser = subparsers.add_parser('parity', help='Comparar backends contra el modelo Keras')
+    parity_parser.add_argument('--reference', default=DEFAULT_MODEL)
+    parity_parser.add_argument('--candidates', nargs='+', required=True,
+                               help='Rutas .tflite o carpetas SavedModel')
+    parity_parser.add_argument('--samples', required=True, help='Carpeta con imágenes de muestra')
+    parity_parser.add_argument('--limit', type=int, default=200)
+    parity_parser.add_argument('--batch-size', type=int, default=16)
+    parity_parser.add_argument('--json', help='Guardar el reporte en este archivo')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'export':
+        calibration_paths = list_images(args.calibration_dir, args.calibration_samples) \
+            if args.calibration_dir else []
+        export_model(args.model, args.formats, args.output_dir, calibration_paths)
+    else:
+        sample_paths = list_images(args.samples, args.limit)
+        if not sample_paths:
+            raise SystemExit(f"❌ No se encontraron imágenes en {args.samples}")
+        report = parity_check(args.reference, args.candidates, sample_paths, args.batch_size)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,485 @@
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo protección entre hilos del mismo proceso
+    fcntl = None
+
+
+def make_case_meta(filename, prediction_result, model_version=None):
+    """Metadatos guardados junto a cada embedding"""
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'filename': filename,
+        'class': prediction_result['class'],
+        'confidence': prediction_result['confidence'],
+        'model_version': model_version
+    }
+
+
+class EmbeddingIndex:
+    """Índice de embeddings para buscar casos parecidos a una imagen nueva
+
+    Los vectores (normalizados, float16) se agregan a `vectors.f16` y se
+    leen con memmap; en paralelo se guardan la clase de cada vector
+    (`classes.i16`) y sus metadatos (`meta.jsonl`). Varios procesos pueden
+    escribir a la vez: las escrituras se serializan con flock y cada
+    proceso detecta lo que agregaron los demás por el tamaño de los archivos.
+
+    La búsqueda exacta recorre los vectores por bloques (producto punto =
+    coseno). A partir de `ivf_threshold` vectores se entrena en segundo
+    plano un índice IVF (k-means esférico) y la búsqueda solo revisa las
+    `nprobe` listas más cercanas, más los vectores agregados después.
+    """
+
+    CONFIG_FILE = 'index.json'
+    VECTORS_FILE = 'vectors.f16'
+    CLASSES_FILE = 'classes.i16'
+    META_FILE = 'meta.jsonl'
+    IVF_FILE = 'ivf.npz'
+    LOCK_FILE = '.lock'
+    MODES = ('auto', 'exact', 'ivf')
+
+    def __init__(self, index_dir='embeddings_index', ivf_threshold=20_000, nprobe=16,
+                 chunk_rows=65536):
+        self.index_dir = index_dir
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.chunk_rows = chunk_rows
+        os.makedirs(index_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._lock_file = open(self._path(self.LOCK_FILE), 'a+')
+        self.dim = None
+        self.class_names = []
+        self.count = 0
+        self._vectors = None
+        self._classes = np.empty(0, dtype=np.int16)
+        # Offsets de meta.jsonl en un búfer que duplica su capacidad al llenarse;
+        # `_meta_offsets` es la vista de la parte usada
+        self._offset_buffer = np.zeros(1024, dtype=np.int64)
+        self._meta_offsets = self._offset_buffer[:1]
+        self._ivf = None
+        self._ivf_mtime = None
+        self._ivf_building = False
+        self.rejected = 0
+
+        with self._lock, self._file_lock():
+            self._load_config()
+            self._repair()
+        self._refresh()
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _load_config(self):
+        path = self._path(self.CONFIG_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            self.dim = config['dim']
+            self.class_names = config['classes']
+
+    def _save_config(self):
+        temporary = self._path(f'{self.CONFIG_FILE}.{os.getpid()}.tmp')
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'classes': self.class_names}, f, ensure_ascii=False)
+        os.replace(temporary, self._path(self.CONFIG_FILE))
+
+    def _file_rows(self):
+        """Filas completas en cada archivo (vectores, clases, metadatos)"""
+        if self.dim is None:
+            return 0, 0, 0
+        vectors = self._size(self.VECTORS_FILE) // (self.dim * 2)
+        classes = self._size(self.CLASSES_FILE) // 2
+        return vectors, classes, self._meta_lines()
+
+    def _size(self, name):
+        path = self._path(name)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _meta_lines(self):
+        path = self._path(self.META_FILE)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+        return int(np.count_nonzero(np.memmap(path, dtype=np.uint8, mode='r') == 10))
+
+    def _repair(self):
+        """Recortar los tres archivos al mismo número de filas tras un corte"""
+        if self.dim is None:
+            return
+        meta_size = self._size(self.META_FILE)
+        if meta_size:
+            with open(self._path(self.META_FILE), 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    # Última línea incompleta: se descarta
+                    f.seek(0)
+                    f.truncate(f.read().rfind(b'\n') + 1)
+        rows = self._file_rows()
+        count = min(rows)
+        if count == max(rows) and self._size(self.VECTORS_FILE) == count * self.dim * 2 \
+                and self._size(self.CLASSES_FILE) == count * 2:
+            return
+        print(f"⚠️ Índice de embeddings desalineado {rows}; se recorta a {count} vectores")
+        with open(self._path(self.VECTORS_FILE), 'ab') as f:
+            f.truncate(count * self.dim * 2)
+        with open(self._path(self.CLASSES_FILE), 'ab') as f:
+            f.truncate(count * 2)
+        if count == 0:
+            open(self._path(self.META_FILE), 'wb').close()
+            return
+        meta = np.memmap(self._path(self.META_FILE), dtype=np.uint8, mode='r')
+        end = int(np.flatnonzero(meta == 10)[count - 1]) + 1
+        del meta
+        with open(self._path(self.META_FILE), 'ab') as f:
+            f.truncate(end)
+
+    def _refresh(self):
+        """Incorporar los vectores agregados (por este u otros procesos)
+
+        Solo mira el tamaño de los archivos y las líneas nuevas de
+        meta.jsonl: cuesta O(1) si nada cambió y O(agregado) si no. Los
+        vectores y las clases se reabren con memmap (sin leerlos) y los
+        offsets crecen en un búfer de capacidad doble.
+        """
+        with self._lock:
+            if self.dim is None:
+                self._load_config()
+                if self.dim is None:
+                    return
+            self._extend_offsets()
+            count = min(self._size(self.VECTORS_FILE) // (self.dim * 2),
+                        self._size(self.CLASSES_FILE) // 2,
+                        len(self._meta_offsets) - 1)
+            if count != self.count:
+                self._load_config()
+                self._vectors = np.memmap(self._path(self.VECTORS_FILE), dtype=np.float16,
+                                          mode='r', shape=(count, self.dim)) if count else None
+                self._classes = np.memmap(self._path(self.CLASSES_FILE), dtype=np.int16,
+                                          mode='r', shape=(count,)) if count else \
+                    np.empty(0, dtype=np.int16)
+                self.count = count
+            self._load_ivf()
+
+    def _extend_offsets(self):
+        """Offsets de inicio de cada línea completa de meta.jsonl (incremental)"""
+        start = int(self._meta_offsets[-1])
+        if self._size(self.META_FILE) <= start:
+            return
+        meta = np.memmap(self._path(self.META_FILE), dtype=np.uint8, mode='r')
+        newlines = np.flatnonzero(meta[start:] == 10) + start + 1
+        del meta
+        if not len(newlines):
+            return
+        used = len(self._meta_offsets)
+        needed = used + len(newlines)
+        if needed > len(self._offset_buffer):
+            # Las vistas anteriores siguen válidas para quien las esté leyendo
+            grown = np.zeros(max(needed, 2 * len(self._offset_buffer)), dtype=np.int64)
+            grown[:used] = self._meta_offsets
+            self._offset_buffer = grown
+        self._offset_buffer[used:needed] = newlines
+        self._meta_offsets = self._offset_buffer[:needed]
+
+    def _load_ivf(self):
+        path = self._path(self.IVF_FILE)
+        if not os.path.exists(path):
+            return
+        mtime = os.path.getmtime(path)
+        if mtime == self._ivf_mtime:
+            return
+        with np.load(path) as data:
+            self._ivf = {name: data[name] for name in data.files}
+        self._ivf_mtime = mtime
+
+    def add_many(self, records):
+        """Agregar (embedding, metadatos) con una escritura por archivo
+
+        Los metadatos deben incluir 'class'. Los vectores con otra
+        dimensión (p. ej. de un modelo distinto) se descartan.
+        """
+        if not records:
+            return []
+        with self._lock, self._file_lock():
+            self._load_config()
+            if self.dim is None:
+                self.dim = int(len(records[0][0]))
+                self._save_config()
+
+            vectors, class_ids, lines = [], [], []
+            config_changed = False
+            for embedding, meta in records:
+                vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+                if vector.shape[0] != self.dim:
+                    self.rejected += 1
+                    continue
+                norm = np.linalg.norm(vector)
+                vectors.append(vector / norm if norm else vector)
+                class_name = meta.get('class')
+                if class_name not in self.class_names:
+                    self.class_names.append(class_name)
+                    config_changed = True
+                class_ids.append(self.class_names.index(class_name))
+                lines.append(json.dumps(meta, ensure_ascii=False).encode('utf-8') + b'\n')
+            if not vectors:
+                return []
+            if config_changed:
+                self._save_config()
+
+            first_id = min(self._size(self.VECTORS_FILE) // (self.dim * 2),
+                           self._size(self.CLASSES_FILE) // 2)
+            with open(self._path(self.VECTORS_FILE), 'ab') as f:
+                f.write(np.asarray(vectors, dtype=np.float16).tobytes())
+            with open(self._path(self.CLASSES_FILE), 'ab') as f:
+                f.write(np.asarray(class_ids, dtype=np.int16).tobytes())
+            with open(self._path(self.META_FILE), 'ab') as f:
+                f.write(b''.join(lines))
+
+        self._maybe_build_ivf(first_id + len(vectors))
+        return list(range(first_id, first_id + len(vectors)))
+
+    def add(self, embedding, meta):
+        ids = self.add_many([(embedding, meta)])
+        return ids[0] if ids else None
+
+    def get_vector(self, case_id):
+        self._refresh()
+        if self._vectors is None or not 0 <= case_id < self.count:
+            return None
+        return np.asarray(self._vectors[case_id], dtype=np.float32)
+
+    def _read_meta(self, ids):
+        results = []
+        with open(self._path(self.META_FILE), 'rb') as f:
+            for case_id in ids:
+                f.seek(int(self._meta_offsets[case_id]))
+                results.append(json.loads(f.readline()))
+        return results
+
+    @staticmethod
+    def _top_k(scores, ids, k):
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            scores, ids = scores[keep], ids[keep]
+        order = np.argsort(-scores, kind='stable')
+        return scores[order], ids[order]
+
+    def _search_exact(self, vectors, classes, query, k, class_id, start, stop):
+        """Top-k sobre las filas [start, stop) recorriendo bloques"""
+        best_scores = np.empty(0, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        for chunk_start in range(start, stop, self.chunk_rows):
+            chunk_stop = min(chunk_start + self.chunk_rows, stop)
+            scores = np.asarray(vectors[chunk_start:chunk_stop], dtype=np.float32) @ query
+            if class_id is not None:
+                scores[classes[chunk_start:chunk_stop] != class_id] = -np.inf
+            ids = np.arange(chunk_start, chunk_stop, dtype=np.int64)
+            best_scores, best_ids = self._top_k(
+                np.concatenate([best_scores, scores]), np.concatenate([best_ids, ids]), k
+            )
+        return best_scores, best_ids
+
+    def _search_ivf(self, vectors, classes, query, k, class_id, count, nprobe):
+        ivf = self._ivf
+        centroid_scores = ivf['centroids'] @ query
+        nprobe = min(nprobe, len(centroid_scores))
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        offsets = ivf['offsets']
+        candidates = np.concatenate(
+            [ivf['order'][offsets[c]:offsets[c + 1]] for c in probes]
+        )
+        # Ordenar los candidatos lee el memmap en orden de disco
+        candidates = np.sort(candidates)
+        if class_id is not None:
+            candidates = candidates[classes[candidates] == class_id]
+        scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+        best_scores, best_ids = self._top_k(scores, candidates.astype(np.int64), k)
+
+        covered = int(ivf['count'])
+        if covered < count:
+            # Vectores agregados después de entrenar el IVF: búsqueda exacta
+            tail_scores, tail_ids = self._search_exact(vectors, classes, query, k, class_id,
+                                                       covered, count)
+            best_scores, best_ids = self._top_k(
+                np.concatenate([best_scores, tail_scores]), np.concatenate([best_ids, tail_ids]), k
+            )
+        return best_scores, best_ids
+
+    def search(self, embedding, k=5, class_name=None, mode='auto', nprobe=None, exclude_id=None):
+        """Casos más parecidos por similitud coseno; devuelve (resultados, modo usado)"""
+        if mode not in self.MODES:
+            raise ValueError(f"Modo desconocido: {mode} (opciones: {', '.join(self.MODES)})")
+        self._refresh()
+        with self._lock:
+            vectors, classes, count, ivf = self._vectors, self._classes, self.count, self._ivf
+            class_names = list(self.class_names)
+        if vectors is None:
+            return [], 'exact'
+
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Dimensión del embedding ({query.shape[0]}) distinta a la del índice ({self.dim})")
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        class_id = None
+        if class_name:
+            if class_name not in class_names:
+                return [], mode
+            class_id = class_names.index(class_name)
+
+        wanted = k + (1 if exclude_id is not None else 0)
+        used = 'ivf' if ivf is not None and mode in ('auto', 'ivf') else 'exact'
+        if used == 'ivf':
+            scores, ids = self._search_ivf(vectors, classes, query, wanted, class_id, count,
+                                           nprobe or self.nprobe)
+            if class_id is not None and np.isfinite(scores).sum() < wanted:
+                # La clase pedida casi no aparece en las listas revisadas
+                used = 'exact'
+        if used == 'exact':
+            scores, ids = self._search_exact(vectors, classes, query, wanted, class_id, 0, count)
+
+        keep = np.isfinite(scores) & (ids != (-1 if exclude_id is None else exclude_id))
+        scores, ids = scores[keep][:k], ids[keep][:k]
+        results = []
+        for case_id, score, meta in zip(ids, scores, self._read_meta(ids)):
+            results.append(dict(meta, case_id=int(case_id), similarity=min(float(score), 1.0)))
+        return results, used
+
+    def _maybe_build_ivf(self, count):
+        if count < self.ivf_threshold or self._ivf_building:
+            return
+        covered = int(self._ivf['count']) if self._ivf is not None else 0
+        # Reentrenar cuando lo no indexado supera el 20% de lo indexado
+        if covered and count - covered < 0.2 * covered:
+            return
+        self._ivf_building = True
+        threading.Thread(target=self._build_ivf_background, name='ivf-build', daemon=True).start()
+
+    def _build_ivf_background(self):
+        try:
+            self.build_ivf()
+        except Exception as e:
+            print(f"❌ Error entrenando el índice IVF: {e}")
+        finally:
+            self._ivf_building = False
+
+    def build_ivf(self, nlist=None, iterations=8, sample_size=100_000, seed=1234):
+        """Entrenar centroides con k-means esférico y armar las listas invertidas"""
+        self._refresh()
+        with self._lock:
+            vectors, count = self._vectors, self.count
+        if vectors is None:
+            return None
+        nlist = nlist or max(1, min(int(math.sqrt(count)), 65536))
+        rng = np.random.default_rng(seed)
+
+        sample_ids = np.sort(rng.choice(count, size=min(sample_size, count), replace=False))
+        sample = np.asarray(vectors[sample_ids], dtype=np.float32)
+        nlist = min(nlist, len(sample))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            sizes = np.bincount(assignments, minlength=nlist)
+            empty = sizes == 0
+            # Listas vacías: volver a sembrar con puntos al azar
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        assignments = np.concatenate([
+            self._assign(np.asarray(vectors[start:start + self.chunk_rows], dtype=np.float32), centroids)
+            for start in range(0, count, self.chunk_rows)
+        ])
+        order = np.argsort(assignments, kind='stable').astype(np.int64)
+        offsets = np.searchsorted(assignments[order], np.arange(nlist + 1)).astype(np.int64)
+
+        temporary = self._path(f'{self.IVF_FILE}.{os.getpid()}.tmp')
+        with open(temporary, 'wb') as f:
+            np.savez(f, centroids=centroids.astype(np.float32), order=order,
+                     offsets=offsets, count=np.int64(count))
+        os.replace(temporary, self._path(self.IVF_FILE))
+        self._refresh()
+        print(f"✅ Índice IVF entrenado: {count} vectores en {nlist} listas")
+        return nlist
+
+    def _assign(self, block, centroids):
+        return np.argmax(block @ centroids.T, axis=1)
+
+    def get_stats(self):
+        self._refresh()
+        return {
+            'vectors': self.count,
+            'dim': self.dim,
+            'ivf_lists': int(len(self._ivf['centroids'])) if self._ivf is not None else 0,
+            'ivf_covered': int(self._ivf['count']) if self._ivf is not None else 0,
+            'rejected': self.rejected
+        }
+
+
+class EmbeddingIndexSet:
+    """Un índice por versión del modelo, en `root/<versión>`
+
+    Los embeddings de dos modelos distintos no son comparables (ni siquiera
+    tienen por qué medir lo mismo), así que al cambiar de versión cada una
+    sigue con su propio índice y sus propios case_id.
+    """
+
+    def __init__(self, root='embeddings_index', **options):
+        self.root = root
+        self.options = options
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def validate_version(model_version):
+        """La versión nombra una carpeta dentro de `root`: nada de rutas"""
+        if not model_version or model_version.startswith('.') or '\0' in model_version or \
+                any(sep and sep in model_version for sep in (os.sep, os.altsep)):
+            raise ValueError(f"Versión de modelo inválida: {model_version!r}")
+        return model_version
+
+    def for_version(self, model_version):
+        index = self._indexes.get(model_version)
+        if index is None:
+            self.validate_version(model_version)
+            with self._lock:
+                index = self._indexes.get(model_version)
+                if index is None:
+                    index = EmbeddingIndex(os.path.join(self.root, model_version), **self.options)
+                    self._indexes[model_version] = index
+        return index
+
+    def exists(self, model_version):
+        """Si ya hay un índice en disco para la versión (sin crearlo)"""
+        self.validate_version(model_version)
+        return model_version in self._indexes or \
+            os.path.exists(os.path.join(self.root, model_version, EmbeddingIndex.CONFIG_FILE))
+
+    def get_stats(self, model_version):
+        """Estadísticas del índice de una versión"""
+        if not model_version:
+            return None
+        return dict(self.for_version(model_version).get_stats(), model_version=model_version)
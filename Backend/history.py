@@ -0,0 +1,502 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from model_loader import AgroAssistant, DEFAULT_CLASS_NAMES, TOP_K
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo protección entre hilos del mismo proceso
+    fcntl = None
+
+# Columnas de ancho fijo: nombre -> tipo (una fila por predicción)
+COLUMNS = {
+    'timestamp': np.int64,      # milisegundos desde la época (hora local del log)
+    'class': np.int16,          # índice en la tabla de clases
+    'confidence': np.float32,
+    'model_version': np.int16,  # índice en la tabla de versiones (-1 = sin versión)
+    'filename_end': np.int64    # fin del nombre de archivo dentro de filenames.bin
+}
+# Vector de probabilidades de cada fila: una columna por clase de la tabla
+# (NaN = el modelo de esa fila no tiene esa clase)
+PROBABILITIES_DTYPE = np.float16
+# Derivado del vector: IDs de las `top_k` clases más probables (-1 = vacío)
+# y sus probabilidades (NaN = vacío)
+TOP_CLASSES_DTYPE = np.int16
+TOP_PROBABILITIES_DTYPE = np.float16
+
+
+def _to_millis(timestamp):
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def parse_time_bound(value, end=False):
+    """Límite ISO (día, hora, minuto...) a milisegundos; `end` toma el
+    final del intervalo indicado ('2024-06-01' llega hasta las 23:59:59.999)"""
+    if not value:
+        return None
+    start = datetime.fromisoformat(value)
+    if not end:
+        return int(start.timestamp() * 1000)
+    # El extremo final es inclusivo con la precisión con que se escribió
+    precision = {10: 'days', 13: 'hours', 16: 'minutes', 19: 'seconds'}.get(len(value))
+    if precision is None:
+        return int(start.timestamp() * 1000)
+    step = {'days': 86400, 'hours': 3600, 'minutes': 60, 'seconds': 1}[precision]
+    return int(start.timestamp() * 1000) + step * 1000 - 1
+
+
+class PredictionHistory:
+    """Historial de predicciones en columnas binarias, consultable con NumPy
+
+    Igual que las estadísticas, sigue los segmentos del log y agrega solo
+    lo nuevo, pero a archivos de ancho fijo en `history_dir`: marca de
+    tiempo, clase, confianza y versión del modelo (una columna cada una),
+    el vector de probabilidades en float16 con una columna por clase de la
+    tabla, las `top_k` clases más probables derivadas de él (IDs int16 y
+    probabilidades float16) y los nombres de archivo concatenados. La recomendación no se guarda
+    (tampoco en el log): es función de la clase y la confianza, así que se
+    reconstruye con AgroAssistant al responder (la tabla de clases empieza
+    con las de AgroAssistant, en su orden).
+
+    Las consultas leen las columnas con memmap y filtran por bloques con
+    máscaras vectorizadas; solo las filas de la página se convierten a
+    diccionarios. Varios procesos pueden compartir la carpeta: la
+    incorporación del log se serializa con flock y la posición leída se
+    guarda junto con las columnas.
+    """
+
+    META_FILE = 'meta.json'
+    PROBABILITIES_FILE = 'probabilities.f16'
+    TOP_CLASSES_FILE = 'top_classes.i2'
+    TOP_PROBABILITIES_FILE = 'top_probabilities.f16'
+    FILENAMES_FILE = 'filenames.bin'
+    LOCK_FILE = '.lock'
+    META_VERSION = 3
+
+    def __init__(self, prediction_logger, history_dir=None, refresh_interval=1.0,
+                 chunk_rows=262144, agro_assistant=None):
+        self.prediction_logger = prediction_logger
+        self.history_dir = history_dir or os.path.join(prediction_logger.log_dir, 'history')
+        self.refresh_interval = refresh_interval
+        self.chunk_rows = chunk_rows
+        self.agro_assistant = agro_assistant or AgroAssistant()
+        os.makedirs(self.history_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._lock_file = open(self._path(self.LOCK_FILE), 'a+')
+        self._meta = None
+        self._columns = {}
+        self._probabilities = None
+        self._top_classes = None
+        self._top_probabilities = None
+        self._filenames = None
+        self._meta_mtime = None
+
+        with self._lock, self._file_lock():
+            self._load_meta()
+            self._repair()
+        self._map_columns()
+
+        self._thread = threading.Thread(target=self._run, name='prediction-history', daemon=True)
+        self._thread.start()
+
+    # -- Archivos -----------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.history_dir, name)
+
+    @staticmethod
+    def _column_file(name):
+        return f'{name}.{np.dtype(COLUMNS[name]).str[1:]}'
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _empty_meta(self):
+        return {
+            'version': self.META_VERSION,
+            'count': 0,
+            # Los IDs de clase coinciden con la tabla de recomendaciones
+            'classes': list(self.agro_assistant.recommendations),
+            'model_versions': [],
+            # Ancho fijo de la matriz de probabilidades (crece con la tabla de clases)
+            'probability_width': len(self.agro_assistant.recommendations),
+            'top_k': TOP_K,
+            'position': [None, 0]
+        }
+
+    def _load_meta(self):
+        path = self._path(self.META_FILE)
+        meta = None
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta.get('version') != self.META_VERSION:
+                    raise ValueError('versión de historial distinta')
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Historial descartado ({e}); se reconstruye desde el log")
+                meta = None
+        if meta is None:
+            meta = self._empty_meta()
+            for name in list(COLUMNS) + [self.PROBABILITIES_FILE, self.TOP_CLASSES_FILE,
+                                         self.TOP_PROBABILITIES_FILE, self.FILENAMES_FILE]:
+                column_path = self._path(self._column_file(name) if name in COLUMNS else name)
+                if os.path.exists(column_path):
+                    os.remove(column_path)
+        self._meta = meta
+        self._meta_mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+    def _save_meta(self):
+        path = self._path(self.META_FILE)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f)
+        os.replace(temporary, path)
+        self._meta_mtime = os.stat(path).st_mtime_ns
+
+    def _repair(self):
+        """Recortar lo escrito después del último meta.json (corte a mitad de un
+        agregado): las columnas valen hasta `count` filas"""
+        count = self._meta['count']
+        for name, dtype in COLUMNS.items():
+            self._truncate(self._column_file(name), count * np.dtype(dtype).itemsize)
+        self._truncate(self.PROBABILITIES_FILE,
+                       count * self._meta['probability_width'] * np.dtype(PROBABILITIES_DTYPE).itemsize)
+        top_k = self._meta['top_k']
+        self._truncate(self.TOP_CLASSES_FILE, count * top_k * np.dtype(TOP_CLASSES_DTYPE).itemsize)
+        self._truncate(self.TOP_PROBABILITIES_FILE,
+                       count * top_k * np.dtype(TOP_PROBABILITIES_DTYPE).itemsize)
+        names_end = 0
+        if count:
+            names_end = int(np.fromfile(self._path(self._column_file('filename_end')),
+                                        dtype=COLUMNS['filename_end'], count=1,
+                                        offset=(count - 1) * 8)[0])
+        self._truncate(self.FILENAMES_FILE, names_end)
+
+    def _truncate(self, name, size):
+        path = self._path(name)
+        if not os.path.exists(path):
+            open(path, 'ab').close()
+        elif os.path.getsize(path) > size:
+            with open(path, 'rb+') as f:
+                f.truncate(size)
+
+    def _map_columns(self):
+        """Abrir (o reabrir, si creció) las columnas con memmap"""
+        count = self._meta['count']
+        width = self._meta['probability_width']
+        top_k = self._meta['top_k']
+        names_size = os.path.getsize(self._path(self.FILENAMES_FILE))
+        self._filenames = np.memmap(self._path(self.FILENAMES_FILE), dtype=np.uint8, mode='r') \
+            if names_size else np.empty(0, dtype=np.uint8)
+        if not count:
+            self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+            self._probabilities = np.empty((0, width), dtype=PROBABILITIES_DTYPE)
+            self._top_classes = np.empty((0, top_k), dtype=TOP_CLASSES_DTYPE)
+            self._top_probabilities = np.empty((0, top_k), dtype=TOP_PROBABILITIES_DTYPE)
+            return
+        self._columns = {
+            name: np.memmap(self._path(self._column_file(name)), dtype=dtype, mode='r', shape=(count,))
+            for name, dtype in COLUMNS.items()
+        }
+        self._probabilities = np.memmap(self._path(self.PROBABILITIES_FILE), dtype=PROBABILITIES_DTYPE,
+                                        mode='r', shape=(count, width))
+        self._top_classes = np.memmap(self._path(self.TOP_CLASSES_FILE), dtype=TOP_CLASSES_DTYPE,
+                                      mode='r', shape=(count, top_k))
+        self._top_probabilities = np.memmap(self._path(self.TOP_PROBABILITIES_FILE),
+                                            dtype=TOP_PROBABILITIES_DTYPE, mode='r', shape=(count, top_k))
+
+    # -- Incorporación del log ----------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Error actualizando el historial: {e}")
+            time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Agregar a las columnas las entradas escritas desde la última lectura
+
+        La posición es un único (segmento, offset), igual que en las
+        estadísticas: PredictionLogger solo agrega al segmento más nuevo
+        aunque escriban varios procesos (rotación y escrituras bajo flock),
+        así que los segmentos anteriores a la posición no cambian más.
+        """
+        with self._lock, self._file_lock():
+            # Otro proceso pudo haber avanzado: partir de su meta.json
+            path = self._path(self.META_FILE)
+            if os.path.exists(path) and os.stat(path).st_mtime_ns != self._meta_mtime:
+                self._load_meta()
+            appended = False
+            for segment_path in self.prediction_logger.list_segments():
+                name = os.path.basename(segment_path)
+                segment, offset = self._meta['position']
+                if segment is not None and name < segment:
+                    continue
+                offset = offset if name == segment else 0
+                with open(segment_path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+                # Solo líneas completas: la última puede estar escribiéndose
+                end = data.rfind(b'\n') + 1
+                rows = []
+                for line in data[:end].splitlines():
+                    row = self._parse(line)
+                    if row is not None:
+                        rows.append(row)
+                if [name, offset + end] == self._meta['position']:
+                    continue
+                self._append(rows)
+                self._meta['position'] = [name, offset + end]
+                appended = appended or bool(rows)
+                self._save_meta()
+            if appended or self._meta['count'] != len(self._columns['timestamp']):
+                self._map_columns()
+
+    def _parse(self, line):
+        try:
+            entry = json.loads(line)
+            prediction = entry['prediction']
+            return (
+                _to_millis(entry['timestamp']),
+                prediction['class'],
+                float(prediction['confidence']),
+                prediction.get('model_version'),
+                self._entry_probabilities(prediction),
+                entry.get('image_filename') or ''
+            )
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _entry_probabilities(self, prediction):
+        """{clase: probabilidad} de una entrada del log
+
+        Las entradas del log heredado traían el vector sin nombres: se
+        interpreta con las clases por defecto solo si concuerda con la clase
+        registrada. Las que solo traen las más probables (`top_k`) o ni eso
+        quedan con las clases conocidas; el resto de la fila queda en NaN.
+        """
+        probabilities = prediction.get('probabilities')
+        if isinstance(probabilities, dict):
+            return {str(name): float(probability) for name, probability in probabilities.items()}
+        top_k = prediction.get('top_k')
+        if top_k is not None:
+            return {str(name): float(probability) for name, probability in top_k}
+        vector = prediction.get('all_predictions')
+        if isinstance(vector, list) and len(vector) == len(DEFAULT_CLASS_NAMES) and \
+                DEFAULT_CLASS_NAMES[int(np.argmax(vector))] == prediction['class']:
+            return dict(zip(DEFAULT_CLASS_NAMES, map(float, vector)))
+        return {prediction['class']: float(prediction['confidence'])}
+
+    def _table_id(self, table, value):
+        """ID de un valor en una tabla del meta (se agrega si es nuevo)"""
+        try:
+            return table.index(value)
+        except ValueError:
+            table.append(value)
+            return len(table) - 1
+
+    def _append(self, rows):
+        if not rows:
+            return
+        classes = self._meta['classes']
+        versions = self._meta['model_versions']
+        top_k = self._meta['top_k']
+        # Primero registrar las clases nuevas: fijan el ancho de la matriz
+        row_probabilities = [
+            [(self._table_id(classes, name), probability) for name, probability in row[4].items()]
+            for row in rows
+        ]
+        if len(classes) > self._meta['probability_width']:
+            self._widen_probabilities(len(classes))
+        width = self._meta['probability_width']
+
+        names = [row[5].encode('utf-8') for row in rows]
+        names_start = os.path.getsize(self._path(self.FILENAMES_FILE))
+        columns = {
+            'timestamp': np.fromiter((row[0] for row in rows), dtype=COLUMNS['timestamp'], count=len(rows)),
+            'class': np.fromiter((self._table_id(classes, row[1]) for row in rows),
+                                 dtype=COLUMNS['class'], count=len(rows)),
+            'confidence': np.fromiter((row[2] for row in rows), dtype=COLUMNS['confidence'], count=len(rows)),
+            'model_version': np.fromiter((self._table_id(versions, row[3]) if row[3] else -1 for row in rows),
+                                         dtype=COLUMNS['model_version'], count=len(rows)),
+            'filename_end': names_start + np.cumsum([len(name) for name in names], dtype=np.int64)
+        }
+        probabilities = np.full((len(rows), width), np.nan, dtype=PROBABILITIES_DTYPE)
+        for i, pairs in enumerate(row_probabilities):
+            for class_id, probability in pairs:
+                probabilities[i, class_id] = probability
+        top_classes, top_probabilities = self._derive_top_k(probabilities, top_k)
+
+        with open(self._path(self.FILENAMES_FILE), 'ab') as f:
+            f.write(b''.join(names))
+        with open(self._path(self.PROBABILITIES_FILE), 'ab') as f:
+            probabilities.tofile(f)
+        with open(self._path(self.TOP_CLASSES_FILE), 'ab') as f:
+            top_classes.tofile(f)
+        with open(self._path(self.TOP_PROBABILITIES_FILE), 'ab') as f:
+            top_probabilities.tofile(f)
+        for name, values in columns.items():
+            with open(self._path(self._column_file(name)), 'ab') as f:
+                values.tofile(f)
+        self._meta['count'] += len(rows)
+
+    @staticmethod
+    def _derive_top_k(probabilities, top_k):
+        """IDs y probabilidades de las `top_k` clases más probables de cada fila"""
+        ranked = np.where(np.isnan(probabilities), -np.inf, probabilities.astype(np.float32))
+        order = np.argsort(-ranked, axis=1, kind='stable')[:, :top_k]
+        chosen = np.take_along_axis(probabilities, order, axis=1)
+        # Menos de `top_k` clases conocidas (entradas viejas, modelos chicos): vacío
+        top_classes = np.full((len(probabilities), top_k), -1, dtype=TOP_CLASSES_DTYPE)
+        top_probabilities = np.full((len(probabilities), top_k), np.nan, dtype=TOP_PROBABILITIES_DTYPE)
+        width = order.shape[1]
+        top_classes[:, :width] = np.where(np.isnan(chosen), -1, order)
+        top_probabilities[:, :width] = chosen
+        return top_classes, top_probabilities
+
+    def _widen_probabilities(self, width):
+        """Reescribir la matriz de probabilidades con más columnas (apareció
+        una clase nueva en la tabla; ocurre una vez por clase nueva)"""
+        count = self._meta['count']
+        old_width = self._meta['probability_width']
+        path = self._path(self.PROBABILITIES_FILE)
+        widened = np.full((count, width), np.nan, dtype=PROBABILITIES_DTYPE)
+        if count and old_width:
+            widened[:, :old_width] = np.fromfile(path, dtype=PROBABILITIES_DTYPE,
+                                                 count=count * old_width).reshape(count, old_width)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        widened.tofile(temporary)
+        os.replace(temporary, path)
+        self._meta['probability_width'] = width
+        # El ancho del archivo y el del meta no pueden quedar distintos tras un corte
+        self._save_meta()
+
+    # -- Consultas ----------------------------------------------------------
+
+    def query(self, limit=50, cursor=None, class_names=None, min_confidence=None,
+              max_confidence=None, start=None, end=None, model_version=None,
+              include_probabilities=False):
+        """Página de predicciones, de la más nueva a la más vieja
+
+        `cursor` es el id de fila desde el cual seguir (exclusivo; el
+        `next_cursor` de la página anterior). Los filtros se combinan; los
+        límites de tiempo son ISO inclusivos con la precisión escrita.
+        """
+        self.refresh()
+        start_ms = parse_time_bound(start)
+        end_ms = parse_time_bound(end, end=True)
+        with self._lock:
+            meta = self._meta
+            columns = self._columns
+            probabilities = self._probabilities
+            top_k = (self._top_classes, self._top_probabilities)
+            filenames = self._filenames
+            count = len(columns['timestamp'])
+            class_table = list(meta['classes'])
+            version_table = list(meta['model_versions'])
+
+        class_ids = None
+        if class_names:
+            class_ids = np.array([class_table.index(name) for name in class_names if name in class_table],
+                                 dtype=COLUMNS['class'])
+        version_id = None
+        if model_version:
+            version_id = version_table.index(model_version) if model_version in version_table else -2
+
+        stop = count if cursor is None else min(max(int(cursor), 0), count)
+        matches = []
+        found = 0
+        # Recorrer hacia atrás por bloques hasta llenar la página
+        while stop > 0 and found < limit:
+            begin = max(0, stop - self.chunk_rows)
+            mask = np.ones(stop - begin, dtype=bool)
+            if class_ids is not None:
+                mask &= np.isin(columns['class'][begin:stop], class_ids)
+            if version_id is not None:
+                mask &= columns['model_version'][begin:stop] == version_id
+            if min_confidence is not None or max_confidence is not None:
+                confidence = columns['confidence'][begin:stop]
+                if min_confidence is not None:
+                    mask &= confidence >= min_confidence
+                if max_confidence is not None:
+                    mask &= confidence <= max_confidence
+            if start_ms is not None or end_ms is not None:
+                timestamps = columns['timestamp'][begin:stop]
+                if start_ms is not None:
+                    mask &= timestamps >= start_ms
+                if end_ms is not None:
+                    mask &= timestamps <= end_ms
+            rows = np.flatnonzero(mask)[::-1][:limit - found] + begin
+            matches.append(rows)
+            found += len(rows)
+            stop = begin
+
+        rows = np.concatenate(matches) if matches else np.empty(0, dtype=np.int64)
+        items = [self._row(int(row), columns, probabilities, top_k, filenames, class_table,
+                           version_table, include_probabilities) for row in rows]
+        # Hay más páginas si quedó algo sin recorrer o el último bloque no se agotó
+        next_cursor = int(rows[-1]) if len(rows) == limit and rows[-1] > 0 else None
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'total_rows': count
+        }
+
+    def _row(self, row, columns, probabilities, top_k, filenames, class_table, version_table,
+             include_probabilities):
+        class_name = class_table[columns['class'][row]]
+        confidence = float(columns['confidence'][row])
+        version_index = int(columns['model_version'][row])
+        names_end = int(columns['filename_end'][row])
+        names_start = int(columns['filename_end'][row - 1]) if row else 0
+        item = {
+            'id': row,
+            'timestamp': datetime.fromtimestamp(columns['timestamp'][row] / 1000.0).isoformat(timespec='milliseconds'),
+            'filename': bytes(filenames[names_start:names_end]).decode('utf-8', errors='replace'),
+            'class': class_name,
+            'confidence': round(confidence, 6),
+            'model_version': version_table[version_index] if version_index >= 0 else None,
+            'recommendation': self.agro_assistant.get_recommendation(class_name, confidence)
+        }
+        if include_probabilities:
+            vector = probabilities[row].astype(np.float32)
+            item['probabilities'] = {class_table[class_id]: round(float(vector[class_id]), 4)
+                                     for class_id in np.flatnonzero(~np.isnan(vector))}
+            top_classes, top_probabilities = top_k
+            item['top_k'] = [[class_table[class_id], round(float(probability), 4)]
+                             for class_id, probability in zip(top_classes[row], top_probabilities[row])
+                             if class_id >= 0]
+        return item
+
+    def get_stats(self):
+        with self._lock:
+            count = self._meta['count']
+            width = self._meta['probability_width']
+            top_k = self._meta['top_k']
+        row_bytes = sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values()) + \
+            width * np.dtype(PROBABILITIES_DTYPE).itemsize + \
+            top_k * (np.dtype(TOP_CLASSES_DTYPE).itemsize + np.dtype(TOP_PROBABILITIES_DTYPE).itemsize)
+        return {
+            'rows': count,
+            'probability_width': width,
+            'top_k': top_k,
+            'fixed_bytes_per_row': row_bytes
+        }
@@ -0,0 +1,191 @@
+import os
+import threading
+
+# TensorFlow se importa dentro de cada backend: importar este módulo (y la
+# app) no paga el costo de cargar TensorFlow hasta que se carga un modelo
+
+import numpy as np
+
+
+class KerasBackend:
+    """Modelo Keras completo (.h5 / .keras)"""
+
+    name = 'keras'
+    # Puede devolver la salida de la penúltima capa en la misma pasada
+    supports_embeddings = True
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(model_path)
+        # Sequential (el modelo del notebook) se recorre capa por capa; los
+        # modelos funcionales exponen la penúltima capa como segunda salida
+        self._multi_output = None
+        if not isinstance(self.model, tf.keras.Sequential):
+            self._multi_output = tf.keras.Model(
+                self.model.inputs, [self.model.layers[-2].output, self.model.output]
+            )
+        # Grafo compilado con lote variable: se traza una sola vez y evita el
+        # costo fijo de model.predict en lotes pequeños
+        input_spec = tf.TensorSpec([None, *self.model.input_shape[1:]], tf.float32)
+        self._infer = tf.function(self._call, input_signature=[input_spec])
+        self.input_size = tuple(self.model.input_shape[1:3])
+
+    def _call(self, images):
+        """(embeddings de la penúltima capa, probabilidades) en una sola pasada"""
+        if self._multi_output is None:
+            features = images
+            for layer in self.model.layers[:-1]:
+                features = layer(features, training=False)
+            return features, self.model.layers[-1](features, training=False)
+        embeddings, probabilities = self._multi_output(images, training=False)
+        return embeddings, probabilities
+
+    def predict(self, images):
+        return self.predict_with_embeddings(images)[0]
+
+    def predict_with_embeddings(self, images):
+        """Probabilidades y embeddings; ambos salen del mismo grafo"""
+        embeddings, probabilities = self._infer(np.asarray(images, dtype=np.float32))
+        return probabilities.numpy(), embeddings.numpy()
+
+
+class SavedModelBackend:
+    """SavedModel exportado, sin reconstruir las capas de Keras"""
+
+    name = 'saved_model'
+    supports_embeddings = False
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+        self.model = tf.saved_model.load(model_path)
+        self.signature = self.model.signatures['serving_default']
+        input_spec = self.signature.structured_input_signature[1]
+        self.input_name = list(input_spec.keys())[0]
+        self.input_size = tuple(input_spec[self.input_name].shape[1:3])
+
+    def predict(self, images):
+        outputs = self.signature(**{self.input_name: np.asarray(images, dtype=np.float32)})
+        return np.asarray(next(iter(outputs.values())))
+
+
+class TFLiteBackend:
+    """Intérprete TFLite (float32, float16 o int8 cuantizado)
+
+    Cambiar el tamaño de lote de un intérprete obliga a reservar de nuevo
+    todos sus tensores. En lugar de eso, cada lote se rellena hasta el
+    siguiente tamaño de `BATCH_BUCKETS` y cada tamaño tiene su propio
+    intérprete, reservado una sola vez. Los lotes mayores que el último
+    tamaño se parten.
+    """
+
+    name = 'tflite'
+    supports_embeddings = False
+
+    BATCH_BUCKETS = (1, 4, 8, 16, 32)
+
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+        self._tf = tf
+        self.model_path = model_path
+        self.num_threads = num_threads or os.cpu_count()
+        # tamaño de lote -> _BucketInterpreter; se crean al primer uso
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.input_size = self._bucket(1).input_size
+
+    def _bucket(self, batch_size):
+        bucket_size = next(size for size in self.BATCH_BUCKETS if size >= batch_size)
+        with self._lock:
+            bucket = self._buckets.get(bucket_size)
+            if bucket is None:
+                interpreter = self._tf.lite.Interpreter(
+                    model_path=self.model_path, num_threads=self.num_threads
+                )
+                bucket = _BucketInterpreter(interpreter, bucket_size)
+                self._buckets[bucket_size] = bucket
+        return bucket
+
+    def predict(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        largest = self.BATCH_BUCKETS[-1]
+        if len(images) > largest:
+            return np.concatenate([
+                self.predict(images[start:start + largest])
+                for start in range(0, len(images), largest)
+            ])
+        return self._bucket(len(images)).run(images)
+
+
+class _BucketInterpreter:
+    """Un intérprete TFLite reservado para un tamaño de lote fijo"""
+
+    def __init__(self, interpreter, batch_size):
+        self.interpreter = interpreter
+        self.batch_size = batch_size
+        input_detail = interpreter.get_input_details()[0]
+        if int(input_detail['shape'][0]) != batch_size:
+            shape = list(input_detail['shape'])
+            shape[0] = batch_size
+            interpreter.resize_tensor_input(input_detail['index'], shape)
+        interpreter.allocate_tensors()
+        self.input_detail = interpreter.get_input_details()[0]
+        self.output_detail = interpreter.get_output_details()[0]
+        self.input_size = tuple(int(d) for d in self.input_detail['shape'][1:3])
+        # El intérprete no es seguro entre hilos
+        self._lock = threading.Lock()
+
+    def run(self, images):
+        count = len(images)
+        if count < self.batch_size:
+            padding = np.zeros((self.batch_size - count, *images.shape[1:]), dtype=images.dtype)
+            images = np.concatenate([images, padding])
+
+        input_dtype = self.input_detail['dtype']
+        if input_dtype != np.float32:
+            # Entrada cuantizada: real = (q - zero_point) * scale
+            scale, zero_point = self.input_detail['quantization']
+            images = np.round(images / scale + zero_point)
+            info = np.iinfo(input_dtype)
+            images = np.clip(images, info.min, info.max)
+
+        with self._lock:
+            self.interpreter.set_tensor(self.input_detail['index'], images.astype(input_dtype))
+            self.interpreter.invoke()
+            outputs = self.interpreter.get_tensor(self.output_detail['index'])[:count]
+
+        if outputs.dtype != np.float32:
+            scale, zero_point = self.output_detail['quantization']
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
+
+
+def resize_images(images, size):
+    """Adaptar un lote (N, H, W, C) a la resolución de entrada de un modelo"""
+    if not size or None in size or tuple(images.shape[1:3]) == tuple(size):
+        return images
+    import tensorflow as tf
+    return tf.image.resize(images, size, antialias=True).numpy()
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    SavedModelBackend.name: SavedModelBackend,
+    TFLiteBackend.name: TFLiteBackend
+}
+
+
+def detect_backend(model_path):
+    """Deducir el backend a partir de la ruta del modelo"""
+    if model_path.endswith('.tflite'):
+        return TFLiteBackend.name
+    if os.path.isdir(model_path):
+        return SavedModelBackend.name
+    return KerasBackend.name
+
+
+def create_backend(model_path, backend=None):
+    """Instanciar el backend de inferencia indicado (o el deducido de la ruta)"""
+    backend = backend or detect_backend(model_path)
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    return BACKENDS[backend](model_path)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Proceso de inferencia compartido para el modo producción
+
+Un único proceso carga el modelo (una sola copia de TensorFlow en memoria)
+y atiende por un socket Unix local a todos los workers de gunicorn. Las
+predicciones individuales de todos los workers pasan por el mismo
+BatchScheduler, así que el micro-batching también agrupa entre procesos.
+"""
+
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from batching import BatchScheduler
+from model_loader import ModelLoader, decode_image
+from model_registry import ModelRegistry, ModelManager, DEFAULT_REGISTRY_DIR
+
+DEFAULT_SOCKET = '/tmp/agrodetect-inference.sock'
+INFO_CACHE_SECONDS = 1.0
+
+
+class InferenceServer:
+    """Servidor de inferencia sobre multiprocessing.connection (AF_UNIX)"""
+
+    def __init__(self, model_loader, batch_scheduler, address=DEFAULT_SOCKET, authkey=None):
+        self.model_loader = model_loader
+        self.batch_scheduler = batch_scheduler
+        self.address = address
+        self.authkey = authkey
+
+    def _info(self):
+        return {
+            'status': self.model_loader.status,
+            'model_version': self.model_loader.model_version,
+            'class_names': self.model_loader.class_names,
+            'backend': self.model_loader.backend,
+            'batching': self.batch_scheduler.get_stats(),
+            'cascade': self.model_loader.get_cascade_stats()
+        }
+
+    def _handle(self, message):
+        command = message[0]
+        if command == 'info':
+            return self._info()
+        if command == 'predict':
+            images = message[1]
+            if len(images) == 1:
+                # Solicitudes individuales: se agrupan con las de otros workers
+                return [self.batch_scheduler.submit(images[0])]
+            return self.model_loader.predict_batch(images)
+        if command == 'embed':
+            return self.model_loader.embed_batch(message[1])
+        if command == 'models':
+            return self.model_loader.get_swap_status()
+        if command == 'activate':
+            return self.model_loader.activate(message[1])
+        if command == 'rollback':
+            return self.model_loader.rollback()
+        raise ValueError(f"Comando desconocido: {command}")
+
+    def _serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    connection.send(('ok', self._handle(message)))
+                except Exception as e:
+                    connection.send(('error', str(e)))
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        with Listener(self.address, family='AF_UNIX', authkey=self.authkey) as listener:
+            print(f"🔌 Servidor de inferencia escuchando en {self.address}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    print(f"⚠️ Conexión rechazada: {e}")
+                    continue
+                threading.Thread(
+                    target=self._serve_connection, args=(connection,), daemon=True
+                ).start()
+
+
+class RemoteModelLoader:
+    """Cliente con la misma interfaz que ModelLoader y BatchScheduler
+
+    Cada hilo del worker mantiene su propia conexión al proceso de
+    inferencia; la decodificación de imágenes sigue ocurriendo en el worker.
+    """
+
+    def __init__(self, address=DEFAULT_SOCKET, authkey=None):
+        self.address = address
+        self.authkey = authkey
+        self.model_path = address
+        self._local = threading.local()
+        self._info = None
+        self._info_at = 0.0
+
+    def _call(self, *message):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            self._local.connection = connection
+        try:
+            connection.send(message)
+            status, payload = connection.recv()
+        except (EOFError, OSError):
+            self._local.connection = None
+            raise
+        if status != 'ok':
+            raise RuntimeError(payload)
+        return payload
+
+    def info(self):
+        """Estado del proceso de inferencia (con caché breve)"""
+        now = time.monotonic()
+        if self._info is None or now - self._info_at > INFO_CACHE_SECONDS:
+            try:
+                self._info = self._call('info')
+            except (OSError, EOFError):
+                # El proceso de inferencia aún no abrió el socket
+                self._info = {'status': ModelLoader.STATUS_STARTING, 'model_version': None,
+                              'class_names': [], 'backend': None, 'batching': None,
+                              'cascade': None}
+            self._info_at = now
+        return self._info
+
+    @property
+    def status(self):
+        return self.info()['status']
+
+    @property
+    def is_ready(self):
+        return self.status == ModelLoader.STATUS_READY
+
+    @property
+    def model_version(self):
+        return self.info()['model_version']
+
+    @property
+    def class_names(self):
+        return self.info()['class_names']
+
+    @property
+    def backend(self):
+        return self.info()['backend']
+
+    def preprocess_image(self, image):
+        """Decodificar en el worker; solo el arreglo viaja por el socket"""
+        return decode_image(image)[None, ...]
+
+    def predict_batch(self, images):
+        return self._call('predict', images)
+
+    def embed_batch(self, images):
+        return self._call('embed', images)
+
+    def submit(self, image):
+        """Equivalente remoto de BatchScheduler.submit"""
+        return self._call('predict', image[None, ...])[0]
+
+    def get_stats(self):
+        return self.info()['batching']
+
+    def get_cascade_stats(self):
+        return self.info()['cascade']
+
+    def get_swap_status(self):
+        return self._call('models')
+
+    def activate(self, version):
+        """Pedir al proceso de inferencia que prepare y active otra versión"""
+        self._info = None
+        return self._call('activate', version)
+
+    def rollback(self):
+        self._info = None
+        return self._call('rollback')
+
+
+def main():
+    address = os.environ.get('INFERENCE_SOCKET', DEFAULT_SOCKET)
+    authkey = os.environ.get('INFERENCE_AUTHKEY', '').encode('utf-8') or None
+    batch_max_size = int(os.environ.get('BATCH_MAX_SIZE', 16))
+    warmup_sizes = (1, batch_max_size, int(os.environ.get('PREDICT_BATCH_SIZE', 32)),
+                    int(os.environ.get('TILE_BATCH_SIZE', 16)))
+    embeddings = os.environ.get('EMBEDDINGS_ENABLED', '1') == '1'
+    model_loader = ModelManager(
+        ModelRegistry(os.environ.get('MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR)),
+        loader_options={'embeddings': embeddings},
+        warmup_batch_sizes=warmup_sizes,
+        # Sin versión activa en el registro se usa MODEL_PATH
+        initial_loader=ModelLoader(
+            os.environ.get('MODEL_PATH', 'models/mejor_modelo_cultivos.h5'),
+            backend=os.environ.get('MODEL_BACKEND') or None,
+            autoload=False,
+            fast_model_path=os.environ.get('FAST_MODEL_PATH') or None,
+            fast_backend=os.environ.get('FAST_MODEL_BACKEND') or None,
+            cascade_threshold=float(os.environ['CASCADE_THRESHOLD']) if os.environ.get('CASCADE_THRESHOLD') else None,
+            embeddings=embeddings
+        )
+    )
+    batch_scheduler = BatchScheduler(
+        model_loader.predict_batch,
+        max_batch_size=batch_max_size,
+        max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS', 8))
+    )
+    # Aceptar conexiones de inmediato; los workers verán 'starting'/'warming'
+    threading.Thread(target=model_loader.load_and_warmup, daemon=True).start()
+    InferenceServer(model_loader, batch_scheduler, address, authkey).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites de los histogramas de latencia (segundos)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _process_alive(pid):
+    if os.name != 'posix':
+        # En Windows os.kill terminaría el proceso: se asume vivo
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Cómo se combinan las series de varios procesos (ver MetricsRegistry):
+# 'sum' suma todos, también los que ya terminaron (contadores: nunca bajan);
+# 'livesum' suma solo los procesos vivos (valores instantáneos propios);
+# 'max' toma el mayor entre los vivos (valores que todos leen del mismo
+# proceso de inferencia y sumarlos los multiplicaría)
+MULTIPROCESS_MODES = ('sum', 'livesum', 'max')
+
+
+class _Metric:
+    """Base de las métricas con etiquetas"""
+
+    metric_type = None
+    multiprocess_mode = 'sum'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *labelvalues):
+        """Serie hija para una combinación de valores de etiquetas"""
+        key = tuple(str(value) for value in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self):
+        return list(self._children.items())
+
+    def collect(self):
+        """Series actuales como [(valores_de_etiquetas, valor)]"""
+        return [(labelvalues, child.value()) for labelvalues, child in self._series()]
+
+    def _render_sample(self, labelvalues, value):
+        return [f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}']
+
+    def render(self, samples=None):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.metric_type}']
+        for labelvalues, value in (self.collect() if samples is None else samples):
+            lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        return self._value
+
+
+class Counter(_Metric):
+    """Contador monótono"""
+
+    metric_type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja (p. ej. solicitudes en curso)"""
+
+    metric_type = 'gauge'
+    multiprocess_mode = 'livesum'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class CallbackMetric(_Metric):
+    """Métrica cuyo valor se lee al exportar (de estadísticas que ya lleva
+    otro componente); `callback` devuelve un número o una lista de
+    (valores_de_etiquetas, número)"""
+
+    def __init__(self, name, documentation, callback, labelnames=(), metric_type='gauge',
+                 multiprocess_mode=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.metric_type = metric_type
+        self.multiprocess_mode = multiprocess_mode or \
+            ('sum' if metric_type == 'counter' else 'livesum')
+
+    def collect(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        series = value if isinstance(value, list) else [((), value)]
+        return [(tuple(str(label) for label in labelvalues), number)
+                for labelvalues, number in series]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def value(self):
+        """Conteos por intervalo (no acumulados) seguidos de la suma"""
+        with self._lock:
+            return self._counts + [self._sum]
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con límites fijos"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_sample(self, labelvalues, value):
+        counts, total_sum = value[:-1], value[-1]
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(bound)))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total_sum)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas exportadas en formato de texto de Prometheus
+
+    Con `multiprocess_dir` (workers de gunicorn) cada proceso guarda sus
+    series en `<pid>.json` dentro de esa carpeta cada `write_interval`
+    segundos y al exportar; `render` combina los archivos de todos los
+    procesos según el `multiprocess_mode` de cada métrica, así que cualquier
+    worker que atienda /metrics devuelve las cifras de todo el servidor y
+    los contadores no retroceden al cambiar de worker. La carpeta debe
+    vaciarse al reiniciar el servidor (run_app.py lo hace).
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, multiprocess_dir=None, write_interval=1.0):
+        self._metrics = []
+        self._lock = threading.Lock()
+        self.multiprocess_dir = multiprocess_dir
+        self.write_interval = write_interval
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+            threading.Thread(target=self._run, name='metrics-writer', daemon=True).start()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def callback(self, name, documentation, callback, labelnames=(), metric_type='gauge',
+                 multiprocess_mode=None):
+        return self.register(CallbackMetric(name, documentation, callback, labelnames, metric_type,
+                                            multiprocess_mode))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def _registered(self):
+        with self._lock:
+            return list(self._metrics)
+
+    def _run(self):
+        while True:
+            time.sleep(self.write_interval)
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                print(f"⚠️ Error guardando métricas del proceso: {e}")
+
+    def write_snapshot(self):
+        """Guardar las series de este proceso (escritura temporal + rename)"""
+        data = json.dumps({
+            'pid': os.getpid(),
+            'metrics': {metric.name: [[list(labelvalues), value] for labelvalues, value in metric.collect()]
+                        for metric in self._registered()}
+        })
+        path = os.path.join(self.multiprocess_dir, f'{os.getpid()}.json')
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+    def _read_snapshots(self):
+        """[(pid, vivo, métricas)] de todos los procesos que escribieron"""
+        snapshots = []
+        for name in os.listdir(self.multiprocess_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, name), 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            pid = snapshot['pid']
+            alive = pid == os.getpid() or _process_alive(pid)
+            snapshots.append((pid, alive, snapshot['metrics']))
+        return snapshots
+
+    @staticmethod
+    def _merge(metric, snapshots):
+        merged = {}
+        for _, alive, metrics in snapshots:
+            if not alive and metric.multiprocess_mode != 'sum':
+                continue
+            for labelvalues, value in metrics.get(metric.name, []):
+                key = tuple(labelvalues)
+                current = merged.get(key)
+                if current is None:
+                    merged[key] = value
+                elif isinstance(value, list):
+                    merged[key] = [a + b for a, b in zip(current, value)]
+                elif metric.multiprocess_mode == 'max':
+                    merged[key] = max(current, value)
+                else:
+                    merged[key] = current + value
+        return sorted(merged.items())
+
+    def render(self):
+        metrics = self._registered()
+        lines = []
+        if not self.multiprocess_dir:
+            for metric in metrics:
+                lines.extend(metric.render())
+            return '\n'.join(lines) + '\n'
+
+        self.write_snapshot()
+        snapshots = self._read_snapshots()
+        for metric in metrics:
+            lines.extend(metric.render(self._merge(metric, snapshots)))
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """Mide etapas de una solicitud; una etapa medida varias veces se suma.
+    Al terminar alimenta el histograma y arma la cabecera Server-Timing"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    def observe(self):
+        for name, elapsed in self.timings.items():
+            self.histogram.labels(name).observe(elapsed)
+
+    def server_timing_header(self):
+        return ', '.join(f'{name};dur={elapsed * 1000.0:.2f}' for name, elapsed in self.timings.items())
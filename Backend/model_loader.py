@@ -1,41 +1,181 @@
-import tensorflow as tf
 import numpy as np
+import hashlib
+import io
 import os
+import threading
+import time
 from PIL import Image
 
+from inference_backends import create_backend, detect_backend, resize_images
+
+IMAGE_SIZE = (224, 224)
+
+# Clases del modelo entrenado en el notebook (orden de salida de la red);
+# los modelos del registro traen su propia lista en el manifiesto
+DEFAULT_CLASS_NAMES = [
+    'Tomato___Bacterial_spot', 'Tomato___Early_blight', 'Tomato___Late_blight',
+    'Tomato___Leaf_Mold', 'Tomato___Septoria_leaf_spot', 'Tomato___Spider_mites',
+    'Tomato___Target_Spot', 'Tomato___Tomato_Yellow_Leaf_Curl_Virus',
+    'Tomato___Tomato_mosaic_virus', 'Tomato___healthy'
+]
+
+# Clases más probables que acompañan cada resultado (y que guarda el log)
+TOP_K = 3
+
+
+def top_predictions(probabilities, class_names, k=TOP_K):
+    """Las `k` clases más probables como pares [nombre, probabilidad]"""
+    probabilities = np.asarray(probabilities)
+    order = np.argsort(probabilities)[::-1][:k]
+    return [[class_names[i], float(probabilities[i])] for i in order]
+
+
+def decode_image(source, target_size=IMAGE_SIZE, normalize=True):
+    """Decodificar una imagen desde ruta, bytes o buffer a un arreglo RGB float32
+
+    Para JPEG se usa el modo draft de Pillow, que reduce la escala durante la
+    decodificación en lugar de decodificar la foto completa y luego reducirla.
+    Con `normalize=False` se devuelve uint8 sin escalar (4 veces más liviano
+    para enviar entre procesos).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    with Image.open(source) as img:
+        # Solo tiene efecto en JPEG: decodifica a 1/2, 1/4 u 1/8 de resolución
+        img.draft('RGB', target_size)
+        # Normalizar a 3 canales (RGBA, escala de grises, paleta...)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = img.resize(target_size)
+
+        if not normalize:
+            return np.asarray(img, dtype=np.uint8)
+        img_array = np.asarray(img, dtype=np.float32)
+    img_array *= 1.0 / 255.0
+    return img_array
+
+
 class ModelLoader:
-    def __init__(self, model_path):
+    # Estados del ciclo de arranque (reportados en /api/health)
+    STATUS_STARTING = 'starting'
+    STATUS_WARMING = 'warming'
+    STATUS_READY = 'ready'
+    STATUS_ERROR = 'error'
+
+    # Etapa de la cascada que respondió cada predicción
+    STAGE_FAST = 'fast'
+    STAGE_FULL = 'full'
+
+    def __init__(self, model_path, backend=None, autoload=True,
+                 fast_model_path=None, fast_backend=None, cascade_threshold=None,
+                 embeddings=False, class_names=None, model_version=None):
         self.model = None
+        self.status = self.STATUS_STARTING
+        self.load_error = None
         self.model_path = model_path
-        self.class_names = [
-            'Tomato___Bacterial_spot', 'Tomato___Early_blight', 'Tomato___Late_blight',
-            'Tomato___Leaf_Mold', 'Tomato___Septoria_leaf_spot', 'Tomato___Spider_mites',
-            'Tomato___Target_Spot', 'Tomato___Tomato_Yellow_Leaf_Curl_Virus', 
-            'Tomato___Tomato_mosaic_virus', 'Tomato___healthy',
-            'Corn___Common_rust', 'Corn___Northern_Leaf_Blight', 'Corn___healthy',
-            'Potato___Early_blight', 'Potato___Late_blight', 'Potato___healthy'
-        ]
-        self.load_model()
+        # 'keras', 'saved_model' o 'tflite' (por defecto se deduce de la ruta)
+        self.backend = backend or detect_backend(model_path)
+        self.model_version = None
+        # Versión fija (la del registro); sin ella se deriva del archivo
+        self._fixed_version = model_version
+        # Adjuntar a cada resultado el embedding de la penúltima capa ('embedding')
+        # cuando el backend lo permite; quien lo consume debe retirarlo
+        self.embeddings = embeddings
+
+        # Cascada opcional: un modelo rápido responde primero y solo las
+        # imágenes con confianza menor al umbral pasan al modelo completo
+        self.fast_model = None
+        self.fast_model_path = fast_model_path
+        self.fast_backend = (fast_backend or detect_backend(fast_model_path)) if fast_model_path else None
+        self.cascade_threshold = cascade_threshold if cascade_threshold is not None \
+            else AgroAssistant.HIGH_CONFIDENCE
+        self._cascade_lock = threading.Lock()
+        self._cascade_images = 0
+        self._cascade_escalated = 0
+        self._cascade_saved_seconds = 0.0
+        # Estimación (media móvil) del costo del modelo completo por tamaño de lote
+        self._full_batch_seconds = {}
+        self.class_names = list(class_names or DEFAULT_CLASS_NAMES)
+        if autoload:
+            self.load_model()
+    
+    def _load_backend(self):
+        try:
+            self.model = create_backend(self.model_path, self.backend)
+            if self.fast_model_path:
+                self.fast_model = create_backend(self.fast_model_path, self.fast_backend)
+            self.model_version = self._compute_version()
+            print(f"✅ Modelo cargado exitosamente (backend: {self.backend})")
+            if self.fast_model is not None:
+                print(f"✅ Cascada activa: {self.fast_model_path} "
+                      f"(umbral de confianza {self.cascade_threshold})")
+        except Exception as e:
+            self.status = self.STATUS_ERROR
+            self.load_error = str(e)
+            print(f"❌ Error cargando modelo: {e}")
+            raise e
     
     def load_model(self):
         """Cargar el modelo entrenado"""
+        self._load_backend()
+        self.status = self.STATUS_READY
+    
+    def load_and_warmup(self, batch_sizes=(1,)):
+        """Cargar el modelo y ejecutarlo con lotes ficticios antes de aceptar tráfico"""
+        self.status = self.STATUS_STARTING
+        self._load_backend()
+        self.warmup(batch_sizes)
+    
+    def warmup(self, batch_sizes=(1,)):
+        """Trazar el grafo y reservar memoria para cada tamaño de lote configurado"""
+        self.status = self.STATUS_WARMING
         try:
-            self.model = tf.keras.models.load_model(self.model_path)
-            print("✅ Modelo cargado exitosamente")
+            for batch_size in sorted(set(batch_sizes)):
+                images = np.zeros((batch_size, *IMAGE_SIZE, 3), dtype=np.float32)
+                # Cada etapa por separado: los ceros no garantizan escalar
+                if self.fast_model is not None:
+                    self._check_outputs(self.fast_model.predict(
+                        resize_images(images, self.fast_model.input_size)))
+                self._check_outputs(self.model.predict(images))
+                # Segunda pasada ya trazada: referencia para medir el ahorro de la cascada
+                started = time.perf_counter()
+                self.model.predict(images)
+                self._full_batch_seconds[batch_size] = time.perf_counter() - started
         except Exception as e:
-            print(f"❌ Error cargando modelo: {e}")
+            self.status = self.STATUS_ERROR
+            self.load_error = str(e)
             raise e
+        self.status = self.STATUS_READY
+    
+    def _check_outputs(self, outputs):
+        """Detectar un modelo cuyas salidas no coinciden con los nombres de clase"""
+        if outputs.shape[-1] != len(self.class_names):
+            raise ValueError(f"El modelo produce {outputs.shape[-1]} clases pero se "
+                             f"declararon {len(self.class_names)} nombres")
+    
+    @property
+    def is_ready(self):
+        return self.status == self.STATUS_READY
     
-    def preprocess_image(self, image_path):
-        """Preprocesar imagen para el modelo"""
+    def _compute_version(self):
+        """Identificador del modelo cargado (backend, ruta, tamaño y fecha de modificación)"""
+        if self._fixed_version:
+            return self._fixed_version
+        stat = os.stat(self.model_path)
+        fingerprint = f"{self.backend}:{os.path.abspath(self.model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if self.fast_model_path:
+            # Con cascada las respuestas dependen también del modelo rápido y del umbral
+            fast_stat = os.stat(self.fast_model_path)
+            fingerprint += (f"|{self.fast_backend}:{os.path.abspath(self.fast_model_path)}:"
+                            f"{fast_stat.st_size}:{fast_stat.st_mtime_ns}:{self.cascade_threshold}")
+        return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:12]
+    
+    def preprocess_image(self, image):
+        """Preprocesar imagen para el modelo (ruta, bytes o buffer en memoria)"""
         try:
-            # Cargar y redimensionar imagen
-            img = Image.open(image_path)
-            img = img.resize((224, 224))
-            
-            # Convertir a array y normalizar
-            img_array = np.array(img)
-            img_array = img_array / 255.0
+            # Decodificar, redimensionar y normalizar
+            img_array = decode_image(image)
             
             # Agregar dimensión del batch
             img_array = np.expand_dims(img_array, axis=0)
@@ -45,25 +185,116 @@ class ModelLoader:
             print(f"❌ Error preprocesando imagen: {e}")
             raise e
     
-    def predict(self, image_path):
-        """Realizar predicción en una imagen"""
+    def predict_batch(self, images):
+        """Realizar predicción sobre un lote de imágenes preprocesadas (N, H, W, C)"""
+        try:
+            if self.fast_model is not None:
+                return self._predict_cascade(images)
+            predictions, embeddings = self._predict_full(images)
+            results = [self._format_prediction(row) for row in predictions]
+            self._attach_embeddings(results, embeddings)
+            return results
+        except Exception as e:
+            print(f"❌ Error en predicción por lotes: {e}")
+            raise e
+
+    def _predict_full(self, images):
+        """Probabilidades del modelo completo y, si se piden, sus embeddings"""
+        if self.embeddings and getattr(self.model, 'supports_embeddings', False):
+            return self.model.predict_with_embeddings(images)
+        return self.model.predict(images), None
+
+    def embed_batch(self, images):
+        """Solo los embeddings del modelo completo (consultas de casos parecidos)"""
+        if not getattr(self.model, 'supports_embeddings', False):
+            raise ValueError(f"El backend {self.backend} no expone embeddings")
+        return self.model.predict_with_embeddings(images)[1]
+
+    @staticmethod
+    def _attach_embeddings(results, embeddings, indices=None):
+        if embeddings is None:
+            return
+        indices = range(len(results)) if indices is None else indices
+        for index, embedding in zip(indices, embeddings):
+            # Se normaliza y reduce a float16 recién en el índice
+            results[index]['embedding'] = embedding
+
+    def _predict_cascade(self, images):
+        """Primera pasada con el modelo rápido; escalar solo las dudosas"""
+        started = time.perf_counter()
+        fast_predictions = self.fast_model.predict(resize_images(images, self.fast_model.input_size))
+        fast_seconds = time.perf_counter() - started
+
+        results = [self._format_prediction(row, self.STAGE_FAST) for row in fast_predictions]
+        escalate = np.flatnonzero(fast_predictions.max(axis=1) < self.cascade_threshold)
+        full_seconds = 0.0
+        if escalate.size:
+            started = time.perf_counter()
+            full_predictions, embeddings = self._predict_full(images[escalate])
+            full_seconds = time.perf_counter() - started
+            for index, row in zip(escalate, full_predictions):
+                results[index] = self._format_prediction(row, self.STAGE_FULL)
+            # Solo el modelo completo aporta embeddings comparables entre sí
+            self._attach_embeddings(results, embeddings, escalate)
+
+        with self._cascade_lock:
+            if escalate.size:
+                previous = self._full_batch_seconds.get(escalate.size)
+                self._full_batch_seconds[escalate.size] = full_seconds if previous is None \
+                    else 0.9 * previous + 0.1 * full_seconds
+            full_estimate = self._estimate_full_seconds(len(images))
+            if full_estimate is not None:
+                # Ahorro = lo que habría costado el modelo completo - lo que costó la cascada
+                self._cascade_saved_seconds += full_estimate - fast_seconds - full_seconds
+            self._cascade_images += len(images)
+            self._cascade_escalated += int(escalate.size)
+        return results
+
+    def _estimate_full_seconds(self, batch_size):
+        """Costo estimado del modelo completo para un lote (tamaño medido más cercano)"""
+        if not self._full_batch_seconds:
+            return None
+        nearest = min(self._full_batch_seconds, key=lambda size: abs(size - batch_size))
+        return self._full_batch_seconds[nearest] * batch_size / nearest
+
+    def get_cascade_stats(self):
+        """Tasa de escalamiento y latencia media ahorrada por imagen"""
+        with self._cascade_lock:
+            images = self._cascade_images
+            return {
+                'enabled': self.fast_model_path is not None,
+                'threshold': self.cascade_threshold,
+                'images': images,
+                'escalated': self._cascade_escalated,
+                'escalation_rate': self._cascade_escalated / images if images else 0.0,
+                'mean_latency_saved_ms': self._cascade_saved_seconds / images * 1000.0 if images else 0.0
+            }
+
+    def _format_prediction(self, probabilities, stage=STAGE_FULL):
+        """Convertir un vector de probabilidades en el resultado de la API"""
+        predicted_class_idx = int(np.argmax(probabilities))
+        confidence = float(probabilities[predicted_class_idx])
+
+        # Obtener nombre de la clase
+        predicted_class = self.class_names[predicted_class_idx]
+
+        return {
+            'class': predicted_class,
+            'confidence': confidence,
+            'all_predictions': probabilities.tolist(),
+            'top_k': top_predictions(probabilities, self.class_names),
+            'stage': stage,
+            'model_version': self.model_version
+        }
+
+    def predict(self, image):
+        """Realizar predicción en una imagen (ruta, bytes o buffer)"""
         try:
             # Preprocesar imagen
-            processed_image = self.preprocess_image(image_path)
+            processed_image = self.preprocess_image(image)
             
             # Realizar predicción
-            predictions = self.model.predict(processed_image)
-            predicted_class_idx = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class_idx])
-            
-            # Obtener nombre de la clase
-            predicted_class = self.class_names[predicted_class_idx]
-            
-            return {
-                'class': predicted_class,
-                'confidence': confidence,
-                'all_predictions': predictions[0].tolist()
-            }
+            return self.predict_batch(processed_image)[0]
             
         except Exception as e:
             print(f"❌ Error en predicción: {e}")
@@ -72,6 +303,10 @@ class ModelLoader:
 class AgroAssistant:
     """Sistema de recomendaciones para agricultores"""
     
+    # Bandas de confianza usadas para ajustar la recomendación
+    LOW_CONFIDENCE = 0.7
+    HIGH_CONFIDENCE = 0.9
+    
     def __init__(self):
         self.recommendations = {
             'Tomato___Bacterial_spot': {
@@ -193,9 +428,9 @@ class AgroAssistant:
             rec['confidence'] = f"{confidence * 100:.2f}%"
             
             # Ajustar recomendación basada en confianza
-            if confidence < 0.7:
+            if confidence < self.LOW_CONFIDENCE:
                 rec['warning'] = 'Baja confianza - considerar nueva evaluación'
-            elif confidence > 0.9:
+            elif confidence > self.HIGH_CONFIDENCE:
                 rec['urgency'] = 'alta'
             
             return rec
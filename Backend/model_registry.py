@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Registro de versiones del modelo y cambio de versión en caliente
+
+Cada versión vive en su propia carpeta con los artefactos y un
+manifiesto (nombres de clase, backend, cascada opcional):
+
+    models/registry/
+        registry.json                  versión activa, anterior e historial
+        2024-06-01/manifest.json
+        2024-06-01/mejor_modelo_cultivos.h5
+
+Ejemplos:
+    python model_registry.py register models/mejor_modelo_cultivos.h5 --version 2024-06-01
+    python model_registry.py list
+    python model_registry.py activate 2024-06-01
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from model_loader import ModelLoader, DEFAULT_CLASS_NAMES
+
+DEFAULT_REGISTRY_DIR = 'models/registry'
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+
+def _write_json(path, data):
+    """Escribir JSON de forma atómica (archivo temporal + rename)"""
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def _copy_artifact(source, destination_dir):
+    """Copiar un archivo o carpeta (SavedModel) dentro de la versión"""
+    destination = os.path.join(destination_dir, os.path.basename(os.path.normpath(source)))
+    if os.path.isdir(source):
+        shutil.copytree(source, destination)
+    else:
+        shutil.copy2(source, destination)
+    return os.path.basename(destination)
+
+
+def _lower_thread_priority(niceness=10):
+    """Bajar la prioridad del hilo actual (Linux) para que la preparación de
+    una versión nueva no le quite CPU a las solicitudes en curso"""
+    if not hasattr(os, 'setpriority') or not hasattr(threading, 'get_native_id'):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except OSError:
+        pass
+
+
+class ModelRegistry:
+    """Carpeta de versiones inmutables más un puntero a la versión activa"""
+
+    MANIFEST = 'manifest.json'
+    STATE = 'registry.json'
+
+    def __init__(self, root=DEFAULT_REGISTRY_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _version_dir(self, version):
+        if not VERSION_PATTERN.match(version or ''):
+            raise ValueError(f"Versión inválida: {version!r}")
+        return os.path.join(self.root, version)
+
+    def _read_state(self):
+        path = os.path.join(self.root, self.STATE)
+        if not os.path.exists(path):
+            return {'active': None, 'previous': None, 'history': []}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_manifest(self, version):
+        """Manifiesto de una versión registrada (KeyError si no existe)"""
+        path = os.path.join(self._version_dir(version), self.MANIFEST)
+        if not os.path.exists(path):
+            raise KeyError(f"Versión no registrada: {version}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def list_versions(self):
+        """Manifiestos de todas las versiones, de la más antigua a la más nueva"""
+        if not os.path.isdir(self.root):
+            return []
+        manifests = []
+        for name in os.listdir(self.root):
+            if os.path.exists(os.path.join(self.root, name, self.MANIFEST)):
+                manifests.append(self.get_manifest(name))
+        return sorted(manifests, key=lambda manifest: (manifest.get('created_at', ''), manifest['version']))
+
+    def active_version(self):
+        return self._read_state()['active']
+
+    def previous_version(self):
+        return self._read_state()['previous']
+
+    def get_state(self):
+        return self._read_state()
+
+    def register(self, model_path, version=None, class_names=None, backend=None,
+                 fast_model_path=None, fast_backend=None, cascade_threshold=None, notes=''):
+        """Copiar los artefactos a una carpeta nueva y escribir su manifiesto
+
+        Las versiones no se sobrescriben: un modelo nuevo es siempre una
+        versión nueva, así que una versión activa nunca cambia bajo los pies.
+        """
+        version = version or time.strftime('%Y%m%d-%H%M%S')
+        version_dir = self._version_dir(version)
+        if os.path.exists(version_dir):
+            raise ValueError(f"La versión {version} ya existe")
+
+        # Armar la versión aparte y publicarla con un rename
+        staging_dir = f'{version_dir}.{os.getpid()}.staging'
+        os.makedirs(staging_dir)
+        try:
+            manifest = {
+                'version': version,
+                'model_file': _copy_artifact(model_path, staging_dir),
+                'backend': backend,
+                'class_names': list(class_names or DEFAULT_CLASS_NAMES),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'notes': notes
+            }
+            if fast_model_path:
+                manifest['fast_model_file'] = _copy_artifact(fast_model_path, staging_dir)
+                manifest['fast_backend'] = fast_backend
+                manifest['cascade_threshold'] = cascade_threshold
+            _write_json(os.path.join(staging_dir, self.MANIFEST), manifest)
+            os.rename(staging_dir, version_dir)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        return manifest
+
+    def set_active(self, version):
+        """Apuntar la versión activa (la anterior queda para rollback)"""
+        self.get_manifest(version)
+        with self._lock:
+            state = self._read_state()
+            if state['active'] != version:
+                state['previous'] = state['active']
+                state['active'] = version
+            state['history'].append({
+                'version': version,
+                'activated_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+            })
+            os.makedirs(self.root, exist_ok=True)
+            _write_json(os.path.join(self.root, self.STATE), state)
+
+    def create_loader(self, version, **options):
+        """ModelLoader (sin cargar) para una versión; `options` son los
+        parámetros del servidor que no dependen del modelo (p. ej. embeddings)"""
+        manifest = self.get_manifest(version)
+        version_dir = self._version_dir(version)
+        fast_model_file = manifest.get('fast_model_file')
+        return ModelLoader(
+            os.path.join(version_dir, manifest['model_file']),
+            backend=manifest.get('backend'),
+            autoload=False,
+            fast_model_path=os.path.join(version_dir, fast_model_file) if fast_model_file else None,
+            fast_backend=manifest.get('fast_backend'),
+            cascade_threshold=manifest.get('cascade_threshold'),
+            class_names=manifest['class_names'],
+            model_version=version,
+            **options
+        )
+
+
+class ModelManager:
+    """Misma interfaz que ModelLoader, con cambio de versión en caliente
+
+    La versión nueva se carga y calienta en un hilo de fondo mientras la
+    actual sigue atendiendo; recién lista se reemplaza la referencia en una
+    sola asignación. Cada llamada lee la referencia una vez al empezar, así
+    que las solicitudes en curso terminan con el modelo con que empezaron.
+    La versión anterior queda cargada para que el rollback sea inmediato.
+    """
+
+    def __init__(self, registry, loader_options=None, warmup_batch_sizes=(1,), initial_loader=None):
+        self.registry = registry
+        self.loader_options = loader_options or {}
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.current = None
+        self.previous = None
+        # Sin versión activa en el registro se atiende con un modelo fijo (MODEL_PATH)
+        self._initial_loader = initial_loader
+        self._swap_lock = threading.Lock()
+        self._pending = None
+        self._last_error = None
+        self._swapped_at = None
+
+    # -- Ciclo de vida ------------------------------------------------------
+
+    def _loader_for(self, version):
+        return self.registry.create_loader(version, **self.loader_options)
+
+    def load_and_warmup(self, batch_sizes=None):
+        """Cargar la versión activa del registro (o el modelo fijo) al arrancar"""
+        if batch_sizes is not None:
+            self.warmup_batch_sizes = batch_sizes
+        version = self.registry.active_version()
+        loader = self._loader_for(version) if version else self._initial_loader
+        if loader is None:
+            self._last_error = f"No hay versión activa en {self.registry.root}"
+            raise RuntimeError(self._last_error)
+        self._initial_loader = loader
+        try:
+            loader.load_and_warmup(self.warmup_batch_sizes)
+        except Exception as e:
+            self._last_error = str(e)
+            raise
+        self.current = loader
+        self._swapped_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def activate(self, version):
+        """Preparar `version` en segundo plano y cambiar a ella al estar lista
+
+        Devuelve False si ya era la versión en uso. Un error de carga deja
+        la versión actual intacta y queda en `get_swap_status()`.
+        """
+        self.registry.get_manifest(version)
+        with self._swap_lock:
+            if self._pending is not None:
+                raise RuntimeError(f"Ya se está preparando la versión {self._pending}")
+            if self.current is not None and self.current.model_version == version:
+                return False
+            self._pending = version
+            self._last_error = None
+        threading.Thread(
+            target=self._prepare_and_swap, args=(version,), name='model-swap', daemon=True
+        ).start()
+        return True
+
+    def _prepare_and_swap(self, version):
+        started = time.perf_counter()
+        _lower_thread_priority()
+        try:
+            print(f"🔄 Preparando versión {version} del modelo...")
+            if self.previous is not None and self.previous.model_version == version:
+                loader = self.previous
+            else:
+                loader = self._loader_for(version)
+                loader.load_and_warmup(self.warmup_batch_sizes)
+            self._swap(loader)
+            self.registry.set_active(version)
+            print(f"✅ Versión {version} activa ({time.perf_counter() - started:.2f} s de preparación)")
+        except Exception as e:
+            self._last_error = f"{version}: {e}"
+            print(f"❌ No se pudo activar la versión {version}: {e}")
+        finally:
+            with self._swap_lock:
+                self._pending = None
+
+    def _swap(self, loader):
+        # Una sola asignación: las llamadas nuevas ya ven el modelo nuevo
+        self.previous, self.current = self.current, loader
+        self._swapped_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def rollback(self):
+        """Volver a la versión anterior; inmediato si sigue cargada en memoria"""
+        with self._swap_lock:
+            if self._pending is not None:
+                raise RuntimeError(f"Ya se está preparando la versión {self._pending}")
+            loader = self.previous
+            if loader is not None and loader.is_ready:
+                self._swap(loader)
+                self._last_error = None
+                if loader.model_version and self._is_registered(loader.model_version):
+                    self.registry.set_active(loader.model_version)
+                return loader.model_version
+        version = self.registry.previous_version()
+        if not version:
+            raise RuntimeError("No hay versión anterior a la cual volver")
+        self.activate(version)
+        return version
+
+    def _is_registered(self, version):
+        try:
+            self.registry.get_manifest(version)
+            return True
+        except (KeyError, ValueError):
+            return False
+
+    def get_swap_status(self):
+        current = self.current
+        previous = self.previous
+        return {
+            'active': current.model_version if current else None,
+            'previous': previous.model_version if previous else None,
+            'pending': self._pending,
+            'last_error': self._last_error,
+            'swapped_at': self._swapped_at
+        }
+
+    # -- Interfaz de ModelLoader --------------------------------------------
+
+    def snapshot(self):
+        """ModelLoader en uso; quien hace varias llamadas lo fija con esto"""
+        return self.current or self._initial_loader
+
+    @property
+    def status(self):
+        loader = self.snapshot()
+        if loader is None:
+            return ModelLoader.STATUS_ERROR if self._last_error else ModelLoader.STATUS_STARTING
+        return loader.status
+
+    @property
+    def is_ready(self):
+        return self.current is not None and self.current.is_ready
+
+    @property
+    def load_error(self):
+        loader = self.snapshot()
+        return self._last_error or (loader.load_error if loader else None)
+
+    @property
+    def model_version(self):
+        current = self.current
+        return current.model_version if current else None
+
+    @property
+    def class_names(self):
+        loader = self.snapshot()
+        return loader.class_names if loader else []
+
+    @property
+    def backend(self):
+        loader = self.snapshot()
+        return loader.backend if loader else None
+
+    def preprocess_image(self, image):
+        return self.snapshot().preprocess_image(image)
+
+    def predict_batch(self, images):
+        return self.current.predict_batch(images)
+
+    def embed_batch(self, images):
+        return self.current.embed_batch(images)
+
+    def predict(self, image):
+        return self.current.predict(image)
+
+    def get_cascade_stats(self):
+        current = self.current
+        return current.get_cascade_stats() if current else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Registro de versiones del modelo')
+    parser.add_argument('--registry', default=os.environ.get('MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    register = subparsers.add_parser('register', help='Registrar un modelo como versión nueva')
+    register.add_argument('model_path')
+    register.add_argument('--version', help='Nombre de la versión (por defecto la fecha y hora)')
+    register.add_argument('--backend', choices=['keras', 'saved_model', 'tflite'])
+    register.add_argument('--classes', help='Archivo JSON con la lista de clases en orden de salida')
+    register.add_argument('--fast-model', help='Modelo rápido de la cascada')
+    register.add_argument('--fast-backend', choices=['keras', 'saved_model', 'tflite'])
+    register.add_argument('--cascade-threshold', type=float)
+    register.add_argument('--notes', default='')
+    register.add_argument('--activate', action='store_true',
+                          help='Dejarla como activa (la toma el próximo arranque o /api/models/activate)')
+
+    subparsers.add_parser('list', help='Listar versiones')
+
+    activate = subparsers.add_parser('activate', help='Marcar la versión activa para el próximo arranque')
+    activate.add_argument('version')
+
+    args = parser.parse_args()
+    registry = ModelRegistry(args.registry)
+
+    if args.command == 'register':
+        class_names = None
+        if args.classes:
+            with open(args.classes, 'r', encoding='utf-8') as f:
+                class_names = json.load(f)
+        manifest = registry.register(
+            args.model_path, version=args.version, class_names=class_names,
+            backend=args.backend, fast_model_path=args.fast_model,
+            fast_backend=args.fast_backend, cascade_threshold=args.cascade_threshold,
+            notes=args.notes
+        )
+        print(f"✅ Versión {manifest['version']} registrada ({len(manifest['class_names'])} clases)")
+        if args.activate:
+            registry.set_active(manifest['version'])
+            print(f"✅ Versión {manifest['version']} activa")
+    elif args.command == 'list':
+        state = registry.get_state()
+        for manifest in registry.list_versions():
+            marker = '*' if manifest['version'] == state['active'] else ' '
+            print(f"{marker} {manifest['version']:<24} {manifest['created_at']}  "
+                  f"{manifest['model_file']}  {len(manifest['class_names'])} clases  {manifest.get('notes', '')}")
+    elif args.command == 'activate':
+        registry.set_active(args.version)
+        print(f"✅ Versión {args.version} activa")
+
+
+if __name__ == '__main__':
+    main()
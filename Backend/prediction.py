@@ -1,40 +1,465 @@
+import atexit
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import json
 
+try:
+    import fcntl
+except ImportError:  # Windows: solo protección entre hilos del mismo proceso
+    fcntl = None
+
 class PredictionLogger:
-    """Sistema de logging para predicciones"""
-    
-    def __init__(self, log_file='predictions_log.json'):
-        self.log_file = log_file
-    
-    def log_prediction(self, image_filename, prediction_result, recommendation):
-        """Registrar predicción en archivo JSON"""
-        log_entry = {
+    """Sistema de logging para predicciones
+
+    Cada predicción se agrega como una línea JSON (JSON Lines) al segmento
+    activo dentro de `log_dir`, por lo que escribir cuesta lo mismo con 10
+    entradas que con 10 millones. Los segmentos rotan al superar
+    `max_segment_bytes` o `max_segment_age` segundos. El archivo JSON
+    heredado (`legacy_file`) se importa una única vez.
+
+    Varios procesos (los workers de gunicorn) pueden escribir en la misma
+    carpeta: cada agregado, la rotación, la reparación del último segmento
+    y la importación del log heredado se serializan con flock sobre
+    `.lock`. La rotación se decide con el tamaño real del archivo y cada
+    escritor sigue al segmento más nuevo, así que solo se escribe en el
+    último segmento: los lectores (estadísticas, historial) nunca tienen
+    que volver a uno anterior.
+    """
+
+    SEGMENT_PREFIX = 'segment-'
+    SEGMENT_SUFFIX = '.jsonl'
+    LOCK_FILE = '.lock'
+    # Presente una vez importado el log heredado (aunque falle el renombrado)
+    LEGACY_MARKER = '.legacy_imported'
+
+    def __init__(self, log_dir='predictions_log', legacy_file='predictions_log.json',
+                 max_segment_bytes=64 * 1024 * 1024, max_segment_age=24 * 3600,
+                 fsync=False):
+        self.log_dir = log_dir
+        self.legacy_file = legacy_file
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_index = 0
+        self._segment_size = 0
+        self._segment_opened_at = 0.0
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._lock_file = open(os.path.join(self.log_dir, self.LOCK_FILE), 'a+')
+        with self._lock, self._file_lock():
+            self._open_last_segment()
+            self._import_legacy_log()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusión entre procesos que escriben en `log_dir`"""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _segment_path(self, index):
+        return os.path.join(
+            self.log_dir, f"{self.SEGMENT_PREFIX}{index:06d}{self.SEGMENT_SUFFIX}"
+        )
+
+    def list_segments(self):
+        """Rutas de los segmentos existentes, en orden"""
+        names = sorted(
+            name for name in os.listdir(self.log_dir)
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX)
+        )
+        return [os.path.join(self.log_dir, name) for name in names]
+
+    def _open_last_segment(self):
+        """Abrir el último segmento, descartando una línea incompleta tras un fallo"""
+        segments = self.list_segments()
+        if not segments:
+            self._open_segment(1)
+            return
+
+        last = segments[-1]
+        self._repair_tail(last)
+        index = int(os.path.basename(last)[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)])
+        self._open_segment(index)
+        self._segment_opened_at = self._first_entry_time(last)
+
+    def _follow_rotation(self):
+        """Pasar al segmento más nuevo si otro proceso ya rotó"""
+        while os.path.exists(self._segment_path(self._segment_index + 1)):
+            self._open_segment(self._segment_index + 1)
+            self._segment_opened_at = self._first_entry_time(self._segment_path(self._segment_index))
+
+    def _first_entry_time(self, path):
+        """Momento de la primera entrada del segmento (para rotar por antigüedad)"""
+        with open(path, 'r', encoding='utf-8') as f:
+            first_line = f.readline()
+        try:
+            return datetime.fromisoformat(json.loads(first_line)['timestamp']).timestamp()
+        except (ValueError, KeyError, TypeError):
+            return time.time()
+
+    def _repair_tail(self, path):
+        """Truncar el segmento hasta el último salto de línea completo"""
+        size = os.path.getsize(path)
+        if size == 0:
+            return
+        with open(path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b'\n':
+                return
+            # Retroceder por bloques hasta encontrar el último '\n'
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                position -= step
+                f.seek(position)
+                chunk = f.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    f.truncate(position + newline + 1)
+                    print(f"⚠️ Línea incompleta descartada en {path}")
+                    return
+            f.truncate(0)
+
+    def _open_segment(self, index):
+        if self._file is not None:
+            self._file.close()
+        path = self._segment_path(index)
+        self._file = open(path, 'ab')
+        self._segment_index = index
+        self._segment_size = self._file.tell()
+        self._segment_opened_at = time.time()
+
+    def _should_rotate(self):
+        if self._segment_size == 0:
+            return False
+        if self._segment_size >= self.max_segment_bytes:
+            return True
+        return self.max_segment_age is not None and \
+            time.time() - self._segment_opened_at >= self.max_segment_age
+
+    def _import_legacy_log(self):
+        """Importar una vez el arreglo JSON heredado y renombrarlo
+
+        Se llama con el flock tomado: si varios workers arrancan a la vez,
+        solo el primero importa; los demás ya encuentran la marca.
+        """
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+        marker = os.path.join(self.log_dir, self.LEGACY_MARKER)
+        if not os.path.exists(marker):
+            try:
+                with open(self.legacy_file, 'r') as f:
+                    legacy_logs = json.load(f)
+            except json.JSONDecodeError:
+                print(f"⚠️ Log heredado ilegible, se omite: {self.legacy_file}")
+                return
+
+            self._write(self._encode(legacy_logs))
+            with open(marker, 'w', encoding='utf-8') as f:
+                f.write(os.path.abspath(self.legacy_file) + '\n')
+            print(f"✅ Importadas {len(legacy_logs)} predicciones desde {self.legacy_file}")
+        os.replace(self.legacy_file, self.legacy_file + '.migrated')
+
+    @staticmethod
+    def _encode(entries):
+        return b''.join(
+            json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+            for entry in entries
+        )
+
+    def _write(self, data):
+        """Escribir al final del último segmento; requiere ambos locks"""
+        if not data:
+            return
+        self._follow_rotation()
+        # Otros procesos también agregan: el tamaño se toma del archivo
+        self._segment_size = os.fstat(self._file.fileno()).st_size
+        if self._should_rotate():
+            self._open_segment(self._segment_index + 1)
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._segment_size += len(data)
+
+    def append_many(self, entries):
+        """Agregar varias entradas con una sola escritura"""
+        if not entries:
+            return
+        data = self._encode(entries)
+        with self._lock, self._file_lock():
+            self._write(data)
+
+    @staticmethod
+    def make_entry(image_filename, prediction_result, cache_key=None, class_names=None):
+        """Construir una entrada del log
+
+        Solo lo que usan las estadísticas y el historial: clase, confianza,
+        versión del modelo y el vector completo de probabilidades por nombre
+        de clase (los modelos del registro pueden ordenar sus clases de otra
+        forma). Ni la recomendación, que AgroAssistant reconstruye a partir
+        de la clase y la confianza, ni el mapa de calor de las teselas.
+        `class_names` son las clases del modelo, en el orden del vector;
+        `cache_key` identifica el contenido de la imagen (el hash de la
+        caché de predicciones).
+        """
+        entry = {
             'timestamp': datetime.now().isoformat(),
             'image_filename': image_filename,
-            'prediction': prediction_result,
-            'recommendation': recommendation
+            'prediction': {
+                'class': prediction_result['class'],
+                'confidence': prediction_result['confidence'],
+                'model_version': prediction_result.get('model_version'),
+                'probabilities': PredictionLogger._named_probabilities(prediction_result, class_names)
+            }
         }
-        
-        # Cargar logs existentes o crear nuevo archivo
-        logs = []
-        if os.path.exists(self.log_file):
-            try:
-                with open(self.log_file, 'r') as f:
-                    logs = json.load(f)
-            except json.JSONDecodeError:
-                logs = []
-        
-        # Agregar nueva entrada
-        logs.append(log_entry)
-        
-        # Guardar logs
-        with open(self.log_file, 'w') as f:
-            json.dump(logs, f, indent=2)
-        
+        if cache_key:
+            entry['cache_key'] = cache_key
+        return entry
+
+    @staticmethod
+    def _named_probabilities(prediction_result, class_names):
+        """{clase: probabilidad} del vector completo
+
+        Si los nombres no corresponden al vector (cambió el modelo activo
+        entre la inferencia y el registro), quedan solo las clases con
+        nombre conocido: las más probables o, como mínimo, la predicha.
+        """
+        vector = prediction_result.get('all_predictions')
+        if class_names and isinstance(vector, list) and len(vector) == len(class_names) and \
+                class_names[max(range(len(vector)), key=vector.__getitem__)] == prediction_result['class']:
+            pairs = zip(class_names, vector)
+        else:
+            pairs = prediction_result.get('top_k') or \
+                [[prediction_result['class'], prediction_result['confidence']]]
+        return {name: round(float(probability), 6) for name, probability in pairs}
+
+    def log_prediction(self, image_filename, prediction_result, cache_key=None, class_names=None):
+        """Registrar predicción en el log JSON Lines"""
+        log_entry = self.make_entry(image_filename, prediction_result, cache_key, class_names)
+
+        self.append_many([log_entry])
+
         return log_entry
 
+    def iter_entries(self):
+        """Recorrer todas las entradas registradas, de la más antigua a la más nueva"""
+        for path in self.list_segments():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+
+    def close(self):
+        """Cerrar el segmento activo"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._lock_file.close()
+
+class AsyncPredictionWriter:
+    """Registro de predicciones fuera del camino de la solicitud
+
+    `log_prediction` solo encola la entrada; un hilo de fondo la escribe junto
+    con todas las que llegaron mientras tanto (group commit: un write y, si el
+    logger usa fsync, un fsync por grupo). Con la cola llena se aplica
+    `policy`: 'block' espera, 'drop' descarta y cuenta, 'spill' la agrega a
+    un archivo de desborde que el hilo importa cuando se libera la cola.
+    Cada proceso desborda en su propio archivo (spill-<pid>.jsonl); al
+    arrancar también se importan los que dejaron procesos ya terminados.
+    """
+
+    POLICIES = ('block', 'drop', 'spill')
+
+    def __init__(self, logger, max_queue=10000, policy='block', max_batch=1024,
+                 flush_interval=0.05):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Política desconocida: {policy} (opciones: {', '.join(self.POLICIES)})")
+        self.logger = logger
+        self.policy = policy
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spill_file = os.path.join(logger.log_dir, f'spill-{os.getpid()}.jsonl')
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.batches = 0
+        self.errors = 0
+
+        # Importar desbordes que hayan quedado de ejecuciones anteriores
+        self._drain_orphaned_spills()
+        self._drain_spill()
+        self._thread = threading.Thread(target=self._run, name='prediction-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_prediction(self, image_filename, prediction_result, cache_key=None, class_names=None):
+        """Encolar la predicción y volver de inmediato"""
+        log_entry = PredictionLogger.make_entry(image_filename, prediction_result, cache_key, class_names)
+        if self.policy == 'block':
+            self._queue.put(log_entry)
+            return log_entry
+        try:
+            self._queue.put_nowait(log_entry)
+        except queue.Full:
+            if self.policy == 'drop':
+                with self._stats_lock:
+                    self.dropped += 1
+            else:
+                self._spill(log_entry)
+        return log_entry
+
+    def _spill(self, log_entry):
+        line = json.dumps(log_entry, ensure_ascii=False) + '\n'
+        with self._spill_lock:
+            with open(self.spill_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+        with self._stats_lock:
+            self.spilled += 1
+
+    def _drain_spill(self, path=None):
+        """Pasar al log las entradas desbordadas"""
+        path = path or self.spill_file
+        with self._spill_lock:
+            if not os.path.exists(path):
+                return
+            entries = []
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # Línea incompleta por un corte durante la escritura
+                        continue
+            self.logger.append_many(entries)
+            os.remove(path)
+        with self._stats_lock:
+            self.written += len(entries)
+
+    @staticmethod
+    def _process_alive(pid):
+        if os.name != 'posix':
+            # En Windows os.kill terminaría el proceso: se asume vivo
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _drain_orphaned_spills(self):
+        """Importar los desbordes de procesos que ya no existen
+
+        El archivo se renombra antes de leerlo: si dos workers arrancan a la
+        vez, solo uno consigue reclamarlo.
+        """
+        log_dir = self.logger.log_dir
+        for name in sorted(os.listdir(log_dir)):
+            if not (name.startswith('spill') and name.endswith('.jsonl')):
+                continue
+            # spill.jsonl (versiones anteriores), spill-<pid>.jsonl o uno ya
+            # reclamado por otro proceso: spill-<pid>-<origen>.jsonl
+            owner = name[len('spill-'):-len('.jsonl')].split('-')[0]
+            if name != 'spill.jsonl' and (not owner.isdigit() or int(owner) == os.getpid()
+                                          or self._process_alive(int(owner))):
+                continue
+            claimed = os.path.join(log_dir, f'spill-{os.getpid()}-{name[:-len(".jsonl")]}.jsonl')
+            try:
+                os.rename(os.path.join(log_dir, name), claimed)
+            except FileNotFoundError:
+                continue
+            self._drain_spill(claimed)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self.spilled and os.path.exists(self.spill_file):
+                    self._safe(self._drain_spill)
+                continue
+
+            batch = []
+            if first is None:
+                stop = True
+            else:
+                batch.append(first)
+            # Agrupar todo lo que ya esté en cola
+            while not stop and len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+
+            if batch and self._safe(self.logger.append_many, batch):
+                with self._stats_lock:
+                    self.written += len(batch)
+                    self.batches += 1
+
+        self._safe(self._drain_spill)
+
+    def _safe(self, fn, *args):
+        try:
+            fn(*args)
+            return True
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            print(f"❌ Error escribiendo log de predicciones: {e}")
+            return False
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                'policy': self.policy,
+                'queue_depth': self.queue_depth(),
+                'written': self.written,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'errors': self.errors,
+                'batches': self.batches,
+                'mean_batch_size': self.written / self.batches if self.batches else 0.0
+            }
+
+    def close(self):
+        """Escribir todo lo pendiente y detener el hilo"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self.logger.close()
+
 class ImageValidator:
     """Validador de imágenes"""
     
@@ -42,19 +467,30 @@ class ImageValidator:
         self.allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
         self.max_file_size = 16 * 1024 * 1024  # 16MB
     
-    def validate_image(self, file):
-        """Validar archivo de imagen"""
-        if not file:
+    def validate_filename(self, filename):
+        """Validar la extensión de un nombre de archivo"""
+        if not filename:
             return False, "No se proporcionó archivo"
         
         # Verificar extensión
-        if '.' not in file.filename:
+        if '.' not in filename:
             return False, "Archivo sin extensión"
         
-        extension = file.filename.rsplit('.', 1)[1].lower()
+        extension = filename.rsplit('.', 1)[1].lower()
         if extension not in self.allowed_extensions:
             return False, f"Extensión no permitida: {extension}"
         
+        return True, "Válido"
+    
+    def validate_image(self, file):
+        """Validar archivo de imagen"""
+        if not file:
+            return False, "No se proporcionó archivo"
+        
+        is_valid, message = self.validate_filename(file.filename)
+        if not is_valid:
+            return is_valid, message
+        
         # Verificar tamaño (aproximado)
         file.seek(0, 2)  # Ir al final del archivo
         file_size = file.tell()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Recursos estáticos del frontend con huella de contenido y precomprimidos
+
+La compilación copia cada archivo del frontend con el hash de su contenido
+en el nombre (app.js -> app.3f2a9c1b.js), guarda junto a él sus versiones
+.gz y .br y reescribe las referencias del HTML. Así los recursos con hash
+pueden cachearse un año como inmutables: un cambio produce otra URL. El
+HTML conserva su nombre y se revalida con ETag en cada visita.
+
+Se compila al arrancar el servidor (solo si cambió el frontend) o en el
+despliegue:
+    python static_assets.py build ../Frontend static_build
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # Sin brotli se sirve solo gzip
+    brotli = None
+
+BUILD_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+# Recursos que conservan su nombre (se piden por URL fija)
+ENTRY_POINTS = {'index.html'}
+# Tipos que vale la pena comprimir (las imágenes ya vienen comprimidas)
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'image/svg+xml', 'application/xml')
+# Debajo de este tamaño la compresión no compensa las cabeceras
+MIN_COMPRESS_SIZE = 256
+# Codificaciones en orden de preferencia ante igual calidad en Accept-Encoding
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDATE = 'no-cache'
+
+_REFERENCE = re.compile(r'''(\b(?:href|src)=)(["'])([^"'#?]+)\2''')
+
+
+def _list_sources(source_dir):
+    """Rutas relativas (con '/') de los archivos del frontend, en orden"""
+    paths = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(root, name), source_dir).replace(os.sep, '/'))
+    return paths
+
+
+def _source_fingerprint(source_dir, paths):
+    """Identifica el estado del frontend sin leer los archivos"""
+    digest = hashlib.sha1(f'{BUILD_VERSION}:{brotli is not None}'.encode('utf-8'))
+    for path in paths:
+        stat = os.stat(os.path.join(source_dir, path))
+        digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _hashed_name(path, digest):
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{digest[:8]}{extension}'
+
+
+def _rewrite_references(html, urls):
+    """Apuntar href/src del HTML a los nombres con hash"""
+    def replace(match):
+        reference = match.group(3)
+        logical = reference[2:] if reference.startswith('./') else reference.lstrip('/')
+        if logical not in urls:
+            return match.group(0)
+        return f'{match.group(1)}{match.group(2)}{urls[logical]}{match.group(2)}'
+    return _REFERENCE.sub(replace, html)
+
+
+def _compressed_variants(data, content_type):
+    """Versiones comprimidas que resultan más chicas que el original"""
+    if len(data) < MIN_COMPRESS_SIZE or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return {}
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def build_assets(source_dir, build_dir, force=False):
+    """Compilar el frontend en `build_dir`; no hace nada si no cambió
+
+    Devuelve el manifiesto: por cada archivo lógico, la URL servida, el
+    hash de su contenido y las codificaciones disponibles.
+    """
+    paths = _list_sources(source_dir)
+    fingerprint = _source_fingerprint(source_dir, paths)
+    manifest_path = os.path.join(build_dir, MANIFEST_FILE)
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('source_fingerprint') == fingerprint:
+            return manifest
+
+    # Primero los recursos con hash, después el HTML que los referencia
+    ordered = sorted(paths, key=lambda path: path.endswith('.html'))
+    assets = {}
+    urls = {}
+    for path in ordered:
+        with open(os.path.join(source_dir, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.html'):
+            data = _rewrite_references(data.decode('utf-8'), urls).encode('utf-8')
+
+        digest = hashlib.sha256(data).hexdigest()
+        immutable = path not in ENTRY_POINTS and not path.endswith('.html')
+        url = _hashed_name(path, digest) if immutable else path
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        variants = _compressed_variants(data, content_type)
+
+        _write_atomic(os.path.join(build_dir, url), data)
+        for encoding, suffix in ENCODINGS:
+            if encoding in variants:
+                _write_atomic(os.path.join(build_dir, url + suffix), variants[encoding])
+
+        urls[path] = url
+        assets[path] = {
+            'url': url,
+            'hash': digest[:16],
+            'content_type': content_type,
+            'immutable': immutable,
+            'size': len(data),
+            'encodings': {encoding: len(body) for encoding, body in variants.items()}
+        }
+
+    manifest = {'version': BUILD_VERSION, 'source_fingerprint': fingerprint, 'assets': assets}
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+class _Asset:
+    """Un recurso compilado con sus representaciones en memoria"""
+
+    __slots__ = ('content_type', 'hash', 'cache_control', 'bodies')
+
+    def __init__(self, content_type, digest, cache_control, bodies):
+        self.content_type = content_type
+        self.hash = digest
+        self.cache_control = cache_control
+        # 'identity', 'gzip', 'br' -> bytes
+        self.bodies = bodies
+
+    def etag(self, encoding):
+        return self.hash if encoding == 'identity' else f'{self.hash}-{encoding}'
+
+
+class StaticAssets:
+    """Sirve el frontend compilado negociando Accept-Encoding
+
+    Las URLs con hash llevan Cache-Control inmutable; los nombres lógicos
+    (index.html, o app.js pedido por un HTML viejo) se revalidan con ETag.
+    If-None-Match responde 304 sin cuerpo. El frontend es chico, así que
+    todas las representaciones se mantienen en memoria.
+    """
+
+    def __init__(self, source_dir, build_dir):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self._assets = {}
+        self.manifest = None
+        self.reload()
+
+    def reload(self):
+        """Compilar si hace falta y cargar el resultado"""
+        manifest = build_assets(self.source_dir, self.build_dir)
+        if self.manifest is not None and \
+                manifest['source_fingerprint'] == self.manifest['source_fingerprint']:
+            return
+        assets = {}
+        for path, entry in manifest['assets'].items():
+            bodies = {'identity': self._read(entry['url'])}
+            for encoding, suffix in ENCODINGS:
+                if encoding in entry['encodings']:
+                    bodies[encoding] = self._read(entry['url'] + suffix)
+            assets[entry['url']] = _Asset(
+                entry['content_type'], entry['hash'],
+                CACHE_IMMUTABLE if entry['immutable'] else CACHE_REVALIDATE, bodies
+            )
+            # El nombre sin hash sigue disponible, pero se revalida
+            if entry['url'] != path:
+                assets[path] = _Asset(entry['content_type'], entry['hash'], CACHE_REVALIDATE, bodies)
+        self._assets = assets
+        self.manifest = manifest
+
+    def _read(self, url):
+        with open(os.path.join(self.build_dir, url), 'rb') as f:
+            return f.read()
+
+    def url_for(self, path):
+        """URL con hash de un archivo lógico del frontend"""
+        entry = self.manifest['assets'].get(path)
+        return entry['url'] if entry else path
+
+    @staticmethod
+    def _negotiate(asset, accept_encodings):
+        best, best_quality = 'identity', 0.0
+        for encoding, _ in ENCODINGS:
+            quality = accept_encodings[encoding] if encoding in asset.bodies else 0
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def response(self, path, request):
+        """Respuesta para `path`, o None si no es un recurso del frontend"""
+        asset = self._assets.get(path)
+        if asset is None:
+            return None
+        encoding = self._negotiate(asset, request.accept_encodings)
+        headers = {'Cache-Control': asset.cache_control, 'Vary': 'Accept-Encoding'}
+
+        # Todas las representaciones tienen el mismo contenido: vale cualquiera
+        if any(request.if_none_match.contains_weak(asset.etag(candidate)) for candidate in asset.bodies):
+            response = Response(status=304, headers=headers)
+            response.set_etag(asset.etag(encoding))
+            return response
+
+        response = Response(asset.bodies[encoding], mimetype=asset.content_type, headers=headers)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(asset.etag(encoding))
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compilar los recursos estáticos del frontend')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Hash de contenido y precompresión gzip/brotli')
+    build.add_argument('source_dir', nargs='?', default='../Frontend')
+    build.add_argument('build_dir', nargs='?', default='static_build')
+    build.add_argument('--force', action='store_true', help='Recompilar aunque no haya cambios')
+    args = parser.parse_args()
+
+    manifest = build_assets(args.source_dir, args.build_dir, force=args.force)
+    if brotli is None:
+        print("⚠️ Módulo brotli no instalado: solo se genera gzip")
+    for path, entry in manifest['assets'].items():
+        sizes = ', '.join(f"{encoding} {size} B" for encoding, size in entry['encodings'].items())
+        print(f"✅ {path} -> {entry['url']} ({entry['size']} B{', ' + sizes if sizes else ''})")
+
+
+if __name__ == '__main__':
+    main()
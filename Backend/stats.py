@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+
+from model_loader import AgroAssistant
+
+# Intervalos del histograma de confianza: [0.0, 0.1), ..., [0.9, 1.0]
+CONFIDENCE_BINS = 10
+# Posiciones de cada bucket: [total, baja_confianza, histograma...]
+_COUNT = 0
+_LOW = 1
+_HIST = 2
+_BUCKET_SIZE = _HIST + CONFIDENCE_BINS
+# Horas recientes incluidas en la respuesta cuando no se filtra por fecha
+RECENT_HOURS = 48
+
+
+def _new_bucket():
+    return [0] * _BUCKET_SIZE
+
+
+def _add_bucket(target, source):
+    for i, value in enumerate(source):
+        target[i] += value
+
+
+def _in_range(key, start, end):
+    """Claves ISO ('AAAA-MM-DD' o 'AAAA-MM-DDTHH') contra límites inclusivos
+    de cualquier precisión (se comparan por prefijo)"""
+    if start and key[:len(start)] < start:
+        return False
+    if end and key[:len(end)] > end:
+        return False
+    return True
+
+
+class PredictionStats:
+    """Agregados de las predicciones mantenidos en memoria
+
+    Un hilo de fondo lee solo lo nuevo de los segmentos del log y actualiza,
+    en O(1) por entrada, conteos por clase, histograma de confianza, casos
+    de baja confianza y buckets por hora y por día. Como sigue al log (y no
+    a las solicitudes de este proceso), todos los workers ven las mismas
+    cifras, con un retraso de hasta `refresh_interval`. Cada `snapshot_interval` segundos se guarda el estado junto con
+    la posición leída; al arrancar se parte del snapshot y se relee solo el
+    resto del log. Los buckets por hora se conservan `hourly_retention_days`
+    días; los diarios, siempre.
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, prediction_logger, snapshot_file=None, refresh_interval=1.0,
+                 snapshot_interval=300, hourly_retention_days=31,
+                 low_confidence=AgroAssistant.LOW_CONFIDENCE):
+        self.prediction_logger = prediction_logger
+        self.snapshot_file = snapshot_file or os.path.join(
+            prediction_logger.log_dir, 'stats_snapshot.json'
+        )
+        self.refresh_interval = refresh_interval
+        self.snapshot_interval = snapshot_interval
+        self.hourly_retention_days = hourly_retention_days
+        self.low_confidence = low_confidence
+
+        self._lock = threading.Lock()
+        self._reset()
+        self._load_snapshot()
+        self._dirty = False
+        self._snapshot_at = time.monotonic()
+
+        self._thread = threading.Thread(target=self._run, name='prediction-stats', daemon=True)
+        self._thread.start()
+
+    def _reset(self):
+        self._totals = {}
+        self._by_day = {}
+        self._by_hour = {}
+        self._last_timestamp = None
+        # Posición leída del log: (nombre del segmento, offset en bytes)
+        self._segment = None
+        self._offset = 0
+
+    def _load_snapshot(self):
+        """Partir del último snapshot; si no sirve, reconstruir desde el log"""
+        if not os.path.exists(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if snapshot.get('version') != self.SNAPSHOT_VERSION:
+                raise ValueError('versión de snapshot distinta')
+            self._totals = snapshot['totals']
+            self._by_day = snapshot['by_day']
+            self._by_hour = snapshot['by_hour']
+            self._last_timestamp = snapshot['last_timestamp']
+            self._segment, self._offset = snapshot['position']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Snapshot de estadísticas descartado ({e}); se reconstruye desde el log")
+            self._reset()
+
+    def save_snapshot(self):
+        """Guardar el estado de forma atómica (escritura temporal + rename)"""
+        with self._lock:
+            self._prune_hours()
+            data = json.dumps({
+                'version': self.SNAPSHOT_VERSION,
+                'position': [self._segment, self._offset],
+                'last_timestamp': self._last_timestamp,
+                'totals': self._totals,
+                'by_day': self._by_day,
+                'by_hour': self._by_hour
+            })
+            self._dirty = False
+        temporary = f'{self.snapshot_file}.{os.getpid()}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temporary, self.snapshot_file)
+
+    def _prune_hours(self):
+        if not self._by_hour or self.hourly_retention_days is None:
+            return
+        cutoff = time.strftime(
+            '%Y-%m-%dT%H', time.localtime(time.time() - self.hourly_retention_days * 86400)
+        )
+        for hour in [hour for hour in self._by_hour if hour < cutoff]:
+            del self._by_hour[hour]
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                if self._dirty and time.monotonic() - self._snapshot_at >= self.snapshot_interval:
+                    self._snapshot_at = time.monotonic()
+                    self.save_snapshot()
+            except Exception as e:
+                print(f"❌ Error actualizando estadísticas: {e}")
+            time.sleep(self.refresh_interval)
+
+    def refresh(self):
+        """Incorporar las entradas escritas desde la última lectura
+
+        Basta una sola posición (segmento, offset) porque PredictionLogger
+        solo agrega al segmento más nuevo, también con varios procesos
+        escribiendo: la rotación y cada escritura se serializan con flock y
+        todo escritor pasa al segmento nuevo antes de agregar. Un segmento
+        anterior al de la posición ya no recibe entradas.
+        """
+        for path in self.prediction_logger.list_segments():
+            name = os.path.basename(path)
+            if self._segment is not None and name < self._segment:
+                continue
+            offset = self._offset if name == self._segment else 0
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # Solo líneas completas: la última puede estar escribiéndose
+            end = data.rfind(b'\n') + 1
+            entries = []
+            for line in data[:end].splitlines():
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+            with self._lock:
+                for entry in entries:
+                    self._update(entry)
+                self._segment = name
+                self._offset = offset + end
+
+    def _update(self, entry):
+        """Sumar una entrada del log a todos los agregados"""
+        try:
+            prediction = entry['prediction']
+            class_name = prediction['class']
+            confidence = float(prediction['confidence'])
+            timestamp = entry['timestamp']
+        except (KeyError, TypeError, ValueError):
+            return
+        hour = timestamp[:13]
+        day = timestamp[:10]
+        bin_index = _HIST + min(max(int(confidence * CONFIDENCE_BINS), 0), CONFIDENCE_BINS - 1)
+        low = confidence < self.low_confidence
+
+        for bucket in (
+            self._totals.setdefault(class_name, _new_bucket()),
+            self._by_day.setdefault(day, {}).setdefault(class_name, _new_bucket()),
+            self._by_hour.setdefault(hour, {}).setdefault(class_name, _new_bucket())
+        ):
+            bucket[_COUNT] += 1
+            bucket[bin_index] += 1
+            if low:
+                bucket[_LOW] += 1
+
+        if self._last_timestamp is None or timestamp > self._last_timestamp:
+            self._last_timestamp = timestamp
+        self._dirty = True
+
+    def query(self, start=None, end=None, class_names=None):
+        """Estadísticas filtradas por rango de fechas (ISO, inclusivo, con
+        precisión de día u hora) y por clases; el costo depende del número
+        de buckets del rango, no del número de predicciones"""
+        wanted = set(class_names) if class_names else None
+        # Con límites de precisión horaria se suman buckets por hora
+        hourly = any(bound and len(bound) > 10 for bound in (start, end))
+
+        with self._lock:
+            per_class = {}
+            by_day = {}
+            by_hour = {}
+            if not start and not end:
+                sources = self._totals.items()
+            else:
+                grouped = self._by_hour if hourly else self._by_day
+                sources = []
+                for key, classes in grouped.items():
+                    if _in_range(key, start, end):
+                        sources.extend(classes.items())
+
+            for class_name, bucket in sources:
+                if wanted is None or class_name in wanted:
+                    _add_bucket(per_class.setdefault(class_name, _new_bucket()), bucket)
+
+            for day, classes in self._by_day.items():
+                if _in_range(day, start, end):
+                    count = sum(bucket[_COUNT] for class_name, bucket in classes.items()
+                                if wanted is None or class_name in wanted)
+                    if count:
+                        by_day[day] = count
+
+            if start or end:
+                hours = [hour for hour in self._by_hour if _in_range(hour, start, end)]
+            else:
+                hours = sorted(self._by_hour)[-RECENT_HOURS:]
+            for hour in hours:
+                count = sum(bucket[_COUNT] for class_name, bucket in self._by_hour[hour].items()
+                            if wanted is None or class_name in wanted)
+                if count:
+                    by_hour[hour] = count
+            last_timestamp = self._last_timestamp
+
+        summary = _new_bucket()
+        for bucket in per_class.values():
+            _add_bucket(summary, bucket)
+        total = summary[_COUNT]
+        return {
+            'total_predictions': total,
+            'class_counts': {name: bucket[_COUNT] for name, bucket in
+                             sorted(per_class.items(), key=lambda item: -item[1][_COUNT])},
+            'confidence_histogram': {
+                'bins': [round(i / CONFIDENCE_BINS, 1) for i in range(CONFIDENCE_BINS + 1)],
+                'counts': summary[_HIST:]
+            },
+            'low_confidence_threshold': self.low_confidence,
+            'low_confidence_count': summary[_LOW],
+            'low_confidence_rate': summary[_LOW] / total if total else 0.0,
+            'by_day': dict(sorted(by_day.items())),
+            'by_hour': dict(sorted(by_hour.items())),
+            'last_prediction_at': last_timestamp
+        }
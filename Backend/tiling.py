@@ -0,0 +1,109 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+from model_loader import IMAGE_SIZE, top_predictions
+
+TILE_SIZE = IMAGE_SIZE[0]
+AGGREGATIONS = ('mean', 'max')
+
+
+def _grid_positions(length, tile_size, stride):
+    """Inicios de las teselas a lo largo de un eje; la última toca el borde"""
+    if length <= tile_size:
+        return np.zeros(1, dtype=np.int64)
+    count = math.ceil((length - tile_size) / stride) + 1
+    return np.linspace(0, length - tile_size, count).round().astype(np.int64)
+
+
+def plan_tiles(width, height, tile_size=TILE_SIZE, overlap=0.25, max_tiles=64):
+    """Tamaño al que llevar la imagen para que la grilla no supere `max_tiles`
+
+    Las imágenes más chicas que una tesela se amplían hasta cubrirla; las
+    más grandes se reducen lo necesario para respetar el límite.
+    """
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+    scale = max(1.0, tile_size / min(width, height))
+    max_tiles = max(1, max_tiles)
+    while True:
+        scaled_width = max(tile_size, round(width * scale))
+        scaled_height = max(tile_size, round(height * scale))
+        rows = len(_grid_positions(scaled_height, tile_size, stride))
+        cols = len(_grid_positions(scaled_width, tile_size, stride))
+        if rows * cols <= max_tiles:
+            return (scaled_width, scaled_height), stride
+        scale *= 0.9
+
+
+def load_tiles(source, tile_size=TILE_SIZE, overlap=0.25, max_tiles=64):
+    """Decodificar una imagen y cortarla en teselas solapadas (uint8)
+
+    La reducción se decide antes de decodificar, así que una foto de 12 MP
+    se decodifica directamente cerca del tamaño final (modo draft de JPEG).
+    Devuelve las teselas (N, tile, tile, 3) y la forma de la grilla.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    with Image.open(source) as img:
+        size, stride = plan_tiles(img.width, img.height, tile_size, overlap, max_tiles)
+        img.draft('RGB', size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        image = np.asarray(img.resize(size), dtype=np.uint8)
+
+    ys = _grid_positions(image.shape[0], tile_size, stride)
+    xs = _grid_positions(image.shape[1], tile_size, stride)
+    # Vista (H', W', 1, tile, tile, 3) sin copiar; la indexación elige las teselas
+    windows = np.lib.stride_tricks.sliding_window_view(image, (tile_size, tile_size, 3))
+    tiles = windows[ys[:, None], xs[None, :], 0]
+    return tiles.reshape(-1, tile_size, tile_size, 3), (len(ys), len(xs))
+
+
+def predict_tiles(model_loader, tiles, grid, batch_size=16, aggregate='mean'):
+    """Puntuar las teselas por lotes y combinarlas en un único resultado
+
+    `aggregate='mean'` promedia las probabilidades de todas las teselas;
+    'max' toma el máximo por clase (una lesión en una sola tesela pesa
+    igual que en toda la hoja) y lo renormaliza. El mapa de calor es la
+    probabilidad de la clase resultante en cada tesela.
+    """
+    if aggregate not in AGGREGATIONS:
+        raise ValueError(f"Agregación desconocida: {aggregate} (opciones: {', '.join(AGGREGATIONS)})")
+
+    results = []
+    for start in range(0, len(tiles), batch_size):
+        # Normalizar por lote para no duplicar en float32 todas las teselas
+        batch = tiles[start:start + batch_size].astype(np.float32)
+        batch *= 1.0 / 255.0
+        results.extend(model_loader.predict_batch(batch))
+
+    probabilities = np.asarray([result['all_predictions'] for result in results], dtype=np.float32)
+    if aggregate == 'mean':
+        combined = probabilities.mean(axis=0)
+    else:
+        combined = probabilities.max(axis=0)
+        combined /= combined.sum()
+
+    class_index = int(np.argmax(combined))
+    heat_map = probabilities[:, class_index].reshape(grid)
+    stages = {}
+    for result in results:
+        stage = result.get('stage')
+        stages[stage] = stages.get(stage, 0) + 1
+
+    return {
+        'class': model_loader.class_names[class_index],
+        'confidence': float(combined[class_index]),
+        'all_predictions': combined.tolist(),
+        'top_k': top_predictions(combined, model_loader.class_names),
+        'mode': 'tiled',
+        'aggregate': aggregate,
+        'tiles': len(tiles),
+        'grid': list(grid),
+        'heat_map': np.round(heat_map, 4).tolist(),
+        'stages': stages,
+        'model_version': results[0].get('model_version')
+    }
@@ -175,6 +175,11 @@ async function checkSystemHealth() {
         if (data.model_status === 'loaded') {
             systemStatus.textContent = '✅ Modelo funcionando';
             systemStatus.style.color = '#3bf41aff';
+        } else if (data.model_status === 'loading') {
+            // El servidor sigue cargando/calentando el modelo: reintentar
+            systemStatus.textContent = '⏳ Modelo iniciando...';
+            systemStatus.style.color = '#f39c12';
+            setTimeout(checkSystemHealth, 2000);
         } else {
             systemStatus.textContent = '⚠️ Modelo no disponible';
             systemStatus.style.color = '#e74c3c';
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Generador de carga de extremo a extremo contra /api/predict
+
+Sin --url levanta la app Flask en este proceso (con el modelo real o el
+sustituto) en un directorio temporal. Reporta latencias p50/p95/p99 y
+throughput.
+
+Ejemplo:
+    python benchmarks/bench_load.py --concurrency 16 --duration 30
+    python benchmarks/bench_load.py --url http://localhost:5000 --concurrency 32
+"""
+
+import argparse
+import http.client
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from common import percentiles, resolve_model_path, save_results, synthetic_image
+
+BOUNDARY = 'agrodetect-bench'
+
+
+def multipart_body(image_bytes, filename='bench.jpg'):
+    return (
+        f'--{BOUNDARY}\r\n'
+        f'Content-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        'Content-Type: image/jpeg\r\n\r\n'
+    ).encode() + image_bytes + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+def start_local_server(model_path, port, extra_env):
+    """Levantar la app en un hilo con el servidor de werkzeug"""
+    os.environ['MODEL_PATH'] = model_path
+    os.environ.update(extra_env)
+    work_dir = tempfile.mkdtemp(prefix='bench-load-')
+    os.chdir(work_dir)
+
+    import app as flask_app
+    from werkzeug.serving import make_server
+
+    # Sin una línea de log por solicitud: distorsiona la medición
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', port, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, work_dir
+
+
+def wait_until_ready(host, port, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            connection.request('GET', '/api/ready')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError('El servidor no estuvo listo a tiempo')
+
+
+class LoadGenerator:
+    """Clientes concurrentes con conexiones persistentes"""
+
+    def __init__(self, host, port, bodies, concurrency, duration=None, total_requests=None):
+        self.host = host
+        self.port = port
+        self.bodies = bodies
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total_requests = total_requests
+        self._lock = threading.Lock()
+        self._issued = 0
+        self.latencies = []
+        self.status_counts = {}
+
+    def _next_request(self, deadline):
+        with self._lock:
+            if self.total_requests is not None and self._issued >= self.total_requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            self._issued += 1
+            return self._issued
+
+    def _client(self, deadline):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        latencies = []
+        statuses = {}
+        while True:
+            number = self._next_request(deadline)
+            if number is None:
+                break
+            body = self.bodies[number % len(self.bodies)]
+            started = time.perf_counter()
+            try:
+                connection.request('POST', '/api/predict', body=body, headers={
+                    'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'
+                })
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                status = 'connection_error'
+                connection.close()
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+        connection.close()
+        with self._lock:
+            self.latencies.extend(latencies)
+            for status, count in statuses.items():
+                self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + count
+
+    def run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration if self.duration else None
+        threads = [threading.Thread(target=self._client, args=(deadline,))
+                   for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return dict(
+            concurrency=self.concurrency,
+            elapsed_seconds=elapsed,
+            throughput_rps=len(self.latencies) / elapsed if elapsed else 0.0,
+            status_counts=self.status_counts,
+            latency=percentiles(self.latencies)
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prueba de carga de /api/predict')
+    parser.add_argument('--url', help='Servidor existente (por defecto se levanta uno local)')
+    parser.add_argument('--port', type=int, default=5077, help='Puerto del servidor local')
+    parser.add_argument('--model', help='Ruta del modelo (por defecto: real o sustituto)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help='Uno o varios niveles de concurrencia')
+    parser.add_argument('--duration', type=float, default=20.0, help='Segundos por nivel')
+    parser.add_argument('--requests', type=int, help='Total de solicitudes por nivel (en vez de duración)')
+    parser.add_argument('--image-size', default='1280x960', help='Tamaño de las imágenes JPEG')
+    parser.add_argument('--unique-images', type=int, default=256,
+                        help='Imágenes distintas a rotar (evita que la caché responda todo)')
+    parser.add_argument('--output', help='Archivo JSON de salida')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    width, height = (int(value) for value in args.image_size.split('x'))
+    bodies = [multipart_body(synthetic_image(width, height, seed=seed))
+              for seed in range(args.unique_images)]
+
+    work_dir = None
+    if args.url:
+        parsed = urllib.parse.urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+        model_path = None
+    else:
+        host, port = '127.0.0.1', args.port
+        model_path = resolve_model_path(args.model)
+        _, work_dir = start_local_server(model_path, port, {'CACHE_MAX_BYTES': '0'})
+
+    try:
+        wait_until_ready(host, port)
+        results = {'url': args.url, 'model_path': model_path, 'image_size': args.image_size, 'levels': []}
+        for concurrency in args.concurrency:
+            level = LoadGenerator(host, port, bodies, concurrency,
+                                  duration=None if args.requests else args.duration,
+                                  total_requests=args.requests).run()
+            latency = level['latency']
+            print(f"🚦 concurrencia {concurrency}: {level['throughput_rps']:.1f} req/s, "
+                  f"p50 {latency.get('p50_ms', 0):.1f} ms, p95 {latency.get('p95_ms', 0):.1f} ms, "
+                  f"p99 {latency.get('p99_ms', 0):.1f} ms, estados {level['status_counts']}")
+            results['levels'].append(level)
+        save_results('load', results, args.output)
+    finally:
+        if work_dir:
+            os.chdir(os.path.dirname(work_dir))
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks del camino crítico: decodificación/redimensionado,
+inferencia por tamaño de lote y escritura del log de predicciones
+
+Ejemplo:
+    python benchmarks/bench_micro.py
+    python benchmarks/bench_micro.py --quick --only decode log
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from common import percentiles, resolve_model_path, save_results, synthetic_image, SEED
+
+import numpy as np
+
+DECODE_CASES = [
+    ('jpeg_640x480', 640, 480, 'JPEG', 'RGB'),
+    ('jpeg_1920x1080', 1920, 1080, 'JPEG', 'RGB'),
+    ('jpeg_4000x3000', 4000, 3000, 'JPEG', 'RGB'),
+    ('png_rgba_1024x768', 1024, 768, 'PNG', 'RGBA')
+]
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+HISTORY_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def time_calls(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_decode(repeat):
+    from model_loader import decode_image
+
+    results = {}
+    for name, width, height, fmt, mode in DECODE_CASES:
+        data = synthetic_image(width, height, fmt, mode)
+        results[name] = dict(bytes=len(data), **percentiles(
+            time_calls(lambda: decode_image(data), repeat)
+        ))
+        print(f"🖼️ decode {name}: p50 {results[name]['p50_ms']:.2f} ms")
+    return results
+
+
+def bench_inference(repeat, model_path, backend):
+    from model_loader import ModelLoader
+
+    loader = ModelLoader(model_path, backend=backend)
+    rng = np.random.default_rng(SEED)
+    results = {}
+    for batch_size in BATCH_SIZES:
+        images = rng.random((batch_size, 224, 224, 3), dtype=np.float32)
+        stats = percentiles(time_calls(lambda: loader.predict_batch(images), repeat))
+        stats['images_per_second'] = batch_size / (stats['p50_ms'] / 1000.0)
+        results[str(batch_size)] = stats
+        print(f"🧠 inferencia lote {batch_size}: p50 {stats['p50_ms']:.2f} ms "
+              f"({stats['images_per_second']:.1f} img/s)")
+    return {'model_path': model_path, 'backend': loader.backend, 'batch_sizes': results}
+
+
+def bench_log_writes(repeat, history_sizes):
+    from model_loader import DEFAULT_CLASS_NAMES
+    from prediction import PredictionLogger
+
+    vector = np.random.default_rng(SEED).random(10) * 0.003
+    vector[DEFAULT_CLASS_NAMES.index('Tomato___Leaf_Mold')] = 0.97
+    prediction = {
+        'class': 'Tomato___Leaf_Mold',
+        'confidence': 0.97,
+        'all_predictions': vector.tolist(),
+        'top_k': [['Tomato___Leaf_Mold', 0.97], ['Tomato___Late_blight', 0.002],
+                  ['Tomato___healthy', 0.001]]
+    }
+    entry = PredictionLogger.make_entry('x.jpg', prediction, class_names=DEFAULT_CLASS_NAMES)
+
+    results = {}
+    for history_size in history_sizes:
+        work_dir = tempfile.mkdtemp(prefix='bench-log-')
+        try:
+            logger = PredictionLogger(
+                log_dir=os.path.join(work_dir, 'predictions_log'), legacy_file=None
+            )
+            # Prellenar el historial en bloques grandes
+            for start in range(0, history_size, 10_000):
+                logger.append_many([entry] * min(10_000, history_size - start))
+            stats = percentiles(time_calls(
+                lambda: logger.log_prediction('x.jpg', prediction, class_names=DEFAULT_CLASS_NAMES), repeat
+            ))
+            logger.close()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        results[str(history_size)] = stats
+        print(f"📝 log con {history_size} entradas: p50 {stats['p50_ms']:.3f} ms")
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Microbenchmarks del servidor de predicción')
+    parser.add_argument('--only', nargs='+', choices=['decode', 'inference', 'log'],
+                        default=['decode', 'inference', 'log'])
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--quick', action='store_true',
+                        help='Menos repeticiones y sin el historial de 1M entradas')
+    parser.add_argument('--model', help='Ruta del modelo (por defecto: real o sustituto)')
+    parser.add_argument('--backend', help='keras, saved_model o tflite')
+    parser.add_argument('--output', help='Archivo JSON de salida')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    repeat = 5 if args.quick else args.repeat
+    history_sizes = HISTORY_SIZES[:-1] if args.quick else HISTORY_SIZES
+
+    results = {'repeat': repeat}
+    if 'decode' in args.only:
+        results['decode'] = bench_decode(repeat)
+    if 'inference' in args.only:
+        results['inference'] = bench_inference(repeat, resolve_model_path(args.model), args.backend)
+    if 'log' in args.only:
+        results['log_writes'] = bench_log_writes(repeat, history_sizes)
+    save_results('micro', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
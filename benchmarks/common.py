@@ -0,0 +1,132 @@
+"""
+Utilidades compartidas por los benchmarks: modelo sustituto, imágenes
+sintéticas y guardado de resultados en JSON
+"""
+
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'Backend')
+REAL_MODEL_PATH = os.path.join(BACKEND_DIR, 'models', 'mejor_modelo_cultivos.h5')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+STANDIN_MODEL_PATH = os.path.join(CACHE_DIR, 'standin_model.h5')
+SEED = 1234
+
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+
+def build_standin_model(path=STANDIN_MODEL_PATH, num_classes=10):
+    """Modelo con la misma arquitectura que el notebook (MobileNetV2 + cabeza
+    densa), inicializado al azar y sin descargar pesos"""
+    import tensorflow as tf
+    from tensorflow.keras import layers, models
+
+    tf.keras.utils.set_random_seed(SEED)
+    base_model = tf.keras.applications.MobileNetV2(
+        input_shape=(224, 224, 3), include_top=False, weights=None
+    )
+    model = models.Sequential([
+        base_model,
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.3),
+        layers.Dense(512, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(0.5),
+        layers.Dense(256, activation='relu'),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax')
+    ])
+    model.build((None, 224, 224, 3))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    model.save(path)
+    return path
+
+
+def resolve_model_path(model_path=None):
+    """Modelo real si existe; si no, el sustituto (se crea una sola vez)"""
+    if model_path:
+        return model_path
+    if os.path.exists(REAL_MODEL_PATH):
+        return REAL_MODEL_PATH
+    if not os.path.exists(STANDIN_MODEL_PATH):
+        print("⚠️ No se encontró el modelo entrenado; creando modelo sustituto aleatorio")
+        build_standin_model()
+    return STANDIN_MODEL_PATH
+
+
+def synthetic_image(width, height, fmt='JPEG', mode='RGB', seed=SEED):
+    """Imagen sintética codificada (ruido suavizado, similar en costo a una foto)"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    channels = 4 if mode == 'RGBA' else 3
+    # Ruido de baja resolución ampliado: comprime como una foto, no como ruido puro
+    small = rng.integers(0, 256, size=(max(1, height // 16), max(1, width // 16), channels), dtype=np.uint8)
+    img = Image.fromarray(small, mode).resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        img.save(buffer, fmt, quality=90)
+    else:
+        img.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def percentiles(samples):
+    """Resumen de latencias en milisegundos"""
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    if values.size == 0:
+        return {}
+    return {
+        'count': int(values.size),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max())
+    }
+
+
+def environment_info():
+    """Datos del entorno para comparar ejecuciones"""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        commit = None
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'git_commit': commit
+    }
+    if 'tensorflow' in sys.modules:
+        info['tensorflow'] = sys.modules['tensorflow'].__version__
+    return info
+
+
+def save_results(name, results, output=None):
+    """Guardar resultados en benchmarks/results/<name>-<fecha>.json"""
+    payload = {
+        'benchmark': name,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment_info(),
+        'results': results
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(payload, f, indent=2)
+    print(f"💾 Resultados guardados en {output}")
+    return output
@@ -3,12 +3,17 @@
 Script para ejecutar la aplicación completa
 """
 
+import argparse
 import os
+import secrets
 import subprocess
 import sys
 import webbrowser
 from threading import Timer
 
+BACKEND_DIR = 'Backend'
+FRONTEND_DIR = 'Frontend'
+
 def check_dependencies():
     """Verificar dependencias y directorios"""
     try:
@@ -43,7 +48,7 @@ def check_dependencies():
         print(f"❌ Error de dependencias: {e}")
         print("📦 Instalando dependencias...")
         try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "backend/requirements.txt"])
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", os.path.join(BACKEND_DIR, "requirements.txt")])
             print("✅ Dependencias instaladas correctamente")
             return True
         except subprocess.CalledProcessError:
@@ -53,9 +58,42 @@ def check_dependencies():
 def start_backend():
     """Iniciar servidor backend"""
     print("🚀 Iniciando servidor backend...")
-    os.chdir('backend')
-    subprocess.Popen([sys.executable, "app.py"])
-    os.chdir('..')
+    return [subprocess.Popen([sys.executable, "app.py"], cwd=BACKEND_DIR)]
+
+def default_workers():
+    """Un worker por núcleo: decodificar imágenes es trabajo de CPU"""
+    return max(1, os.cpu_count() or 1)
+
+def start_production_backend(workers, threads, bind):
+    """Iniciar el proceso de inferencia compartido y los workers de gunicorn
+
+    El modelo se carga una sola vez en el proceso de inferencia; los workers
+    no importan TensorFlow y le envían las imágenes por un socket Unix local.
+    """
+    env = os.environ.copy()
+    env.setdefault('INFERENCE_SOCKET', os.path.abspath('agrodetect-inference.sock'))
+    env.setdefault('INFERENCE_AUTHKEY', secrets.token_hex(16))
+    # Métricas de todos los workers combinadas en /metrics; las de una
+    # ejecución anterior no deben sumarse a las nuevas
+    env.setdefault('METRICS_DIR', os.path.abspath('agrodetect-metrics'))
+    if os.path.isdir(env['METRICS_DIR']):
+        for name in os.listdir(env['METRICS_DIR']):
+            if name.endswith('.json'):
+                os.remove(os.path.join(env['METRICS_DIR'], name))
+
+    print("🧠 Iniciando proceso de inferencia compartido...")
+    inference = subprocess.Popen([sys.executable, "inference_server.py"], cwd=BACKEND_DIR, env=env)
+
+    print(f"🚀 Iniciando gunicorn: {workers} workers x {threads} hilos en {bind}")
+    server = subprocess.Popen([
+        sys.executable, "-m", "gunicorn",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--bind", bind,
+        "--timeout", "300",
+        "app:app"
+    ], cwd=BACKEND_DIR, env=env)
+    return [inference, server]
 
 def start_frontend():
     """Abrir frontend en el navegador"""
@@ -65,17 +103,28 @@ def start_frontend():
     # Esperar un poco para que el servidor inicie
     Timer(3, open_browser).start()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Ejecutar AgroDetect')
+    parser.add_argument('--production', action='store_true',
+                        help='Servir con gunicorn (varios workers) y un proceso de inferencia compartido')
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='Workers de gunicorn (por defecto: núcleos de CPU)')
+    parser.add_argument('--threads', type=int, default=4, help='Hilos por worker')
+    parser.add_argument('--bind', default='0.0.0.0:5000', help='Dirección de escucha')
+    return parser.parse_args()
+
 def main():
     """Función principal"""
+    args = parse_args()
     print("🌱 Iniciando AgroDetect Application...")
     
     # Verificar estructura de directorios
-    if not os.path.exists('backend'):
-        print("❌ Error: No se encuentra el directorio 'backend'")
+    if not os.path.exists(BACKEND_DIR):
+        print(f"❌ Error: No se encuentra el directorio '{BACKEND_DIR}'")
         return
     
-    if not os.path.exists('frontend'):
-        print("❌ Error: No se encuentra el directorio 'frontend'")
+    if not os.path.exists(FRONTEND_DIR):
+        print(f"❌ Error: No se encuentra el directorio '{FRONTEND_DIR}'")
         return
     
     # Verificar dependencias
@@ -86,16 +135,27 @@ def main():
     model_path = 'Backend/models/mejor_modelo_cultivos.h5'
     if not os.path.exists(model_path):
         print("⚠️ Advertencia: No se encuentra el modelo entrenado")
-        print("💡 Coloca tu modelo entrenado en: backend/models/modelo_entrenado.h5")
+        print("💡 Coloca tu modelo entrenado en: Backend/models/mejor_modelo_cultivos.h5")
     
     # Iniciar aplicación
-    start_backend()
-    start_frontend()
+    if args.production:
+        processes = start_production_backend(args.workers, args.threads, args.bind)
+    else:
+        processes = start_backend()
+        start_frontend()
     
     print("✅ Aplicación iniciada correctamente")
     print("🌐 Frontend disponible en: http://localhost:5000")
     print("🔧 Backend API disponible en: http://localhost:5000/api")
     print("\nPresiona Ctrl+C para detener la aplicación")
+    
+    try:
+        for process in processes:
+            process.wait()
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
 
 if __name__ == "__main__":
     try:
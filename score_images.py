@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Script para puntuar en lote carpetas o listas de imágenes sin pasar por Flask
+
+Pipeline: decodificación en un pool de procesos -> inferencia por lotes
+-> escritura incremental (JSONL o CSV), con reanudación desde el archivo
+de salida.
+
+Ejemplo:
+    python score_images.py /datos/encuestas --output resultados.jsonl --resume
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Backend')
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from model_loader import ModelLoader, AgroAssistant, decode_image
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}
+CSV_FIELDS = ['path', 'success', 'class', 'confidence', 'diagnosis',
+              'treatment', 'urgency', 'warning', 'error']
+_DONE = object()
+
+
+def iter_image_paths(inputs):
+    """Recorrer carpetas (recursivamente) y listas .txt de rutas, en orden"""
+    for source in inputs:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        yield os.path.join(root, name)
+        elif source.endswith('.txt'):
+            with open(source, 'r', encoding='utf-8') as f:
+                for line in f:
+                    path = line.strip()
+                    if path:
+                        yield path
+        else:
+            yield source
+
+
+def _decode_worker(path):
+    """Decodificar en un proceso del pool; devuelve uint8 para abaratar el envío"""
+    started = time.perf_counter()
+    try:
+        image = decode_image(path, normalize=False)
+        return path, image, None, time.perf_counter() - started
+    except Exception as e:
+        return path, None, str(e), time.perf_counter() - started
+
+
+def _decode_chunk(paths):
+    """Un bloque de rutas por tarea, para no pagar un envío por imagen"""
+    return [_decode_worker(path) for path in paths]
+
+
+def _truncate_partial_line(path):
+    """Descartar una última línea incompleta (corte durante la escritura)"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b'\n':
+            return
+        # Retroceder por bloques desde el final hasta el último '\n'
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b'\n')
+            if newline != -1:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+
+def load_checkpoint(output_path, output_format):
+    """Rutas ya puntuadas en una ejecución anterior"""
+    if not os.path.exists(output_path):
+        return set()
+    _truncate_partial_line(output_path)
+    done = set()
+    with open(output_path, 'r', encoding='utf-8', newline='') as f:
+        if output_format == 'csv':
+            for row in csv.DictReader(f):
+                done.add(row['path'])
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    done.add(json.loads(line)['path'])
+    return done
+
+
+class ResultWriter:
+    """Escritura incremental de resultados en JSONL o CSV"""
+
+    def __init__(self, output_path, output_format, append):
+        self.output_format = output_format
+        write_header = not (append and os.path.exists(output_path)
+                            and os.path.getsize(output_path) > 0)
+        self.file = open(output_path, 'a' if append else 'w', encoding='utf-8', newline='')
+        if output_format == 'csv':
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if write_header:
+                self.csv_writer.writeheader()
+
+    def write_many(self, records):
+        for record in records:
+            if self.output_format == 'csv':
+                prediction = record.get('prediction', {})
+                recommendation = record.get('recommendation', {})
+                self.csv_writer.writerow({
+                    'path': record['path'],
+                    'success': record['success'],
+                    'class': prediction.get('class', ''),
+                    'confidence': prediction.get('confidence', ''),
+                    'diagnosis': recommendation.get('diagnosis', ''),
+                    'treatment': recommendation.get('treatment', ''),
+                    'urgency': recommendation.get('urgency', ''),
+                    'warning': recommendation.get('warning', ''),
+                    'error': record.get('error', '')
+                })
+            else:
+                self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        # Cada lote escrito queda como punto de control
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ScoringPipeline:
+    """Pipeline decodificar -> inferir -> escribir con colas acotadas"""
+
+    def __init__(self, model_loader, agro_assistant, writer, pool,
+                 batch_size=64, prefetch_batches=4, decode_chunksize=8,
+                 max_pending_chunks=8):
+        self.model_loader = model_loader
+        self.agro_assistant = agro_assistant
+        self.writer = writer
+        self.pool = pool
+        self.batch_size = batch_size
+        self.decode_chunksize = decode_chunksize
+        self.max_pending_chunks = max_pending_chunks
+
+        self.decoded_batches = queue.Queue(maxsize=prefetch_batches)
+        self.results = queue.Queue(maxsize=prefetch_batches)
+        self.producer_error = None
+        self.writer_error = None
+
+        self.timings = {
+            'decode_cpu_seconds': 0.0,
+            'inference_seconds': 0.0,
+            'recommendation_seconds': 0.0,
+            'write_seconds': 0.0,
+            'inference_stall_seconds': 0.0
+        }
+        self.images = 0
+        self.errors = 0
+
+    def _decode_bounded(self, paths):
+        """Decodificar en el pool, en orden, con a lo sumo `max_pending_chunks`
+        bloques encargados o esperando a ser consumidos
+
+        pool.imap no frena si la inferencia se atrasa: los procesos siguen
+        decodificando y este proceso acumula todas las imágenes. Aquí se
+        encarga un bloque nuevo solo al consumir uno ya decodificado, así la
+        memoria queda acotada aunque la carpeta tenga millones de imágenes.
+        """
+        paths = iter(paths)
+        pending = deque()
+        while True:
+            while len(pending) < self.max_pending_chunks:
+                chunk = list(itertools.islice(paths, self.decode_chunksize))
+                if not chunk:
+                    break
+                pending.append(self.pool.apply_async(_decode_chunk, (chunk,)))
+            if not pending:
+                return
+            yield from pending.popleft().get()
+
+    def _produce(self, paths):
+        """Hilo productor: decodificar en el pool y agrupar en lotes"""
+        try:
+            batch = []
+            for decoded in self._decode_bounded(paths):
+                self.timings['decode_cpu_seconds'] += decoded[3]
+                batch.append(decoded)
+                if len(batch) == self.batch_size:
+                    self.decoded_batches.put(batch)
+                    batch = []
+            if batch:
+                self.decoded_batches.put(batch)
+        except Exception as e:
+            self.producer_error = e
+        finally:
+            self.decoded_batches.put(_DONE)
+
+    def _consume_results(self):
+        """Hilo escritor: volcar cada lote al archivo de salida
+
+        Si una escritura falla (disco lleno) guarda el error y sigue vaciando
+        la cola sin escribir: el hilo principal no queda bloqueado en `put` y
+        termina la ejecución con ese error.
+        """
+        while True:
+            records = self.results.get()
+            if records is _DONE:
+                return
+            if self.writer_error is not None:
+                continue
+            started = time.perf_counter()
+            try:
+                self.writer.write_many(records)
+            except Exception as e:
+                self.writer_error = e
+                continue
+            self.timings['write_seconds'] += time.perf_counter() - started
+
+    def _score_batch(self, batch):
+        records = []
+        valid = [item for item in batch if item[1] is not None]
+        predictions = []
+        if valid:
+            started = time.perf_counter()
+            images = np.stack([item[1] for item in valid]).astype(np.float32)
+            images *= 1.0 / 255.0
+            predictions = self.model_loader.predict_batch(images)
+            self.timings['inference_seconds'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        predictions = iter(predictions)
+        for path, image, error, _ in batch:
+            if image is None:
+                self.errors += 1
+                records.append({'path': path, 'success': False, 'error': error})
+                continue
+            prediction_result = next(predictions)
+            recommendation = self.agro_assistant.get_recommendation(
+                prediction_result['class'],
+                prediction_result['confidence']
+            )
+            records.append({
+                'path': path,
+                'success': True,
+                'prediction': prediction_result,
+                'recommendation': recommendation
+            })
+        self.timings['recommendation_seconds'] += time.perf_counter() - started
+        return records
+
+    def run(self, paths):
+        producer = threading.Thread(target=self._produce, args=(paths,), daemon=True)
+        consumer = threading.Thread(target=self._consume_results, daemon=True)
+        producer.start()
+        consumer.start()
+
+        started = time.perf_counter()
+        next_report = self.batch_size * 50
+        try:
+            while True:
+                wait_started = time.perf_counter()
+                batch = self.decoded_batches.get()
+                self.timings['inference_stall_seconds'] += time.perf_counter() - wait_started
+                if batch is _DONE:
+                    break
+                self.results.put(self._score_batch(batch))
+                if self.writer_error is not None:
+                    raise self.writer_error
+                self.images += len(batch)
+                if self.images >= next_report:
+                    next_report += self.batch_size * 50
+                    elapsed = time.perf_counter() - started
+                    print(f"⏳ {self.images} imágenes ({self.images / elapsed:.1f} img/s)")
+            producer.join()
+        finally:
+            # Vaciar lo ya inferido antes de salir, también si se interrumpe
+            self.results.put(_DONE)
+            consumer.join()
+
+        if self.writer_error is not None:
+            raise self.writer_error
+        if self.producer_error is not None:
+            raise self.producer_error
+        return time.perf_counter() - started
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Puntuar imágenes en lote con el modelo de cultivos')
+    parser.add_argument('inputs', nargs='+',
+                        help='Carpetas, imágenes o archivos .txt con una ruta por línea')
+    parser.add_argument('--output', '-o', required=True, help='Archivo de salida (.jsonl o .csv)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help='Formato de salida (por defecto según la extensión)')
+    parser.add_argument('--model', default=os.path.join(BACKEND_DIR, 'models', 'mejor_modelo_cultivos.h5'),
+                        help='Ruta del modelo entrenado')
+    parser.add_argument('--fast-model', help='Modelo rápido para la cascada (opcional)')
+    parser.add_argument('--cascade-threshold', type=float, default=AgroAssistant.HIGH_CONFIDENCE,
+                        help='Confianza mínima del modelo rápido para no escalar')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help='Procesos de decodificación')
+    parser.add_argument('--prefetch', type=int, default=4, help='Lotes decodificados en espera')
+    parser.add_argument('--resume', action='store_true',
+                        help='Omitir las rutas ya presentes en el archivo de salida')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+
+    done = load_checkpoint(args.output, output_format) if args.resume else set()
+    if done:
+        print(f"🔁 Reanudando: {len(done)} imágenes ya puntuadas")
+    paths = (path for path in iter_image_paths(args.inputs) if path not in done)
+
+    # El pool se crea antes de cargar el modelo para no copiar su estado a los procesos
+    pool = multiprocessing.Pool(args.workers)
+    try:
+        model_loader = ModelLoader(args.model, fast_model_path=args.fast_model,
+                                   cascade_threshold=args.cascade_threshold)
+        agro_assistant = AgroAssistant()
+        writer = ResultWriter(args.output, output_format, append=args.resume)
+        pipeline = ScoringPipeline(
+            model_loader, agro_assistant, writer, pool,
+            batch_size=args.batch_size, prefetch_batches=args.prefetch,
+            # Dos bloques por proceso: ninguno queda ocioso esperando trabajo
+            max_pending_chunks=2 * args.workers
+        )
+        try:
+            elapsed = pipeline.run(paths)
+        finally:
+            writer.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    images = pipeline.images
+    print(f"✅ {images} imágenes puntuadas en {elapsed:.1f} s "
+          f"({images / elapsed if elapsed else 0:.1f} img/s), {pipeline.errors} con error")
+    print("⏱️ Tiempos por etapa:")
+    for stage, seconds in pipeline.timings.items():
+        print(f"   {stage}: {seconds:.2f} s")
+    if args.fast_model:
+        cascade = model_loader.get_cascade_stats()
+        print(f"🪜 Cascada: {cascade['escalation_rate']:.1%} escaladas, "
+              f"{cascade['mean_latency_saved_ms']:.2f} ms ahorrados por imagen")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n⚠️ Interrumpido; use --resume para continuar")
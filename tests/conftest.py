@@ -0,0 +1,12 @@
+"""
+Configuración común de las pruebas: los módulos del backend se importan
+como lo hace la app, desde la carpeta Backend
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'Backend')
+
+sys.path.insert(0, BACKEND_DIR)
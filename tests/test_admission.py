@@ -0,0 +1,160 @@
+"""Pruebas del control de admisión: reparto por turnos, rechazos y la
+carrera entre el vencimiento de la espera y la entrega del turno"""
+
+import threading
+import time
+
+import pytest
+
+import admission
+from admission import (AdmissionController, AdmissionRejected, SHED_CLIENT_LIMIT,
+                       SHED_QUEUE_FULL, SHED_TIMEOUT)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise AssertionError('La condición no se cumplió a tiempo')
+        time.sleep(0.001)
+
+
+class Waiter(threading.Thread):
+    """Pide un lugar y anota el orden en que lo obtiene (sin liberarlo)"""
+
+    def __init__(self, controller, client_id, granted):
+        super().__init__(daemon=True)
+        self.controller = controller
+        self.client_id = client_id
+        self.granted = granted
+        self.error = None
+
+    def run(self):
+        try:
+            self.controller.acquire(self.client_id)
+            self.granted.append(self.client_id)
+        except AdmissionRejected as e:
+            self.error = e
+
+
+def enqueue(controller, client_id, granted):
+    """Encolar una solicitud y esperar a que ocupe su lugar en la cola"""
+    depth = controller.queue_depth()
+    waiter = Waiter(controller, client_id, granted)
+    waiter.start()
+    wait_for(lambda: controller.queue_depth() == depth + 1)
+    return waiter
+
+
+def test_admits_immediately_below_limit():
+    controller = AdmissionController(max_in_flight=2)
+    controller.acquire('a')
+    controller.acquire('b')
+
+    assert controller.in_flight() == 2
+    assert controller.queue_depth() == 0
+    controller.release()
+    controller.release()
+    assert controller.in_flight() == 0
+
+
+def test_round_robin_between_clients():
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=5)
+    controller.acquire('holder')
+    granted = []
+    # Un cliente con tres solicitudes en cola antes que otro con una
+    waiters = [enqueue(controller, 'bulk', granted) for _ in range(3)]
+    waiters.append(enqueue(controller, 'single', granted))
+
+    for expected in range(1, 5):
+        controller.release()
+        wait_for(lambda: len(granted) == expected)
+
+    assert granted == ['bulk', 'single', 'bulk', 'bulk']
+    # Cada liberación pasó el lugar directo al siguiente: nunca más de uno en curso
+    assert controller.in_flight() == 1
+    assert controller.get_stats()['queued_clients'] == 0
+    for waiter in waiters:
+        waiter.join(1)
+        assert waiter.error is None
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, max_queue_wait=5)
+    controller.acquire('holder')
+    granted = []
+    waiter = enqueue(controller, 'a', granted)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire('b')
+    assert excinfo.value.reason == SHED_QUEUE_FULL
+    assert excinfo.value.status == 503
+    assert excinfo.value.retry_after >= 1
+
+    controller.release()
+    waiter.join(1)
+    assert granted == ['a']
+
+
+def test_rejects_client_over_its_share_with_429():
+    controller = AdmissionController(max_in_flight=1, max_queue_per_client=1, max_queue_wait=5)
+    controller.acquire('holder')
+    granted = []
+    waiter = enqueue(controller, 'greedy', granted)
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire('greedy')
+    assert excinfo.value.reason == SHED_CLIENT_LIMIT
+    assert excinfo.value.status == 429
+    # Otro cliente todavía entra en la cola
+    other = enqueue(controller, 'polite', granted)
+
+    controller.release()
+    controller.release()
+    waiter.join(1)
+    other.join(1)
+    assert granted == ['greedy', 'polite']
+
+
+def test_timeout_leaves_queue_and_slot_consistent():
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=0.05)
+    controller.acquire('holder')
+
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire('late')
+    assert excinfo.value.reason == SHED_TIMEOUT
+
+    assert controller.queue_depth() == 0
+    assert controller.get_stats()['queued_clients'] == 0
+    controller.release()
+    # El lugar vuelve a estar libre: nadie lo recibió después del vencimiento
+    assert controller.in_flight() == 0
+    controller.acquire('next')
+    assert controller.in_flight() == 1
+
+
+def test_grant_racing_with_timeout_is_not_lost(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=5)
+    controller.acquire('holder')
+
+    class LateGrantEvent(threading.Event):
+        def wait(self, timeout=None):
+            # El turno llega justo cuando la espera ya venció
+            controller.release()
+            return False
+
+    class LateGrantTicket(admission._Ticket):
+        def __init__(self):
+            super().__init__()
+            self.event = LateGrantEvent()
+
+    monkeypatch.setattr(admission, '_Ticket', LateGrantTicket)
+
+    # Recibió el lugar: debe quedar admitida, no descartada por tiempo
+    controller.acquire('racer')
+
+    assert controller.in_flight() == 1
+    assert controller.queue_depth() == 0
+    assert controller.shed_counts()[SHED_TIMEOUT] == 0
+    controller.release()
+    assert controller.in_flight() == 0
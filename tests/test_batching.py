@@ -0,0 +1,144 @@
+"""Pruebas del planificador de micro-lotes"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import BatchScheduler
+
+
+class RecordingModel:
+    """Duplica cada imagen y anota el tamaño de cada lote recibido"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, images):
+        self.batch_sizes.append(len(images))
+        return list(images * 2)
+
+
+def submit_concurrently(scheduler, images):
+    results = [None] * len(images)
+    errors = []
+
+    def submit(i):
+        try:
+            results[i] = scheduler.submit(images[i])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(images))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_flush_on_size_without_waiting_for_deadline():
+    model = RecordingModel()
+    # Con una espera de 10 s, solo llenar el lote puede despacharlo a tiempo
+    scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=10_000)
+    images = [np.full((2, 2, 3), i, dtype=np.float32) for i in range(4)]
+
+    started = time.perf_counter()
+    results, errors = submit_concurrently(scheduler, images)
+    elapsed = time.perf_counter() - started
+
+    assert not errors
+    assert elapsed < 5
+    assert model.batch_sizes == [4]
+    # Cada llamador recibe el resultado de su propia imagen
+    for image, result in zip(images, results):
+        np.testing.assert_array_equal(result, image * 2)
+
+
+def test_flush_on_deadline_with_partial_batch():
+    model = RecordingModel()
+    scheduler = BatchScheduler(model, max_batch_size=16, max_wait_ms=50)
+
+    started = time.perf_counter()
+    result = scheduler.submit(np.ones((2, 2, 3), dtype=np.float32))
+    elapsed = time.perf_counter() - started
+
+    np.testing.assert_array_equal(result, np.full((2, 2, 3), 2.0))
+    assert model.batch_sizes == [1]
+    assert 0.05 <= elapsed < 5
+    stats = scheduler.get_stats()
+    assert stats['total_batches'] == 1
+    assert stats['batch_size_distribution'] == {'1': 1}
+
+
+def test_batch_never_exceeds_max_size():
+    model = RecordingModel()
+    scheduler = BatchScheduler(model, max_batch_size=3, max_wait_ms=20)
+    images = [np.full((1, 1, 3), i, dtype=np.float32) for i in range(7)]
+
+    results, errors = submit_concurrently(scheduler, images)
+
+    assert not errors
+    assert sum(model.batch_sizes) == 7
+    assert max(model.batch_sizes) <= 3
+    for image, result in zip(images, results):
+        np.testing.assert_array_equal(result, image * 2)
+
+
+def test_inference_error_reaches_every_caller():
+    def failing_model(images):
+        raise ValueError('modelo roto')
+
+    scheduler = BatchScheduler(failing_model, max_batch_size=2, max_wait_ms=10_000)
+    results, errors = submit_concurrently(scheduler, [np.zeros((1, 1, 3))] * 2)
+
+    assert results == [None, None]
+    assert len(errors) == 2
+    assert all(isinstance(error, ValueError) for error in errors)
+
+
+def test_submit_times_out_when_inference_hangs():
+    release = threading.Event()
+
+    def hanging_model(images):
+        release.wait(5)
+        return list(images)
+
+    scheduler = BatchScheduler(hanging_model, max_batch_size=1, max_wait_ms=0, timeout=0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            scheduler.submit(np.zeros((1, 1, 3)))
+    finally:
+        release.set()
+
+
+def test_timed_out_request_leaves_the_queue_without_inference():
+    release = threading.Event()
+    inferred = []
+
+    def hanging_model(images):
+        inferred.append(len(images))
+        release.wait(5)
+        return list(images)
+
+    scheduler = BatchScheduler(hanging_model, max_batch_size=1, max_wait_ms=0, timeout=0.1)
+    # La primera ocupa el modelo; la segunda vence esperando en la cola
+    first = threading.Thread(target=lambda: pytest.raises(TimeoutError, scheduler.submit,
+                                                          np.zeros((1, 1, 3))))
+    first.start()
+    while not inferred:
+        time.sleep(0.001)
+    with pytest.raises(TimeoutError):
+        scheduler.submit(np.ones((1, 1, 3)))
+
+    assert scheduler.queue_depth() == 0
+    release.set()
+    first.join(5)
+    # Sin trabajo pendiente, el modelo no vuelve a ejecutarse
+    time.sleep(0.05)
+    assert inferred == [1]
+    assert scheduler.get_stats()['total_timeouts'] == 2
+    # El planificador sigue atendiendo
+    scheduler.timeout = 5
+    np.testing.assert_array_equal(scheduler.submit(np.ones((1, 1, 3))), np.ones((1, 1, 3)))
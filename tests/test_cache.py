@@ -0,0 +1,132 @@
+"""Pruebas de la caché de predicciones (memoria LRU/TTL y capa en disco)"""
+
+import json
+import os
+import time
+
+from cache import PredictionCache
+
+
+def value(i):
+    return {'class': f'Clase_{i}', 'confidence': 0.9}
+
+
+def entry_size(i):
+    return len(json.dumps(value(i), ensure_ascii=False).encode('utf-8'))
+
+
+def disk_files(disk_dir):
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(disk_dir) for name in names if name.endswith('.json')
+    )
+
+
+def test_make_key_depends_on_content_and_version():
+    key = PredictionCache.make_key(b'imagen', 'v1')
+    assert key == PredictionCache.make_key(b'imagen', 'v1')
+    assert key != PredictionCache.make_key(b'imagen', 'v2')
+    assert key != PredictionCache.make_key(b'otra', 'v1')
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(max_bytes=2 * entry_size(0))
+    cache.put('a', value(0))
+    cache.put('b', value(1))
+    # Leer 'a' la vuelve la más reciente: sale 'b'
+    assert cache.get('a') == value(0)
+    cache.put('c', value(2))
+
+    assert cache.get('b') is None
+    assert cache.get('a') == value(0)
+    assert cache.get('c') == value(2)
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] <= stats['max_bytes']
+
+
+def test_value_larger_than_budget_is_not_stored():
+    cache = PredictionCache(max_bytes=entry_size(0) - 1)
+    cache.put('a', value(0))
+
+    assert cache.get('a') is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_ttl_expires_memory_entries():
+    cache = PredictionCache(ttl=0.05)
+    cache.put('a', value(0))
+    assert cache.get('a') == value(0)
+    time.sleep(0.1)
+
+    assert cache.get('a') is None
+    stats = cache.get_stats()
+    assert stats['entries'] == 0
+    assert stats['misses'] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    disk_dir = str(tmp_path / 'cache')
+    PredictionCache(disk_dir=disk_dir).put('ab12', value(0))
+
+    cache = PredictionCache(disk_dir=disk_dir)
+    assert cache.get('ab12') == value(0)
+    # El acierto en disco se promueve a memoria
+    assert cache.get('ab12') == value(0)
+    stats = cache.get_stats()
+    assert stats['disk_hits'] == 1
+    assert stats['hits'] == 1
+
+
+def test_expired_disk_entry_is_deleted_on_read(tmp_path):
+    disk_dir = str(tmp_path / 'cache')
+    PredictionCache(ttl=0.05, disk_dir=disk_dir).put('ab12', value(0))
+    time.sleep(0.1)
+
+    cache = PredictionCache(ttl=0.05, disk_dir=disk_dir)
+    assert cache.get('ab12') is None
+    assert disk_files(disk_dir) == []
+    assert cache.get_stats()['disk_expired'] == 1
+
+
+def test_sweep_evicts_least_recently_accessed_over_budget(tmp_path):
+    disk_dir = str(tmp_path / 'cache')
+    # Sin presupuesto al escribir: el barrido se lanza a mano
+    cache = PredictionCache(disk_dir=disk_dir, disk_max_bytes=0)
+    keys = [f'{i:02x}' * 32 for i in range(3)]
+    for key in keys:
+        cache.put(key, value(0))
+    paths = {key: cache._disk_path(key) for key in keys}
+    now = time.time()
+    for age, key in zip((30, 10, 20), keys):
+        os.utime(paths[key], (now - age, now))
+
+    size = os.path.getsize(paths[keys[0]])
+    cache.disk_max_bytes = int(2.5 * size)
+    cache.sweep_disk()
+
+    # Sobre el presupuesto (3 > 2.5) se baja al 90%: sale solo el de acceso más viejo
+    assert disk_files(disk_dir) == sorted([paths[keys[1]], paths[keys[2]]])
+    stats = cache.get_stats()
+    assert stats['disk_evictions'] == 1
+    assert stats['disk_bytes'] == sum(os.path.getsize(path) for path in disk_files(disk_dir))
+
+
+def test_sweep_removes_expired_files_and_stale_temporaries(tmp_path):
+    disk_dir = str(tmp_path / 'cache')
+    cache = PredictionCache(ttl=60, disk_dir=disk_dir)
+    cache.put('aa' * 32, value(0))
+    cache.put('bb' * 32, value(1))
+    old = time.time() - 120
+    os.utime(cache._disk_path('aa' * 32), (old, old))
+    stale_tmp = cache._disk_path('bb' * 31 + 'cc') + '.1.1.tmp'
+    with open(stale_tmp, 'w') as f:
+        f.write('{')
+    very_old = time.time() - 2 * PredictionCache.STALE_TMP_SECONDS
+    os.utime(stale_tmp, (very_old, very_old))
+
+    cache.sweep_disk()
+
+    assert disk_files(disk_dir) == [cache._disk_path('bb' * 32)]
+    assert not os.path.exists(stale_tmp)
+    assert cache.get_stats()['disk_expired'] == 1
@@ -0,0 +1,197 @@
+"""Pruebas del historial columnar: paginación, filtros e importación del log"""
+
+import json
+
+import numpy as np
+import pytest
+
+from history import PredictionHistory
+from model_loader import DEFAULT_CLASS_NAMES
+from prediction import PredictionLogger
+
+CLASSES = DEFAULT_CLASS_NAMES[:3]
+
+
+def make_result(class_name, confidence):
+    vector = np.full(len(DEFAULT_CLASS_NAMES), (1.0 - confidence) / (len(DEFAULT_CLASS_NAMES) - 1))
+    vector[DEFAULT_CLASS_NAMES.index(class_name)] = confidence
+    return {'class': class_name, 'confidence': confidence, 'all_predictions': vector.tolist(),
+            'model_version': 'v1'}
+
+
+def make_entry(i, class_name=None, confidence=0.5, timestamp=None):
+    entry = PredictionLogger.make_entry(f'img_{i}.jpg', make_result(class_name or CLASSES[i % 3], confidence),
+                                        class_names=DEFAULT_CLASS_NAMES)
+    entry['timestamp'] = timestamp or f'2024-06-01T10:00:{i % 60:02d}'
+    return entry
+
+
+@pytest.fixture
+def logger(tmp_path):
+    logger = PredictionLogger(str(tmp_path / 'predictions_log'), legacy_file=None)
+    yield logger
+    logger.close()
+
+
+def open_history(logger, **kwargs):
+    kwargs.setdefault('refresh_interval', 3600)
+    return PredictionHistory(logger, **kwargs)
+
+
+def ids(page):
+    return [item['id'] for item in page['items']]
+
+
+def test_pagination_is_stable_while_rows_are_appended(logger):
+    logger.append_many([make_entry(i) for i in range(25)])
+    # Bloques chicos: cada página cruza varios bloques
+    history = open_history(logger, chunk_rows=4)
+
+    first = history.query(limit=10)
+    assert ids(first) == list(range(24, 14, -1))
+    # Las filas nuevas no desplazan las páginas siguientes
+    logger.append_many([make_entry(i) for i in range(25, 30)])
+    second = history.query(limit=10, cursor=first['next_cursor'])
+    third = history.query(limit=10, cursor=second['next_cursor'])
+
+    assert ids(second) == list(range(14, 4, -1))
+    assert ids(third) == list(range(4, -1, -1))
+    assert third['next_cursor'] is None
+    assert third['total_rows'] == 30
+    assert ids(history.query(limit=5)) == list(range(29, 24, -1))
+
+
+def test_page_ending_exactly_at_first_row_has_no_next_cursor(logger):
+    logger.append_many([make_entry(i) for i in range(10)])
+    history = open_history(logger, chunk_rows=3)
+
+    page = history.query(limit=10)
+    assert ids(page) == list(range(9, -1, -1))
+    assert page['next_cursor'] is None
+
+
+def test_filtered_pagination_across_chunks(logger):
+    logger.append_many([make_entry(i) for i in range(30)])
+    history = open_history(logger, chunk_rows=4)
+
+    seen = []
+    cursor = None
+    while True:
+        page = history.query(limit=3, cursor=cursor, class_names=[CLASSES[1]])
+        seen.extend(ids(page))
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [i for i in range(29, -1, -1) if i % 3 == 1]
+
+
+def test_confidence_bounds_are_inclusive(logger):
+    confidences = [0.25, 0.5, 0.75, 1.0]
+    logger.append_many([make_entry(i, CLASSES[0], confidence) for i, confidence in enumerate(confidences)])
+    history = open_history(logger)
+
+    page = history.query(min_confidence=0.5, max_confidence=0.75)
+    assert sorted(item['confidence'] for item in page['items']) == [0.5, 0.75]
+    assert ids(history.query(min_confidence=1.0)) == [3]
+    assert ids(history.query(max_confidence=0.25)) == [0]
+
+
+def test_time_bounds_are_inclusive_at_written_precision(logger):
+    timestamps = ['2024-05-31T23:59:59.999', '2024-06-01T00:00:00', '2024-06-01T12:30:00',
+                  '2024-06-01T23:59:59.999', '2024-06-02T00:00:00']
+    logger.append_many([make_entry(i, timestamp=timestamp) for i, timestamp in enumerate(timestamps)])
+    history = open_history(logger)
+
+    assert ids(history.query(start='2024-06-01', end='2024-06-01')) == [3, 2, 1]
+    assert ids(history.query(start='2024-06-01T12:30', end='2024-06-01T12:30')) == [2]
+    assert ids(history.query(end='2024-05-31')) == [0]
+    assert ids(history.query(start='2024-06-02')) == [4]
+
+
+def test_combined_filters(logger):
+    entries = [
+        make_entry(0, CLASSES[0], 0.9, '2024-06-01T08:00:00'),
+        make_entry(1, CLASSES[1], 0.9, '2024-06-01T09:00:00'),
+        make_entry(2, CLASSES[0], 0.4, '2024-06-01T10:00:00'),
+        make_entry(3, CLASSES[0], 0.95, '2024-06-02T08:00:00'),
+        make_entry(4, CLASSES[0], 0.8, '2024-06-01T11:00:00'),
+    ]
+    logger.append_many(entries)
+    history = open_history(logger)
+
+    page = history.query(class_names=[CLASSES[0]], min_confidence=0.8, start='2024-06-01', end='2024-06-01')
+    assert ids(page) == [4, 0]
+    assert all(item['recommendation'] for item in page['items'])
+    assert ids(history.query(class_names=['Clase_inexistente'])) == []
+    assert ids(history.query(model_version='v2')) == []
+
+
+def test_probability_vector_and_derived_top_k(logger):
+    logger.append_many([make_entry(0, CLASSES[2], 0.82)])
+    history = open_history(logger)
+
+    item = history.query(include_probabilities=True)['items'][0]
+    assert set(item['probabilities']) == set(DEFAULT_CLASS_NAMES)
+    assert item['probabilities'][CLASSES[2]] == pytest.approx(0.82, abs=1e-3)
+    assert sum(item['probabilities'].values()) == pytest.approx(1.0, abs=1e-2)
+    assert item['top_k'][0][0] == CLASSES[2]
+    assert len(item['top_k']) == 3
+    assert history.get_stats()['probability_width'] >= len(DEFAULT_CLASS_NAMES)
+
+
+def test_new_class_widens_probability_columns(logger):
+    logger.append_many([make_entry(0)])
+    history = open_history(logger)
+    history.query()
+    width = history.get_stats()['probability_width']
+
+    entry = PredictionLogger.make_entry('new.jpg', {'class': 'Clase_nueva', 'confidence': 0.7,
+                                                    'all_predictions': [0.7, 0.3]},
+                                        class_names=['Clase_nueva', CLASSES[0]])
+    logger.append_many([entry])
+    items = history.query(include_probabilities=True)['items']
+
+    assert history.get_stats()['probability_width'] == width + 1
+    # float16: tres cifras significativas
+    assert items[0]['probabilities'] == pytest.approx({'Clase_nueva': 0.7, CLASSES[0]: 0.3}, abs=1e-3)
+    # Las filas anteriores conservan su vector completo
+    assert len(items[1]['probabilities']) == len(DEFAULT_CLASS_NAMES)
+
+
+def test_history_survives_restart(logger):
+    logger.append_many([make_entry(i) for i in range(5)])
+    open_history(logger).query()
+    logger.append_many([make_entry(i) for i in range(5, 8)])
+
+    history = open_history(logger)
+    page = history.query(limit=100)
+    assert ids(page) == list(range(7, -1, -1))
+    assert page['items'][0]['filename'] == 'img_7.jpg'
+
+
+def test_legacy_log_import(tmp_path):
+    # Formato anterior: vector sin nombres y la recomendación completa
+    legacy = []
+    for i, class_name in enumerate(CLASSES):
+        result = make_result(class_name, 0.9)
+        legacy.append({
+            'timestamp': f'2024-01-0{i + 1}T12:00:00',
+            'image_filename': f'legacy_{i}.jpg',
+            'prediction': {'class': class_name, 'confidence': 0.9,
+                           'all_predictions': result['all_predictions']},
+            'recommendation': {'diagnosis': '...'}
+        })
+    legacy_file = tmp_path / 'predictions_log.json'
+    legacy_file.write_text(json.dumps(legacy, indent=2))
+    logger = PredictionLogger(str(tmp_path / 'predictions_log'), legacy_file=str(legacy_file))
+    try:
+        history = open_history(logger)
+        page = history.query(include_probabilities=True)
+
+        assert [item['filename'] for item in page['items']] == ['legacy_2.jpg', 'legacy_1.jpg', 'legacy_0.jpg']
+        assert [item['class'] for item in page['items']] == CLASSES[::-1]
+        assert all(item['model_version'] is None for item in page['items'])
+        assert len(page['items'][0]['probabilities']) == len(DEFAULT_CLASS_NAMES)
+        assert ids(history.query(start='2024-01-02', end='2024-01-02')) == [1]
+    finally:
+        logger.close()
@@ -0,0 +1,262 @@
+"""Pruebas del log de predicciones en segmentos JSON Lines"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import BACKEND_DIR
+from prediction import AsyncPredictionWriter, PredictionLogger
+
+
+def make_result(i):
+    return {'class': f'Clase_{i % 3}', 'confidence': 0.5 + (i % 5) / 10,
+            'model_version': 'v1'}
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    return str(tmp_path / 'predictions_log')
+
+
+def open_logger(log_dir, **kwargs):
+    kwargs.setdefault('legacy_file', None)
+    return PredictionLogger(log_dir, **kwargs)
+
+
+def test_rotates_when_segment_exceeds_size(log_dir):
+    logger = open_logger(log_dir, max_segment_bytes=500)
+    for i in range(20):
+        logger.log_prediction(f'img_{i}.jpg', make_result(i))
+    segments = logger.list_segments()
+
+    assert len(segments) > 1
+    # Solo se rota después de superar el límite, nunca a mitad de una línea
+    for path in segments[:-1]:
+        assert os.path.getsize(path) >= 500
+    assert [entry['image_filename'] for entry in logger.iter_entries()] == \
+        [f'img_{i}.jpg' for i in range(20)]
+    logger.close()
+
+
+def test_rotates_by_age(log_dir):
+    logger = open_logger(log_dir, max_segment_age=0)
+    for i in range(3):
+        logger.log_prediction(f'img_{i}.jpg', make_result(i))
+
+    assert len(logger.list_segments()) == 3
+    logger.close()
+
+
+def test_reopening_continues_last_segment(log_dir):
+    logger = open_logger(log_dir)
+    logger.log_prediction('a.jpg', make_result(0))
+    logger.close()
+
+    logger = open_logger(log_dir)
+    logger.log_prediction('b.jpg', make_result(1))
+
+    assert len(logger.list_segments()) == 1
+    assert [entry['image_filename'] for entry in logger.iter_entries()] == ['a.jpg', 'b.jpg']
+    logger.close()
+
+
+def test_second_logger_follows_rotation(log_dir):
+    first = open_logger(log_dir, max_segment_bytes=300)
+    second = open_logger(log_dir, max_segment_bytes=300)
+    for i in range(10):
+        (first if i % 2 else second).log_prediction(f'img_{i}.jpg', make_result(i))
+
+    # Ambos escriben solo en el segmento más nuevo: el orden se conserva
+    assert [entry['image_filename'] for entry in first.iter_entries()] == \
+        [f'img_{i}.jpg' for i in range(10)]
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize('partial', [b'{"timestamp": "2024-01-0', b'x' * 10000])
+def test_repair_tail_drops_incomplete_line(log_dir, partial):
+    logger = open_logger(log_dir)
+    logger.log_prediction('a.jpg', make_result(0))
+    path = logger.list_segments()[-1]
+    logger.close()
+    complete_size = os.path.getsize(path)
+    # Simular un corte a mitad de escritura (incluso más largo que un bloque)
+    with open(path, 'ab') as f:
+        f.write(partial)
+
+    logger = open_logger(log_dir)
+    assert os.path.getsize(path) == complete_size
+    logger.log_prediction('b.jpg', make_result(1))
+
+    assert [entry['image_filename'] for entry in logger.iter_entries()] == ['a.jpg', 'b.jpg']
+    logger.close()
+
+
+def test_repair_tail_empties_segment_without_newline(log_dir):
+    os.makedirs(log_dir)
+    path = os.path.join(log_dir, 'segment-000001.jsonl')
+    with open(path, 'wb') as f:
+        f.write(b'{"timestamp": "2024')
+
+    logger = open_logger(log_dir)
+
+    assert os.path.getsize(path) == 0
+    assert list(logger.iter_entries()) == []
+    logger.close()
+
+
+def test_legacy_log_is_imported_once(log_dir, tmp_path):
+    legacy_file = tmp_path / 'predictions_log.json'
+    legacy_entries = [PredictionLogger.make_entry(f'old_{i}.jpg', make_result(i)) for i in range(3)]
+    legacy_file.write_text(json.dumps(legacy_entries))
+
+    logger = open_logger(log_dir, legacy_file=str(legacy_file))
+    logger.close()
+    # Un log heredado que reaparece (p. ej. restaurado) no se vuelve a importar
+    os.replace(str(legacy_file) + '.migrated', legacy_file)
+    logger = open_logger(log_dir, legacy_file=str(legacy_file))
+
+    assert [entry['image_filename'] for entry in logger.iter_entries()] == \
+        ['old_0.jpg', 'old_1.jpg', 'old_2.jpg']
+    assert not legacy_file.exists()
+    logger.close()
+
+
+class GatedLogger(PredictionLogger):
+    """Logger cuyo append_many espera a `gate`: deja al escritor ocupado
+    mientras la prueba llena la cola"""
+
+    def __init__(self, *args, **kwargs):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.writing = threading.Event()
+        super().__init__(*args, **kwargs)
+
+    def append_many(self, entries):
+        self.writing.set()
+        self.gate.wait(5)
+        super().append_many(entries)
+
+
+def stalled_writer(log_dir, policy, max_queue=2):
+    """Escritor con el hilo de fondo detenido en una escritura y la cola llena"""
+    logger = GatedLogger(log_dir, legacy_file=None)
+    writer = AsyncPredictionWriter(logger, max_queue=max_queue, policy=policy, flush_interval=0.01)
+    logger.gate.clear()
+    writer.log_prediction('busy.jpg', make_result(0))
+    assert logger.writing.wait(5)
+    for i in range(max_queue):
+        writer.log_prediction(f'queued_{i}.jpg', make_result(i))
+    assert writer.queue_depth() == max_queue
+    return logger, writer
+
+
+def logged_filenames(log_dir):
+    reader = open_logger(log_dir)
+    try:
+        return sorted(entry['image_filename'] for entry in reader.iter_entries())
+    finally:
+        reader.close()
+
+
+def test_writer_rejects_unknown_policy(log_dir):
+    logger = open_logger(log_dir)
+    with pytest.raises(ValueError):
+        AsyncPredictionWriter(logger, policy='ignore')
+    logger.close()
+
+
+def test_full_queue_drop_policy_counts_and_discards(log_dir):
+    logger, writer = stalled_writer(log_dir, 'drop')
+    writer.log_prediction('dropped.jpg', make_result(9))
+    assert writer.get_stats()['dropped'] == 1
+
+    logger.gate.set()
+    writer.close()
+    assert logged_filenames(log_dir) == ['busy.jpg', 'queued_0.jpg', 'queued_1.jpg']
+
+
+def test_full_queue_spill_policy_writes_own_spill_file(log_dir):
+    logger, writer = stalled_writer(log_dir, 'spill')
+    writer.log_prediction('spilled_0.jpg', make_result(8))
+    writer.log_prediction('spilled_1.jpg', make_result(9))
+
+    spill_file = os.path.join(log_dir, f'spill-{os.getpid()}.jsonl')
+    assert writer.spill_file == spill_file
+    with open(spill_file, encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+    assert writer.get_stats()['spilled'] == 2
+
+    logger.gate.set()
+    writer.close()
+    # Al cerrar no queda nada desbordado sin importar
+    assert not os.path.exists(spill_file)
+    assert logged_filenames(log_dir) == ['busy.jpg', 'queued_0.jpg', 'queued_1.jpg',
+                                         'spilled_0.jpg', 'spilled_1.jpg']
+
+
+def test_full_queue_block_policy_waits_for_room(log_dir):
+    logger, writer = stalled_writer(log_dir, 'block')
+    blocked = threading.Thread(target=writer.log_prediction, args=('blocked.jpg', make_result(9)))
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+
+    logger.gate.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    writer.close()
+    assert logged_filenames(log_dir) == ['blocked.jpg', 'busy.jpg', 'queued_0.jpg', 'queued_1.jpg']
+
+
+def finished_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_spill(path, filenames, partial=False):
+    with open(path, 'w', encoding='utf-8') as f:
+        for name in filenames:
+            f.write(json.dumps(PredictionLogger.make_entry(name, make_result(0))) + '\n')
+        if partial:
+            f.write('{"timestamp": "20')
+
+
+def test_restart_drains_leftover_spills_of_finished_processes(log_dir):
+    os.makedirs(log_dir)
+    dead_spill = os.path.join(log_dir, f'spill-{finished_pid()}.jsonl')
+    legacy_spill = os.path.join(log_dir, 'spill.jsonl')
+    own_spill = os.path.join(log_dir, f'spill-{os.getpid()}.jsonl')
+    # El proceso padre sigue vivo: su desborde es suyo
+    live_spill = os.path.join(log_dir, f'spill-{os.getppid()}.jsonl')
+    write_spill(dead_spill, ['dead_0.jpg', 'dead_1.jpg'], partial=True)
+    write_spill(legacy_spill, ['legacy.jpg'])
+    write_spill(own_spill, ['own.jpg'])
+    write_spill(live_spill, ['live.jpg'])
+
+    writer = AsyncPredictionWriter(open_logger(log_dir), policy='spill')
+    writer.close()
+
+    assert logged_filenames(log_dir) == ['dead_0.jpg', 'dead_1.jpg', 'legacy.jpg', 'own.jpg']
+    assert sorted(name for name in os.listdir(log_dir) if name.startswith('spill')) == \
+        [os.path.basename(live_spill)]
+
+
+def test_pending_entries_are_written_at_exit(log_dir):
+    script = (
+        'import sys; sys.path.insert(0, sys.argv[1])\n'
+        'from prediction import AsyncPredictionWriter, PredictionLogger\n'
+        'writer = AsyncPredictionWriter(PredictionLogger(sys.argv[2], legacy_file=None),\n'
+        '                               flush_interval=60)\n'
+        'for i in range(100):\n'
+        '    writer.log_prediction(f"exit_{i}.jpg", {"class": "A", "confidence": 0.9})\n'
+    )
+    # Sin close(): lo pendiente se escribe en atexit
+    subprocess.run([sys.executable, '-c', script, BACKEND_DIR, log_dir], check=True, timeout=60)
+
+    assert logged_filenames(log_dir) == sorted(f'exit_{i}.jpg' for i in range(100))
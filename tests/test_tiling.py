@@ -0,0 +1,81 @@
+"""Pruebas de la grilla de teselas: cobertura completa hasta los bordes"""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from tiling import _grid_positions, load_tiles, plan_tiles
+
+
+def coverage(length, tile_size, stride):
+    covered = np.zeros(length, dtype=bool)
+    for start in _grid_positions(length, tile_size, stride):
+        covered[start:start + tile_size] = True
+    return covered
+
+
+@pytest.mark.parametrize('length', [224, 225, 300, 391, 392, 393, 1000, 4032])
+def test_grid_reaches_both_edges_without_gaps(length):
+    positions = _grid_positions(length, 224, 168)
+
+    assert positions[0] == 0
+    # La última tesela termina exactamente en el borde, sin salirse
+    assert positions[-1] + 224 == length
+    assert np.all(np.diff(positions) <= 168)
+    assert coverage(length, 224, 168).all()
+
+
+def test_grid_on_axis_shorter_than_tile():
+    assert list(_grid_positions(100, 224, 168)) == [0]
+
+
+@pytest.mark.parametrize('width,height', [(100, 80), (224, 224), (1000, 300), (4032, 3024)])
+def test_plan_covers_tile_and_respects_max_tiles(width, height):
+    (scaled_width, scaled_height), stride = plan_tiles(width, height, 224, 0.25, max_tiles=16)
+
+    assert scaled_width >= 224 and scaled_height >= 224
+    rows = len(_grid_positions(scaled_height, 224, stride))
+    cols = len(_grid_positions(scaled_width, 224, stride))
+    assert rows * cols <= 16
+    # Reducir conserva la proporción (salvo el redondeo a píxeles)
+    assert abs(scaled_width / scaled_height - width / height) < 0.05 * width / height
+
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_tiles_match_image_including_edges():
+    rng = np.random.default_rng(0)
+    # Tamaño que no necesita reescalarse y no es múltiplo del paso
+    image = rng.integers(0, 256, size=(300, 500, 3), dtype=np.uint8)
+
+    tiles, (rows, cols) = load_tiles(encode_png(image), tile_size=224, overlap=0.25, max_tiles=64)
+
+    assert tiles.shape == (rows * cols, 224, 224, 3)
+    ys = _grid_positions(300, 224, 168)
+    xs = _grid_positions(500, 224, 168)
+    covered = np.zeros(image.shape[:2], dtype=bool)
+    for i, y in enumerate(ys):
+        for j, x in enumerate(xs):
+            np.testing.assert_array_equal(tiles[i * cols + j], image[y:y + 224, x:x + 224])
+            covered[y:y + 224, x:x + 224] = True
+    assert covered.all()
+    # La esquina inferior derecha es el último píxel de la última tesela
+    np.testing.assert_array_equal(tiles[-1][-1, -1], image[-1, -1])
+
+
+def test_small_image_is_upscaled_until_short_side_fills_a_tile():
+    square = np.zeros((50, 50, 3), dtype=np.uint8)
+    tiles, grid = load_tiles(encode_png(square), tile_size=224)
+    assert grid == (1, 1)
+    assert tiles.shape == (1, 224, 224, 3)
+
+    # Se conserva la proporción: el lado largo puede requerir más teselas
+    assert plan_tiles(80, 50, 224) == ((358, 224), 168)
+    _, grid = load_tiles(encode_png(np.zeros((50, 80, 3), dtype=np.uint8)), tile_size=224)
+    assert grid == (1, 2)
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Pipeline de datos para entrenar el modelo de cultivos con tf.data
+
+Reemplaza a `cargar_plantvillage` del notebook (ImageDataGenerator que
+decodifica cada JPEG en cada época, en un solo hilo):
+
+1. `build`: convierte una vez el dataset a shards TFRecord con las imágenes
+   ya redimensionadas a 224x224 (uint8 sin comprimir), respetando las
+   mismas clases y la misma partición entrenamiento/validación que
+   flow_from_directory con validation_split=0.2.
+2. `make_dataset` / `cargar_plantvillage_shards`: lee los shards con
+   lectura intercalada, parseo en paralelo, caché, aumentos vectorizados
+   por lote y prefetch.
+3. `InputPipelineTimer`: callback que informa el tiempo por época y cuánto
+   de ese tiempo el entrenamiento estuvo esperando datos.
+
+Ejemplos:
+    python training/data_pipeline.py build "/datos/plantvillage dataset/color" --output shards/
+    python training/data_pipeline.py bench shards/ --epochs 2
+    python training/data_pipeline.py train shards/ --epochs-init 15 --epochs-fine-tune 10
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'Backend')
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+import tensorflow as tf
+
+from model_loader import IMAGE_SIZE, decode_image
+
+# Mismas clases (y en el mismo orden) que cargar_plantvillage en el notebook
+CLASSES = [
+    'Tomato___Bacterial_spot', 'Tomato___Early_blight',
+    'Tomato___Late_blight', 'Tomato___Leaf_Mold', 'Tomato___Septoria_leaf_spot',
+    'Tomato___Spider_mites Two-spotted_spider_mite', 'Tomato___Target_Spot',
+    'Tomato___Tomato_Yellow_Leaf_Curl_Virus', 'Tomato___Tomato_mosaic_virus', 'Tomato___healthy'
+]
+VALIDATION_SPLIT = 0.2
+# Extensiones que acepta flow_from_directory
+KERAS_IMAGE_FORMATS = {'.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff'}
+MANIFEST_NAME = 'manifest.json'
+SEED = 1234
+
+# Rangos de aumento del ImageDataGenerator del notebook (mismas unidades:
+# grados para rotación y corte, fracción para desplazamiento y zoom,
+# intensidad 0-255 para el desplazamiento de canal)
+AUGMENTATION = {
+    'rotation_range': 20.0,
+    'width_shift_range': 0.2,
+    'height_shift_range': 0.2,
+    'shear_range': 0.2,
+    'zoom_range': 0.2,
+    'brightness_range': (0.7, 1.3),
+    'channel_shift_range': 0.2,
+    'horizontal_flip': True,
+    'vertical_flip': True
+}
+
+
+def split_files(data_dir, classes=CLASSES, validation_split=VALIDATION_SPLIT):
+    """Archivos de entrenamiento y validación como (ruta, etiqueta)
+
+    Reproduce la partición de flow_from_directory: por clase, archivos en
+    orden alfabético; el primer `validation_split` va a validación.
+    """
+    train, validation = [], []
+    for label, class_name in enumerate(classes):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir):
+            raise FileNotFoundError(f"No existe la carpeta de la clase: {class_dir}")
+        files = []
+        for root, _, names in sorted(os.walk(class_dir), key=lambda item: item[0]):
+            for name in sorted(names):
+                if os.path.splitext(name)[1].lower() in KERAS_IMAGE_FORMATS:
+                    files.append((os.path.join(root, name), label))
+        split_at = int(validation_split * len(files))
+        validation.extend(files[:split_at])
+        train.extend(files[split_at:])
+    return train, validation
+
+
+def _decode_worker(item):
+    """Decodificar y redimensionar en un proceso del pool (mismo preprocesado que el servidor)"""
+    path, label = item
+    try:
+        return decode_image(path, normalize=False).tobytes(), label, None
+    except Exception as e:
+        return None, label, f"{path}: {e}"
+
+
+def _serialize(image_bytes, label):
+    return tf.train.Example(features=tf.train.Features(feature={
+        'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image_bytes])),
+        'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[label]))
+    })).SerializeToString()
+
+
+def write_shards(items, output_dir, subset, pool, images_per_shard=1000):
+    """Escribir un subconjunto en shards TFRecord; devuelve cuántas imágenes quedaron"""
+    num_shards = max(1, math.ceil(len(items) / images_per_shard))
+    writers = [
+        tf.io.TFRecordWriter(os.path.join(output_dir, f'{subset}-{index:05d}-of-{num_shards:05d}.tfrecord'))
+        for index in range(num_shards)
+    ]
+    written = 0
+    try:
+        for index, (image_bytes, label, error) in enumerate(
+                pool.imap(_decode_worker, items, chunksize=16)):
+            if error:
+                print(f"⚠️ Imagen omitida ({error})")
+                continue
+            writers[index // images_per_shard].write(_serialize(image_bytes, label))
+            written += 1
+            if written % 5000 == 0:
+                print(f"⏳ {subset}: {written}/{len(items)} imágenes")
+    finally:
+        for writer in writers:
+            writer.close()
+    return written
+
+
+def build_shards(data_dir, output_dir, images_per_shard=1000, workers=None,
+                 classes=CLASSES, validation_split=VALIDATION_SPLIT):
+    """Convertir el dataset a shards pre-redimensionados (se hace una sola vez)"""
+    train, validation = split_files(data_dir, classes, validation_split)
+    # Mezclar antes de repartir para que cada shard tenga todas las clases
+    random.Random(SEED).shuffle(train)
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        counts = {
+            'train': write_shards(train, output_dir, 'train', pool, images_per_shard),
+            'validation': write_shards(validation, output_dir, 'validation', pool, images_per_shard)
+        }
+
+    manifest = {
+        'source': os.path.abspath(data_dir),
+        'classes': list(classes),
+        'image_size': list(IMAGE_SIZE),
+        'validation_split': validation_split,
+        'counts': counts
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"✅ Shards creados en {time.perf_counter() - started:.1f} s: "
+          f"{counts['train']} de entrenamiento, {counts['validation']} de validación")
+    return manifest
+
+
+def load_manifest(shard_dir):
+    with open(os.path.join(shard_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _parse_example(serialized, num_classes):
+    features = tf.io.parse_single_example(serialized, {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.int64)
+    })
+    image = tf.reshape(tf.io.decode_raw(features['image'], tf.uint8), (*IMAGE_SIZE, 3))
+    # class_mode='categorical' del notebook
+    label = tf.one_hot(features['label'], num_classes)
+    return image, label
+
+
+def _random_uniform(batch_size, low, high):
+    return tf.random.uniform([batch_size], low, high)
+
+
+def augment_batch(images, augmentation=AUGMENTATION):
+    """Aumentos del ImageDataGenerator aplicados a un lote completo
+
+    Rotación, corte, zoom y desplazamiento se combinan en una sola
+    transformación afín por imagen y se aplican al lote con una operación
+    (relleno 'nearest'). `images` es float32 en escala 0-255.
+    """
+    shape = tf.shape(images)
+    batch_size, height, width = shape[0], shape[1], shape[2]
+    h = tf.cast(height, tf.float32)
+    w = tf.cast(width, tf.float32)
+
+    theta = _random_uniform(batch_size, -1.0, 1.0) * np.deg2rad(augmentation['rotation_range'])
+    shear = _random_uniform(batch_size, -1.0, 1.0) * np.deg2rad(augmentation['shear_range'])
+    zoom_x = _random_uniform(batch_size, 1.0 - augmentation['zoom_range'], 1.0 + augmentation['zoom_range'])
+    zoom_y = _random_uniform(batch_size, 1.0 - augmentation['zoom_range'], 1.0 + augmentation['zoom_range'])
+    shift_x = _random_uniform(batch_size, -1.0, 1.0) * augmentation['width_shift_range'] * w
+    shift_y = _random_uniform(batch_size, -1.0, 1.0) * augmentation['height_shift_range'] * h
+
+    # Matriz (salida -> entrada) = rotación · corte · zoom, alrededor del centro
+    cos_t, sin_t = tf.cos(theta), tf.sin(theta)
+    a0 = cos_t * zoom_x
+    a1 = (-cos_t * tf.sin(shear) - sin_t * tf.cos(shear)) * zoom_y
+    b0 = sin_t * zoom_x
+    b1 = (-sin_t * tf.sin(shear) + cos_t * tf.cos(shear)) * zoom_y
+    center_x, center_y = (w - 1.0) / 2.0, (h - 1.0) / 2.0
+    a2 = center_x - a0 * center_x - a1 * center_y + shift_x
+    b2 = center_y - b0 * center_x - b1 * center_y + shift_y
+    zeros = tf.zeros_like(a0)
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms, output_shape=tf.stack([height, width]),
+        fill_value=0.0, interpolation='BILINEAR', fill_mode='NEAREST'
+    )
+
+    if augmentation['channel_shift_range']:
+        images += tf.reshape(_random_uniform(batch_size, -1.0, 1.0)
+                             * augmentation['channel_shift_range'], (-1, 1, 1, 1))
+    if augmentation['horizontal_flip']:
+        flip = tf.reshape(_random_uniform(batch_size, 0.0, 1.0) < 0.5, (-1, 1, 1, 1))
+        images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+    if augmentation['vertical_flip']:
+        flip = tf.reshape(_random_uniform(batch_size, 0.0, 1.0) < 0.5, (-1, 1, 1, 1))
+        images = tf.where(flip, tf.reverse(images, axis=[1]), images)
+    if augmentation['brightness_range']:
+        low, high = augmentation['brightness_range']
+        images *= tf.reshape(_random_uniform(batch_size, low, high), (-1, 1, 1, 1))
+    return tf.clip_by_value(images, 0.0, 255.0)
+
+
+def make_dataset(shard_dir, subset='train', batch_size=32, training=None, cache=True,
+                 shuffle_buffer=2048, augment=None, timer=None):
+    """tf.data.Dataset de (imágenes normalizadas, etiquetas one-hot)
+
+    `cache` puede ser True (memoria), False o una ruta de archivo de caché.
+    La caché guarda las imágenes ya parseadas (uint8), antes de mezclar y
+    aumentar, así que cada época ve aumentos distintos.
+    """
+    manifest = load_manifest(shard_dir)
+    num_classes = len(manifest['classes'])
+    training = subset == 'train' if training is None else training
+    augment = training if augment is None else augment
+    autotune = tf.data.AUTOTUNE
+
+    pattern = os.path.join(shard_dir, f'{subset}-*.tfrecord')
+    files = tf.data.Dataset.list_files(pattern, shuffle=training, seed=SEED)
+    dataset = files.interleave(
+        tf.data.TFRecordDataset, cycle_length=autotune,
+        num_parallel_calls=autotune, deterministic=not training
+    )
+    dataset = dataset.map(lambda serialized: _parse_example(serialized, num_classes),
+                          num_parallel_calls=autotune, deterministic=not training)
+    if cache:
+        dataset = dataset.cache(cache if isinstance(cache, str) else '')
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=SEED, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size, num_parallel_calls=autotune, deterministic=not training)
+
+    def to_float(images, labels):
+        images = tf.cast(images, tf.float32)
+        if augment:
+            images = augment_batch(images)
+        # rescale=1./255 del notebook
+        return images * (1.0 / 255.0), labels
+
+    dataset = dataset.map(to_float, num_parallel_calls=autotune, deterministic=not training)
+    dataset = dataset.prefetch(autotune)
+    if timer is not None:
+        dataset = timer.instrument(dataset)
+    return dataset
+
+
+def cargar_plantvillage_shards(shard_dir, batch_size=32, cache=True, timer=None):
+    """Equivalente a cargar_plantvillage del notebook, leyendo los shards"""
+    return (make_dataset(shard_dir, 'train', batch_size, cache=cache, timer=timer),
+            make_dataset(shard_dir, 'validation', batch_size, cache=cache))
+
+
+class InputPipelineTimer(tf.keras.callbacks.Callback):
+    """Tiempo por época y tiempo de espera de datos durante el entrenamiento
+
+    `instrument` marca en el dataset el instante en que cada lote queda
+    disponible para el modelo; la espera de un paso es lo que transcurre
+    desde que empieza hasta esa marca. Si la espera es una fracción grande
+    del tiempo de entrenamiento, el cuello de botella es la entrada y no el
+    modelo. La validación (desde el último paso hasta el fin de la época) se
+    informa aparte para no diluir esa fracción.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.history = []
+        self._ready_at = 0.0
+        self._batch_started = 0.0
+
+    def _mark(self, images, labels):
+        def stamp():
+            self._ready_at = time.perf_counter()
+            return np.int64(0)
+        token = tf.py_function(stamp, [], tf.int64)
+        with tf.control_dependencies([token]):
+            return tf.identity(images), labels
+
+    def instrument(self, dataset):
+        # Después del prefetch: la marca ocurre cuando el modelo recibe el lote
+        return dataset.map(self._mark)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_started = time.perf_counter()
+        self._train_ended = self._epoch_started
+        self._stall = 0.0
+        self._steps = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._batch_started = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self._ready_at > self._batch_started:
+            self._stall += self._ready_at - self._batch_started
+        self._steps += 1
+        self._train_ended = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        ended = time.perf_counter()
+        elapsed = ended - self._epoch_started
+        train_seconds = self._train_ended - self._epoch_started
+        record = {
+            'epoch': len(self.history) + 1,
+            'epoch_seconds': elapsed,
+            'train_seconds': train_seconds,
+            'validation_seconds': ended - self._train_ended,
+            'input_stall_seconds': self._stall,
+            'input_stall_fraction': self._stall / train_seconds if train_seconds else 0.0,
+            'steps': self._steps
+        }
+        self.history.append(record)
+        print(f"\n⏱️ Época {record['epoch']}: {elapsed:.1f} s ({train_seconds:.1f} s entrenando, "
+              f"{record['validation_seconds']:.1f} s validando), esperando datos "
+              f"{self._stall:.1f} s ({record['input_stall_fraction']:.1%} del entrenamiento)")
+
+
+def benchmark_pipeline(dataset, epochs=2):
+    """Recorrer el dataset sin modelo: techo de throughput de la entrada"""
+    report = []
+    for epoch in range(1, epochs + 1):
+        started = time.perf_counter()
+        images = 0
+        for batch, _ in dataset:
+            images += int(batch.shape[0])
+        elapsed = time.perf_counter() - started
+        report.append({'epoch': epoch, 'seconds': elapsed, 'images': images,
+                       'images_per_second': images / elapsed if elapsed else 0.0})
+        print(f"📈 Época {epoch}: {images} imágenes en {elapsed:.1f} s "
+              f"({images / elapsed if elapsed else 0:.0f} img/s)")
+    return report
+
+
+def build_model(num_classes, input_shape=(*IMAGE_SIZE, 3)):
+    """Misma arquitectura que SistemaCultivosColab.crear_modelo_tomate"""
+    from tensorflow.keras import layers, models
+    base_model = tf.keras.applications.MobileNetV2(
+        input_shape=input_shape, include_top=False, weights='imagenet'
+    )
+    base_model.trainable = False
+    return models.Sequential([
+        base_model,
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.3),
+        layers.Dense(512, activation='relu'),
+        layers.BatchNormalization(),
+        layers.Dropout(0.5),
+        layers.Dense(256, activation='relu'),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax')
+    ])
+
+
+def train(shard_dir, epochs_init=15, epochs_fine_tune=10, batch_size=32, cache=True,
+          output='mejor_modelo_cultivos.h5', unfreeze_layers=50):
+    """Entrenamiento en dos fases del notebook, alimentado por los shards"""
+    timer = InputPipelineTimer()
+    train_data, val_data = cargar_plantvillage_shards(shard_dir, batch_size, cache, timer)
+    model = build_model(len(load_manifest(shard_dir)['classes']))
+
+    callbacks = [
+        tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=5,
+                                         restore_best_weights=True, mode='max'),
+        tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3),
+        tf.keras.callbacks.ModelCheckpoint(output, monitor='val_accuracy',
+                                           save_best_only=True, mode='max'),
+        timer
+    ]
+
+    print("🎯 FASE 1: Entrenando capas superiores...")
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+                  loss='categorical_crossentropy', metrics=['accuracy', 'precision', 'recall'])
+    model.fit(train_data, epochs=epochs_init, validation_data=val_data, callbacks=callbacks)
+
+    print("\n🎯 FASE 2: Fine-tuning con capas descongeladas...")
+    base_model = model.layers[0]
+    base_model.trainable = True
+    for layer in base_model.layers[:-unfreeze_layers]:
+        layer.trainable = False
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=0.0001),
+                  loss='categorical_crossentropy', metrics=['accuracy', 'precision', 'recall'])
+    model.fit(train_data, epochs=epochs_fine_tune, validation_data=val_data, callbacks=callbacks)
+
+    total = sum(record['epoch_seconds'] for record in timer.history)
+    training = sum(record['train_seconds'] for record in timer.history)
+    stall = sum(record['input_stall_seconds'] for record in timer.history)
+    print(f"✅ Entrenamiento: {total:.1f} s en {len(timer.history)} épocas, "
+          f"{stall:.1f} s esperando datos ({stall / training if training else 0:.1%} del entrenamiento)")
+    return model, timer.history
+
+
+def _cache_argument(value):
+    if value == 'memory':
+        return True
+    if value == 'none':
+        return False
+    return value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Shards TFRecord y pipeline tf.data para entrenar')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Convertir el dataset a shards (una vez)')
+    build_parser.add_argument('data_dir', help='Carpeta con una subcarpeta por clase (PlantVillage color)')
+    build_parser.add_argument('--output', '-o', required=True, help='Carpeta de los shards')
+    build_parser.add_argument('--images-per-shard', type=int, default=1000)
+    build_parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    for name, help_text in (('bench', 'Medir el throughput de la entrada sin modelo'),
+                            ('train', 'Entrenar el modelo del notebook con los shards')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('shard_dir')
+        sub.add_argument('--batch-size', type=int, default=32)
+        sub.add_argument('--cache', default='memory',
+                         help="'memory', 'none' o ruta de un archivo de caché")
+
+    subparsers.choices['bench'].add_argument('--epochs', type=int, default=2)
+    train_parser = subparsers.choices['train']
+    train_parser.add_argument('--epochs-init', type=int, default=15)
+    train_parser.add_argument('--epochs-fine-tune', type=int, default=10)
+    train_parser.add_argument('--output', default='mejor_modelo_cultivos.h5')
+    train_parser.add_argument('--history-json', help='Guardar los tiempos por época en este archivo')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'build':
+        build_shards(args.data_dir, args.output, args.images_per_shard, args.workers)
+    elif args.command == 'bench':
+        dataset = make_dataset(args.shard_dir, 'train', args.batch_size,
+                               cache=_cache_argument(args.cache))
+        benchmark_pipeline(dataset, args.epochs)
+    else:
+        _, history = train(args.shard_dir, args.epochs_init, args.epochs_fine_tune,
+                           args.batch_size, _cache_argument(args.cache), args.output)
+        if args.history_json:
+            with open(args.history_json, 'w') as f:
+                json.dump(history, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()